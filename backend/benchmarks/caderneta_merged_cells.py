@@ -0,0 +1,70 @@
+"""
+Micro-benchmark de _safe_set_cell: procura linear em merged_cells.ranges
+vs índice coordenada -> âncora construído uma vez por folha.
+
+Uso (a partir de backend/):
+    python -m benchmarks.caderneta_merged_cells [repeticoes] [--template caminho.xlsx]
+
+Por omissão usa o maior template incluído (caderneta_ate_75.xlsx) e escreve
+cabeçalho + 75 alunos x 8 colunas (numero, nome, sexo, ACS1..ACS3, MAP, ACP).
+"""
+import argparse
+import os
+import time
+from types import SimpleNamespace
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'salamandra_sge.settings')
+django.setup()
+
+from openpyxl import load_workbook  # noqa: E402
+
+from salamandra_sge.documentos.engine import caderneta as engine  # noqa: E402
+from salamandra_sge.documentos.models import TemplateMapping  # noqa: E402
+
+
+TEMPLATE_PADRAO = os.path.join(engine.DEFAULT_TEMPLATE_DIR, "caderneta_ate_75.xlsx")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("repeticoes", nargs="?", type=int, default=20)
+    parser.add_argument("--template", default=TEMPLATE_PADRAO)
+    args = parser.parse_args()
+
+    ws = load_workbook(args.template).worksheets[0]
+    mapping = SimpleNamespace(
+        header_cells=TemplateMapping.default_header_mapping(),
+        student_columns={"numero": "A", "nome": "B", "sexo": "C"},
+        grade_columns={"ACS1": "D", "ACS2": "E", "ACS3": "F", "MAP": "G", "ACP": "H"},
+    )
+    alunos = [
+        SimpleNamespace(id=i, numero_turma=i + 1, nome_completo=f"Aluno {i:03d}", sexo="HOMEM", status="ATIVO")
+        for i in range(75)
+    ]
+    notas = {i: {"ACS1": 10, "ACS2": 11, "ACS3": 12, "MAP": 13, "ACP": 14} for i in range(75)}
+    header = {key: key for key in mapping.header_cells}
+
+    def escrever(merged_index):
+        engine._write_header(ws, mapping, header, merged_index)
+        engine._write_students(ws, mapping, alunos, notas, 15, 75, merged_index)
+
+    print(f"template: {os.path.basename(args.template)} | merged ranges: {len(ws.merged_cells.ranges)}")
+    print(f"{'modo':<10} | {'ms/documento':>12}")
+
+    inicio = time.perf_counter()
+    for _ in range(args.repeticoes):
+        escrever(None)
+    linear = (time.perf_counter() - inicio) / args.repeticoes
+    print(f"{'linear':<10} | {linear * 1000:>12.2f}")
+
+    inicio = time.perf_counter()
+    for _ in range(args.repeticoes):
+        escrever(engine._merged_index(ws))
+    indexado = (time.perf_counter() - inicio) / args.repeticoes
+    print(f"{'indice':<10} | {indexado * 1000:>12.2f}  (inclui construir o índice)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark da geração de cadernetas: leitura do template a cada documento
+(load_workbook) vs cópia a partir da cache de templates interpretados.
+
+Uso (a partir de backend/):
+    python -m benchmarks.caderneta_template_cache [documentos] [--template caminho.xlsx]
+
+Cada documento = obter workbook + escrever cabeçalho e alunos + gravar em memória.
+"""
+import argparse
+import os
+import time
+from io import BytesIO
+from types import SimpleNamespace
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'salamandra_sge.settings')
+django.setup()
+
+from openpyxl import load_workbook  # noqa: E402
+
+from salamandra_sge.documentos.engine import caderneta as engine  # noqa: E402
+from salamandra_sge.documentos.engine.template_cache import TemplateCache  # noqa: E402
+from salamandra_sge.documentos.models import TemplateMapping  # noqa: E402
+
+
+TEMPLATE_PADRAO = os.path.join(engine.DEFAULT_TEMPLATE_DIR, "caderneta_ate_75.xlsx")
+
+
+def _mapping():
+    return SimpleNamespace(
+        header_cells=TemplateMapping.default_header_mapping(),
+        sheet_name="",
+        start_row_alunos=15,
+        max_students=75,
+        grade_columns={},
+        student_columns={"numero": "A", "nome": "B", "sexo": "C"},
+        continuation_cell="",
+    )
+
+
+def _alunos(total):
+    return [
+        SimpleNamespace(id=i, numero_turma=i + 1, nome_completo=f"Aluno {i:03d}", sexo="HOMEM", status="ATIVO")
+        for i in range(total)
+    ]
+
+
+def gerar_documento(obter_workbook, mapping, alunos):
+    inicio = time.perf_counter()
+    workbook = obter_workbook()
+    carregado = time.perf_counter()
+    ws = engine._safe_sheet(workbook, mapping.sheet_name)
+    engine._write_header(ws, mapping, {key: key for key in mapping.header_cells})
+    engine._write_students(ws, mapping, alunos, {}, mapping.start_row_alunos, mapping.max_students)
+    workbook.save(BytesIO())
+    fim = time.perf_counter()
+    return carregado - inicio, fim - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("documentos", nargs="?", type=int, default=3)
+    parser.add_argument("--template", default=TEMPLATE_PADRAO)
+    args = parser.parse_args()
+
+    mapping = _mapping()
+    alunos = _alunos(mapping.max_students)
+    cache = TemplateCache(max_size=4)
+    modos = (
+        ("load_workbook", lambda: load_workbook(args.template)),
+        ("cache", lambda: cache.load(args.template)),
+    )
+
+    print(f"template: {os.path.basename(args.template)} | documentos: {args.documentos}")
+    print(f"{'modo':<14} | {'template (s/doc)':>16} | {'total (s/doc)':>13}")
+    for nome, obter in modos:
+        tempos = [gerar_documento(obter, mapping, alunos) for _ in range(args.documentos)]
+        carga = sum(t[0] for t in tempos) / len(tempos)
+        total = sum(t[1] for t in tempos) / len(tempos)
+        print(f"{nome:<14} | {carga:>16.2f} | {total:>13.2f}", flush=True)
+    print(f"cache: {cache.misses} miss, {cache.hits} hits")
+
+
+if __name__ == '__main__':
+    main()
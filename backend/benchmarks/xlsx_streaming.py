@@ -0,0 +1,165 @@
+"""
+Benchmark da exportação XLSX: Workbook em memória vs escrita write-only em streaming.
+
+Uso (a partir de backend/):
+    python -m benchmarks.xlsx_streaming [linhas ...]
+    python -m benchmarks.xlsx_streaming --relatorio [alunos ...]
+
+Mede o pico de memória Python (tracemalloc) e o tempo para gerar uma pauta
+com N alunos. No modo streaming o pico deve manter-se estável com N.
+
+Sem opções mede só o escritor, com linhas sintéticas. Com --relatorio cria
+uma base de dados de teste com uma turma de N alunos e mede o caminho completo
+da exportação (queries + linhas + escrita) de pauta_turma e lista_alunos_turma:
+relatório montado em dicionário vs builders em streaming (REPORT_BUILDERS).
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'salamandra_sge.settings')
+django.setup()
+
+from decimal import Decimal  # noqa: E402
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from openpyxl import Workbook  # noqa: E402
+
+from salamandra_sge.relatorios import xlsx as report_xlsx  # noqa: E402
+
+
+def _linhas(total):
+    """Linhas sintéticas com a largura da pauta por disciplina (27 colunas)."""
+    for i in range(total):
+        yield [i + 1, f"Aluno {i:06d}", *[(i + j) % 20 for j in range(24)], "S"]
+
+
+def _header():
+    return ["Numero", "Aluno", *report_xlsx._trimestre_header(report_xlsx.TRIMESTRE_HEADER), "MFD"]
+
+
+def exportar_em_memoria(total, destino):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(_header())
+    for row in _linhas(total):
+        ws.append(row)
+    wb.save(destino)
+
+
+def exportar_streaming(total, destino):
+    report_xlsx.write_xlsx([("Pauta", _header(), _linhas(total))], destino)
+
+
+def medir(funcao, total):
+    with tempfile.TemporaryFile() as destino:
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        funcao(total, destino)
+        duracao = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        tamanho = destino.tell()
+    return duracao, pico, tamanho
+
+
+def _criar_turma(total):
+    """Turma com `total` alunos e as 12 notas por aluno de uma disciplina."""
+    from core.models import CustomUser, District, School
+    from salamandra_sge.academico.models import (
+        Aluno, Classe, Disciplina, Professor, ProfessorTurmaDisciplina, Turma,
+    )
+    from salamandra_sge.avaliacoes.models import Nota
+
+    district = District.objects.create(name="Distrito Benchmark")
+    school = School.objects.create(name="Escola Benchmark", district=district)
+    admin = CustomUser.objects.create_user(
+        email="admin@benchmark.com", password="benchmark", role="ADMIN_ESCOLA", school=school
+    )
+    prof_user = CustomUser.objects.create_user(
+        email="prof@benchmark.com", password="benchmark", role="PROFESSOR", school=school
+    )
+    professor = Professor.objects.create(user=prof_user, school=school)
+    classe = Classe.objects.create(school=school, nome="10ª Classe")
+    turma = Turma.objects.create(school=school, nome="A", classe=classe, ano_letivo=2026)
+    disciplina = Disciplina.objects.create(school=school, nome="Matemática")
+    ProfessorTurmaDisciplina.objects.create(
+        school=school, professor=professor, turma=turma, disciplina=disciplina
+    )
+
+    alunos = Aluno.objects.bulk_create(
+        Aluno(
+            nome_completo=f"Aluno {i:06d}",
+            data_nascimento="2010-01-01",
+            school=school,
+            classe_atual=classe,
+            turma_atual=turma,
+            numero_turma=i + 1,
+            sexo="HOMEM" if i % 2 else "MULHER",
+        )
+        for i in range(total)
+    )
+    Nota.objects.bulk_create(
+        (
+            Nota(
+                school=school, aluno=aluno, turma=turma, disciplina=disciplina,
+                tipo=tipo, trimestre=trimestre, valor=Decimal((aluno.id + trimestre) % 20),
+            )
+            for aluno in alunos
+            for trimestre in (1, 2, 3)
+            for tipo in ("ACS1", "ACS2", "MAP", "ACP")
+        ),
+        batch_size=2_000,
+    )
+    return admin, {"turma_id": turma.id, "disciplina_id": disciplina.id}
+
+
+def medir_relatorios(totais):
+    from salamandra_sge.relatorios.cache import REPORTS
+    from salamandra_sge.relatorios.tasks import REPORT_BUILDERS, REPORT_SHEETS
+
+    def em_dicionario(tipo):
+        def exportar(user, params, destino):
+            report_xlsx.write_xlsx(REPORT_SHEETS[tipo](REPORTS[tipo](user, params)), destino)
+        return exportar
+
+    def streaming(tipo):
+        def exportar(user, params, destino):
+            sheets, _ = REPORT_BUILDERS[tipo](user, params)
+            report_xlsx.write_xlsx(sheets, destino)
+        return exportar
+
+    nome_bd = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+    try:
+        print(f"{'alunos':>8} | {'relatorio':<18} | {'modo':<10} | {'tempo (s)':>9} | {'pico (MiB)':>10}")
+        for total in totais:
+            call_command("flush", interactive=False, verbosity=0)
+            user, params = _criar_turma(total)
+            for tipo in ("pauta_turma", "lista_alunos_turma"):
+                for nome, funcao in (("dicionario", em_dicionario(tipo)), ("streaming", streaming(tipo))):
+                    duracao, pico, _ = medir(lambda _total, destino: funcao(user, params, destino), total)
+                    print(f"{total:>8} | {tipo:<18} | {nome:<10} | {duracao:>9.2f} | {pico / 2**20:>10.1f}", flush=True)
+    finally:
+        connection.creation.destroy_test_db(nome_bd, verbosity=0)
+
+
+def main(argv):
+    if argv and argv[0] == "--relatorio":
+        medir_relatorios([int(arg) for arg in argv[1:]] or [1_000, 5_000])
+        return
+
+    totais = [int(arg) for arg in argv] or [1_000, 5_000, 20_000]
+    print(f"{'linhas':>8} | {'modo':<10} | {'tempo (s)':>9} | {'pico (MiB)':>10} | {'ficheiro (KiB)':>14}")
+    for total in totais:
+        for nome, funcao in (("memoria", exportar_em_memoria), ("streaming", exportar_streaming)):
+            duracao, pico, tamanho = medir(funcao, total)
+            print(f"{total:>8} | {nome:<10} | {duracao:>9.2f} | {pico / 2**20:>10.1f} | {tamanho / 1024:>14.0f}", flush=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,78 +1,18 @@
 from django.db.models import Avg
 from .models import Aluno, Turma, Disciplina, ProfessorTurmaDisciplina
-from salamandra_sge.avaliacoes.models import Nota, ResumoTrimestral
-from salamandra_sge.avaliacoes.services import AvaliacaoService
-from salamandra_sge.relatorios.services import ReportService
+from salamandra_sge.avaliacoes.models import Nota
+from salamandra_sge.avaliacoes.services.estatisticas import obter_turma_estatisticas
 
 class AcademicRoleService:
     @staticmethod
-    def _get_turma_aprovacao_stats(turma, trimestre=None):
-        alunos = list(Aluno.objects.filter(turma_atual=turma, ativo=True))
-        total_alunos = len(alunos)
-        total_homens = sum(1 for a in alunos if a.sexo == 'HOMEM')
-        total_mulheres = sum(1 for a in alunos if a.sexo == 'MULHER')
-
-        disciplina_ids = list(
-            ProfessorTurmaDisciplina.objects.filter(turma=turma)
-            .values_list('disciplina_id', flat=True)
-            .distinct()
-        )
-
-        resumo_filter = ResumoTrimestral.objects.filter(
-            turma=turma,
-            ano_letivo=turma.ano_letivo,
-            disciplina_id__in=disciplina_ids,
-            aluno__in=alunos
-        )
-        if trimestre:
-            resumo_filter = resumo_filter.filter(trimestre=int(trimestre))
-        resumos = resumo_filter
-        resumo_map = {(r.aluno_id, r.disciplina_id, r.trimestre): r for r in resumos}
-
-        aprovados = 0
-        pendentes = 0
-        aprovados_homens = 0
-        aprovados_mulheres = 0
-        pendentes_homens = 0
-        pendentes_mulheres = 0
-
-        for aluno in alunos:
-            medias = []
-            for disc_id in disciplina_ids:
-                if trimestre:
-                    mt = resumo_map.get((aluno.id, disc_id, int(trimestre)))
-                    medias.append(int(mt.mt) if mt and mt.mt is not None else None)
-                    continue
-                mt1 = resumo_map.get((aluno.id, disc_id, 1))
-                mt2 = resumo_map.get((aluno.id, disc_id, 2))
-                mt3 = resumo_map.get((aluno.id, disc_id, 3))
-                if not (mt1 and mt2 and mt3):
-                    medias.append(None)
-                    continue
-                mfd = AvaliacaoService.calculate_mfd(mt1.mt, mt2.mt, mt3.mt)
-                medias.append(float(mfd) if mfd is not None else None)
-
-            situacao = ReportService._situacao_aprovacao(aluno, medias)
-            if situacao == "Aprovado":
-                aprovados += 1
-                if aluno.sexo == 'HOMEM':
-                    aprovados_homens += 1
-                elif aluno.sexo == 'MULHER':
-                    aprovados_mulheres += 1
-            elif situacao == "Pendente":
-                pendentes += 1
-                if aluno.sexo == 'HOMEM':
-                    pendentes_homens += 1
-                elif aluno.sexo == 'MULHER':
-                    pendentes_mulheres += 1
-
-        reprovados = total_alunos - aprovados - pendentes
-        reprovados_homens = total_homens - aprovados_homens - pendentes_homens
-        reprovados_mulheres = total_mulheres - aprovados_mulheres - pendentes_mulheres
+    def _stats_payload(estatistica):
+        total_alunos = estatistica.total_alunos
+        total_homens = estatistica.homens
+        total_mulheres = estatistica.mulheres
         percentagem_aprovacao = {
-            "total": (aprovados / total_alunos * 100) if total_alunos > 0 else 0,
-            "homens": (aprovados_homens / total_homens * 100) if total_homens > 0 else 0,
-            "mulheres": (aprovados_mulheres / total_mulheres * 100) if total_mulheres > 0 else 0,
+            "total": (estatistica.aprovados / total_alunos * 100) if total_alunos > 0 else 0,
+            "homens": (estatistica.aprovados_homens / total_homens * 100) if total_homens > 0 else 0,
+            "mulheres": (estatistica.aprovados_mulheres / total_mulheres * 100) if total_mulheres > 0 else 0,
         }
 
         return {
@@ -80,23 +20,38 @@ class AcademicRoleService:
             "homens": total_homens,
             "mulheres": total_mulheres,
             "aprovados": {
-                "total": aprovados,
-                "homens": aprovados_homens,
-                "mulheres": aprovados_mulheres,
+                "total": estatistica.aprovados,
+                "homens": estatistica.aprovados_homens,
+                "mulheres": estatistica.aprovados_mulheres,
             },
             "pendentes": {
-                "total": pendentes,
-                "homens": pendentes_homens,
-                "mulheres": pendentes_mulheres,
+                "total": estatistica.pendentes,
+                "homens": estatistica.pendentes_homens,
+                "mulheres": estatistica.pendentes_mulheres,
             },
             "reprovados": {
-                "total": reprovados,
-                "homens": reprovados_homens,
-                "mulheres": reprovados_mulheres,
+                "total": estatistica.reprovados,
+                "homens": estatistica.reprovados_homens,
+                "mulheres": estatistica.reprovados_mulheres,
             },
             "percentagem_aprovacao": percentagem_aprovacao,
         }
 
+    @staticmethod
+    def get_turmas_stats(turmas, trimestre=None):
+        """
+        Estatísticas de várias turmas lidas dos snapshots TurmaEstatistica ({turma_id: stats}).
+        """
+        estatisticas = obter_turma_estatisticas(turmas, trimestre=trimestre)
+        return {
+            turma_id: AcademicRoleService._stats_payload(estatistica)
+            for turma_id, estatistica in estatisticas.items()
+        }
+
+    @staticmethod
+    def _get_turma_aprovacao_stats(turma, trimestre=None):
+        return AcademicRoleService.get_turmas_stats([turma], trimestre=trimestre)[turma.id]
+
     @staticmethod
     def get_turma_stats(turma, trimestre=None):
         """
@@ -109,7 +64,8 @@ class AcademicRoleService:
         """
         Estatísticas por classe: aproveitamento por turma e global.
         """
-        turmas = Turma.objects.filter(classe=classe, school=school)
+        turmas = list(Turma.objects.filter(classe=classe, school=school))
+        stats_por_turma = AcademicRoleService.get_turmas_stats(turmas, trimestre=trimestre)
         stats_turmas = []
         total_alunos_classe = 0
         total_aprovados_classe = 0
@@ -119,7 +75,7 @@ class AcademicRoleService:
         percentagens_turmas = []
 
         for turma in turmas:
-            t_stats = AcademicRoleService.get_turma_stats(turma, trimestre=trimestre)
+            t_stats = stats_por_turma[turma.id]
             stats_turmas.append({
                 "turma": turma.nome,
                 "stats": t_stats
@@ -156,7 +112,7 @@ class AcademicRoleService:
 
         return {
             "classe": classe.nome,
-            "total_turmas": turmas.count(),
+            "total_turmas": len(turmas),
             "total_alunos": total_alunos_classe,
             "pendentes": total_pendentes_classe,
             "aprovados_total": total_aprovados_classe,
@@ -294,10 +250,11 @@ class AcademicRoleService:
         """
         Lista turmas da classe para o CC.
         """
-        turmas = Turma.objects.filter(classe=classe, school=school)
+        turmas = list(Turma.objects.filter(classe=classe, school=school))
+        stats_por_turma = AcademicRoleService.get_turmas_stats(turmas, trimestre=trimestre)
         data = []
         for t in turmas:
-            stats = AcademicRoleService.get_turma_stats(t, trimestre=trimestre)
+            stats = stats_por_turma[t.id]
             data.append({
                 "id": t.id,
                 "nome": t.nome,
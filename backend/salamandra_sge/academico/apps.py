@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class AcademicoConfig(AppConfig):
     name = 'salamandra_sge.academico'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academico', '0013_alter_disciplina_options'),
+        ('core', '0006_school_current_period'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='aluno',
+            index=models.Index(fields=['turma_atual', 'ativo'], name='aluno_turma_ativo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aluno',
+            index=models.Index(fields=['school', 'classe_atual', 'turma_atual', 'ativo'], name='aluno_school_classe_turma_idx'),
+        ),
+        migrations.AlterField(
+            model_name='aluno',
+            name='school',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='alunos', to='core.school'),
+        ),
+        migrations.AlterField(
+            model_name='aluno',
+            name='turma_atual',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='alunos_na_turma', to='academico.turma'),
+        ),
+    ]
@@ -56,7 +56,7 @@ class Aluno(models.Model):
         ('TRANSFERIDO', 'Transferido'),
     ]
 
-    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='alunos')
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='alunos', db_index=False)
     nome_completo = models.CharField(max_length=255)
     sexo = models.CharField(max_length=10, choices=SEXO_CHOICES, null=True, blank=True)
     data_nascimento = models.DateField()
@@ -76,7 +76,7 @@ class Aluno(models.Model):
     )
     
     classe_atual = models.ForeignKey('Classe', on_delete=models.PROTECT, related_name='alunos_matriculados', null=True)
-    turma_atual = models.ForeignKey('Turma', on_delete=models.SET_NULL, related_name='alunos_na_turma', null=True, blank=True)
+    turma_atual = models.ForeignKey('Turma', on_delete=models.SET_NULL, related_name='alunos_na_turma', null=True, blank=True, db_index=False)
     numero_turma = models.PositiveIntegerField(null=True, blank=True)
     cargo_turma = models.CharField(max_length=100, default='Nenhum', help_text="Ex: Chefe de Turma, Adjunto, Higiene, etc.")
     status = models.CharField(max_length=20, choices=ALUNO_STATUS_CHOICES, default='ATIVO')
@@ -89,6 +89,10 @@ class Aluno(models.Model):
     class Meta:
         verbose_name = "Aluno"
         verbose_name_plural = "Alunos"
+        indexes = [
+            models.Index(fields=['turma_atual', 'ativo'], name='aluno_turma_ativo_idx'),
+            models.Index(fields=['school', 'classe_atual', 'turma_atual', 'ativo'], name='aluno_school_classe_turma_idx'),
+        ]
 
     def __str__(self):
         return self.nome_completo
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Disciplina, Aluno, Turma, Classe, Professor
+from .services import DelegadosDisciplinaCache, ano_letivo_corrente
 
 class DisciplinaSerializer(serializers.ModelSerializer):
     delegado_nome = serializers.SerializerMethodField()
@@ -9,25 +10,37 @@ class DisciplinaSerializer(serializers.ModelSerializer):
         fields = ['id', 'nome', 'school', 'delegado_nome']
         read_only_fields = ['school']
 
+    def _delegados(self, obj):
+        # Um dicionário por escola, partilhado por todas as linhas da listagem
+        memo = self.context.setdefault('_delegados', {})
+        if obj.school_id not in memo:
+            school = self.context.get('school')
+            if school is None or school.id != obj.school_id:
+                school = obj.school
+            memo[obj.school_id] = DelegadosDisciplinaCache.obter(school)
+        return memo[obj.school_id]
+
     def get_delegado_nome(self, obj):
-        import datetime
-        from .models import DelegadoDisciplina
-        ano_atual = datetime.datetime.now().year
-        try:
-            dd = DelegadoDisciplina.objects.get(disciplina=obj, school=obj.school, ano_letivo=ano_atual)
-            return dd.professor.user.get_full_name()
-        except DelegadoDisciplina.DoesNotExist:
-            return "-"
+        return self._delegados(obj).get(obj.id, "-")
 
 class AlunoSerializer(serializers.ModelSerializer):
     classe_nome = serializers.CharField(source='classe_atual.nome', read_only=True)
     turma_nome = serializers.CharField(source='turma_atual.nome', read_only=True)
 
+    # Campos da listagem quando o cliente não indica `fields=`
+    CAMPOS_LISTA = ['id', 'nome_completo', 'numero_turma', 'turma_atual', 'turma_nome']
+
     class Meta:
         model = Aluno
         fields = '__all__'
         read_only_fields = ['school', 'numero_turma']
 
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for nome in set(self.fields) - set(fields):
+                self.fields.pop(nome)
+
     def validate_classe_atual(self, value):
         request = self.context.get('request')
         if request and value and value.school != request.user.school:
@@ -50,20 +63,26 @@ class ProfessorSerializer(serializers.ModelSerializer):
         return ", ".join([d.nome for d in obj.disciplinas.all()]) or "-"
 
     def get_disciplina_ids(self, obj):
-        return list(obj.disciplinas.values_list('id', flat=True))
+        # Usa o prefetch de disciplinas em vez de uma query values_list por professor
+        return [d.id for d in obj.disciplinas.all()]
+
+    def _tem_cargo(self, obj, prefetch, related_name):
+        # ProfessorViewSet.get_queryset traz os cargos do ano corrente em `prefetch`
+        if hasattr(obj, prefetch):
+            return bool(getattr(obj, prefetch))
+        ano = self.context.get('ano_letivo') or ano_letivo_corrente(obj.school)
+        return getattr(obj, related_name).filter(ano_letivo=ano).exists()
 
     def get_nome_com_cargos(self, obj):
-        cargos = []
-        import datetime
-        ano_atual = datetime.datetime.now().year
-        
-        if obj.direccoes_turma.filter(ano_letivo=ano_atual).exists():
-            cargos.append('DT')
-        if obj.coordenacoes_classe.filter(ano_letivo=ano_atual).exists():
-            cargos.append('CC')
-        if obj.delegacoes_disciplina.filter(ano_letivo=ano_atual).exists():
-            cargos.append('DD')
-            
+        cargos = [
+            sigla
+            for sigla, prefetch, related_name in (
+                ('DT', 'direccoes_ano', 'direccoes_turma'),
+                ('CC', 'coordenacoes_ano', 'coordenacoes_classe'),
+                ('DD', 'delegacoes_ano', 'delegacoes_disciplina'),
+            )
+            if self._tem_cargo(obj, prefetch, related_name)
+        ]
         if cargos:
             return f"{obj.user.get_full_name()} ({'/'.join(cargos)})"
         return obj.user.get_full_name()
@@ -104,10 +123,15 @@ class TurmaSerializer(serializers.ModelSerializer):
         read_only_fields = ['school']
 
     def get_director_nome(self, obj):
-        try:
-            return obj.director_turma.professor.user.get_full_name()
-        except:
+        # director_turma/professor/user vêm do select_related de TurmaViewSet.get_queryset
+        director = getattr(obj, 'director_turma', None)
+        if director is None:
             return None
+        return director.professor.user.get_full_name()
 
     def get_student_count(self, obj):
-        return obj.alunos_na_turma.filter(ativo=True).count()
+        # Anotado em TurmaViewSet.get_queryset; instâncias criadas/atualizadas não têm a anotação
+        total = getattr(obj, 'active_student_count', None)
+        if total is None:
+            total = obj.alunos_na_turma.filter(ativo=True).count()
+        return total
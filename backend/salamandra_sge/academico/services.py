@@ -1,6 +1,13 @@
+from django.core.cache import cache
 from django.db import transaction
+from django.utils import timezone
 from .models import Aluno, Turma, Classe, Disciplina
 
+
+def ano_letivo_corrente(school):
+    """Ano letivo ativo da escola; sem ano definido, o ano civil."""
+    return (school.current_ano_letivo if school else None) or timezone.now().year
+
 class FormacaoTurmaService:
     """
     Serviço para automatizar a distribuição de alunos em turmas.
@@ -156,6 +163,9 @@ class FormacaoTurmaService:
 
         Aluno.objects.bulk_update(alunos_list, ['turma_atual', 'numero_turma'])
 
+        from salamandra_sge.avaliacoes.services.estatisticas import marcar_turma_estatistica_desatualizada
+        marcar_turma_estatistica_desatualizada(list(turma_alunos.keys()))
+
         return {
             "status": "success",
             "message": f"Sucesso! {atribuicoes} alunos distribuídos por {num_turmas} turmas.",
@@ -278,15 +288,88 @@ class FormacaoTurmaService:
             "classes": nomes_classes
         }
 
+class DelegadosDisciplinaCache:
+    """
+    Nomes dos Delegados de Disciplina da escola no ano letivo ativo,
+    {disciplina_id: nome}, lidos numa query e guardados em cache por escola.
+    Invalidado após o commit pelos sinais de academico.signals: atribuição ou
+    remoção do cargo, apagamento em cascata e mudança de nome do professor.
+    """
+
+    CACHE_TTL = 60 * 60
+
+    @staticmethod
+    def cache_key(school_id):
+        return f"disciplinas:delegados:{school_id}"
+
+    @classmethod
+    def invalidar(cls, school_id):
+        cache.delete(cls.cache_key(school_id))
+
+    @classmethod
+    def obter(cls, school):
+        from .models import DelegadoDisciplina
+
+        ano_letivo = ano_letivo_corrente(school)
+        key = cls.cache_key(school.id)
+        data = cache.get(key)
+        # A entrada guarda o ano; uma mudança do ano ativo dispensa invalidação
+        if data is None or data["ano_letivo"] != ano_letivo:
+            delegados = DelegadoDisciplina.objects.filter(school=school, ano_letivo=ano_letivo).values_list(
+                'disciplina_id', 'professor__user__first_name', 'professor__user__last_name'
+            )
+            data = {
+                "ano_letivo": ano_letivo,
+                "delegados": {
+                    # Mesmo formato de CustomUser.get_full_name
+                    disciplina_id: f"{first_name} {last_name}"
+                    for disciplina_id, first_name, last_name in delegados
+                },
+            }
+            cache.set(key, data, timeout=cls.CACHE_TTL)
+        return data["delegados"]
+
+
 class DAEService:
     """
     Serviço para o Director Adjunto de Escola (DAE).
     Gere atribuições de cargos e visualização de estatísticas.
     """
 
+    @staticmethod
+    def _titulares_cargo(school, cargo_tipo, entidade_id):
+        """IDs dos utilizadores que ocupam o cargo na entidade indicada."""
+        from .models import DirectorTurma, CoordenadorClasse, DelegadoDisciplina
+
+        filtros = {
+            'DT': (DirectorTurma, 'turma_id'),
+            'CC': (CoordenadorClasse, 'classe_id'),
+            'DD': (DelegadoDisciplina, 'disciplina_id'),
+        }
+        if cargo_tipo not in filtros:
+            return set()
+        model, campo = filtros[cargo_tipo]
+        return set(
+            model.objects.filter(school=school, **{campo: entidade_id})
+            .values_list('professor__user_id', flat=True)
+        )
+
     @staticmethod
     @transaction.atomic
     def atribuir_cargo(school, professor_id, cargo_tipo, entidade_id, ano_letivo):
+        from salamandra_sge.accounts.access import UserAccessContext
+
+        afetados = DAEService._titulares_cargo(school, cargo_tipo, entidade_id)
+        resultado = DAEService._aplicar_cargo(school, professor_id, cargo_tipo, entidade_id, ano_letivo)
+        if resultado["status"] == "success":
+            afetados |= DAEService._titulares_cargo(school, cargo_tipo, entidade_id)
+            # Só depois do commit: antes disso um pedido concorrente voltaria a guardar os cargos antigos
+            transaction.on_commit(lambda: UserAccessContext.invalidar(afetados))
+            # A cache de delegados é invalidada pelos sinais de DelegadoDisciplina (academico.signals)
+        return resultado
+
+    @staticmethod
+    def _aplicar_cargo(school, professor_id, cargo_tipo, entidade_id, ano_letivo):
         from .models import Professor, Turma, Classe, Disciplina, DirectorTurma, CoordenadorClasse, DelegadoDisciplina
         
         try:
@@ -404,19 +487,23 @@ class DAEService:
 
     @staticmethod
     def get_estatisticas_aproveitamento(school):
-        from .models import Classe, Turma, Aluno
+        from .models import Classe, Turma
         from .academic_role_service import AcademicRoleService
 
         classes = Classe.objects.filter(school=school)
+        turmas = list(Turma.objects.filter(school=school).select_related('classe'))
+        stats_por_turma = AcademicRoleService.get_turmas_stats(turmas)
+
         stats_classe = []
         percentagens_classes = []
         for cl in classes:
-            turmas = Turma.objects.filter(school=school, classe=cl)
             total_alunos = 0
             aprovados = 0
             percentagens_turmas = []
             for turma in turmas:
-                stats = AcademicRoleService.get_turma_stats(turma)
+                if turma.classe_id != cl.id:
+                    continue
+                stats = stats_por_turma[turma.id]
                 total_alunos += stats['total_alunos']
                 aprovados += stats['aprovados']['total']
                 if stats['total_alunos'] > 0:
@@ -433,10 +520,9 @@ class DAEService:
                 "percentagem": percentagem_classe
             })
 
-        turmas = Turma.objects.filter(school=school)
         stats_turma = []
         for tr in turmas:
-            stats = AcademicRoleService.get_turma_stats(tr)
+            stats = stats_por_turma[tr.id]
             total_alunos = stats['total_alunos']
             aprovados = stats['aprovados']['total']
 
@@ -448,14 +534,7 @@ class DAEService:
                 "percentagem": (aprovados / total_alunos * 100) if total_alunos > 0 else 0
             })
 
-        # Média Geral (Aproveitamento Global) - % de alunos com média >= 10
-        alunos_ativos = Aluno.objects.filter(school=school, ativo=True)
-        total_ativos = alunos_ativos.count()
-        aprovados_geral = 0
-        for turma in turmas:
-            stats = AcademicRoleService.get_turma_stats(turma)
-            aprovados_geral += stats['aprovados']['total']
-
+        # Média Geral (Aproveitamento Global) - média das percentagens por classe
         media_geral = (sum(percentagens_classes) / len(percentagens_classes)) if percentagens_classes else 0
 
         return {
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import DelegadoDisciplina
+from .services import DelegadosDisciplinaCache
+
+
+def _invalidar_delegados(school_ids):
+    # Depois do commit, para uma listagem concorrente não voltar a guardar o estado anterior
+    for school_id in set(school_ids):
+        transaction.on_commit(lambda school_id=school_id: DelegadosDisciplinaCache.invalidar(school_id))
+
+
+@receiver(post_save, sender=DelegadoDisciplina)
+@receiver(post_delete, sender=DelegadoDisciplina)
+def delegado_alterado(sender, instance, **kwargs):
+    """Atribuições, remoções e apagamentos em cascata (professor ou disciplina apagados)."""
+    _invalidar_delegados([instance.school_id])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def utilizador_alterado(sender, instance, created, update_fields=None, **kwargs):
+    """Mudança de nome de um professor que é delegado de alguma disciplina."""
+    if created or (update_fields is not None and not {'first_name', 'last_name'} & set(update_fields)):
+        return
+    _invalidar_delegados(
+        DelegadoDisciplina.objects.filter(professor__user=instance).values_list('school_id', flat=True)
+    )
@@ -3,6 +3,7 @@ from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 from core.models import CustomUser, School, District
+from salamandra_sge.accounts.access import UserAccessContext
 from .models import Professor, Classe, Turma, Disciplina, DirectorTurma, CoordenadorClasse, DelegadoDisciplina
 
 class DAETests(TestCase):
@@ -85,3 +86,33 @@ class DAETests(TestCase):
         url = reverse('dae-estatisticas-alunos')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_contexto_acesso_invalidado_ao_atribuir_cargo(self):
+        url = reverse('dae-atribuir-cargo')
+        self.assertFalse(UserAccessContext.for_user(self.prof_user).is_dt())
+
+        data = {"professor_id": self.professor.id, "cargo_tipo": "DT", "entidade_id": self.turma.id, "ano_letivo": 2026}
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(url, data, format='json')
+        # Até ao commit o contexto em cache ainda é o anterior
+        user = CustomUser.objects.get(id=self.prof_user.id)
+        self.assertFalse(UserAccessContext.for_user(user).is_dt())
+        for callback in callbacks:
+            callback()
+        user = CustomUser.objects.get(id=self.prof_user.id)
+        self.assertTrue(UserAccessContext.for_user(user).is_dt(self.turma.id))
+
+        # Contexto servido da cache: apenas a verificação do perfil docente
+        user = CustomUser.objects.get(id=self.prof_user.id)
+        with self.assertNumQueries(1):
+            self.assertTrue(UserAccessContext.for_user(user).is_dt(self.turma.id))
+            self.assertTrue(UserAccessContext.for_user(user).is_dt())
+
+        outro_user = CustomUser.objects.create_user(
+            email="prof2@escola.com", password="password123", role="PROFESSOR", school=self.school
+        )
+        outro = Professor.objects.create(user=outro_user, school=self.school)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {**data, "professor_id": outro.id}, format='json')
+        user = CustomUser.objects.get(id=self.prof_user.id)
+        self.assertFalse(UserAccessContext.for_user(user).is_dt(self.turma.id))
@@ -0,0 +1,212 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import CustomUser, District, School
+from salamandra_sge.academico.models import (
+    Aluno,
+    Classe,
+    CoordenadorClasse,
+    DelegadoDisciplina,
+    DirectorTurma,
+    Disciplina,
+    Professor,
+    Turma,
+)
+from salamandra_sge.academico.services import DAEService
+
+
+class ListagensQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.district = District.objects.create(name="Distrito Teste")
+        self.school = School.objects.create(name="Escola Teste", district=self.district, current_ano_letivo=2026)
+        self.admin = CustomUser.objects.create_user(
+            email="admin@escola.com", password="password123", role="ADMIN_ESCOLA", school=self.school
+        )
+        self.client.force_authenticate(user=self.admin)
+        self.classe = Classe.objects.create(school=self.school, nome="10ª Classe")
+        self.total_professores = 0
+        self.total_turmas = 0
+
+    def _professor(self):
+        self.total_professores += 1
+        user = CustomUser.objects.create_user(
+            email=f"prof{self.total_professores}@escola.com",
+            password="password123",
+            first_name="Prof",
+            last_name=f"{self.total_professores:02d}",
+            role="PROFESSOR",
+            school=self.school,
+        )
+        return Professor.objects.create(user=user, school=self.school)
+
+    def _turma(self, alunos=2, inativos=1):
+        self.total_turmas += 1
+        turma = Turma.objects.create(
+            school=self.school, nome=f"T{self.total_turmas:02d}", classe=self.classe, ano_letivo=2026
+        )
+        DirectorTurma.objects.create(school=self.school, professor=self._professor(), turma=turma, ano_letivo=2026)
+        for indice in range(alunos + inativos):
+            Aluno.objects.create(
+                nome_completo=f"Aluno {turma.nome}-{indice}",
+                data_nascimento="2010-01-01",
+                school=self.school,
+                classe_atual=self.classe,
+                turma_atual=turma,
+                status="ATIVO" if indice < alunos else "TRANSFERIDO",
+            )
+        return turma
+
+    def _count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response
+
+    def test_turmas_consultas_constantes(self):
+        url = reverse('turma-list')
+        self._turma()
+        poucas, _ = self._count_queries(url)
+
+        for _ in range(5):
+            self._turma(alunos=3)
+        Turma.objects.create(school=self.school, nome="Sem DT", classe=self.classe, ano_letivo=2026)
+        muitas, response = self._count_queries(url)
+
+        self.assertEqual(poucas, muitas)
+        self.assertEqual(len(response.data), 7)
+        por_nome = {turma["nome"]: turma for turma in response.data}
+        self.assertEqual(por_nome["T01"]["student_count"], 2)
+        self.assertEqual(por_nome["T02"]["student_count"], 3)
+        self.assertEqual(por_nome["T01"]["director_nome"], "Prof 01")
+        self.assertIsNone(por_nome["Sem DT"]["director_nome"])
+        self.assertEqual(por_nome["Sem DT"]["student_count"], 0)
+
+    def test_professores_consultas_constantes(self):
+        url = reverse('professor-list')
+        matematica = Disciplina.objects.create(school=self.school, nome="Matemática", ordem=1)
+        fisica = Disciplina.objects.create(school=self.school, nome="Física", ordem=2)
+
+        professor = self._professor()
+        professor.disciplinas.add(fisica, matematica)
+        poucas, _ = self._count_queries(url)
+
+        self._turma()
+        CoordenadorClasse.objects.create(school=self.school, professor=professor, classe=self.classe, ano_letivo=2026)
+        DelegadoDisciplina.objects.create(school=self.school, professor=professor, disciplina=matematica, ano_letivo=2026)
+        # Cargos de outro ano não contam
+        antigo = self._professor()
+        DelegadoDisciplina.objects.create(school=self.school, professor=antigo, disciplina=fisica, ano_letivo=2025)
+        for _ in range(4):
+            self._professor().disciplinas.add(fisica)
+        muitas, response = self._count_queries(url)
+
+        self.assertEqual(poucas, muitas)
+        por_id = {p["id"]: p for p in response.data}
+        self.assertEqual(por_id[professor.id]["nome_com_cargos"], "Prof 01 (CC/DD)")
+        self.assertEqual(por_id[professor.id]["disciplinas_nomes"], "Matemática, Física")
+        self.assertEqual(por_id[professor.id]["disciplina_ids"], [matematica.id, fisica.id])
+        self.assertEqual(por_id[antigo.id]["nome_com_cargos"], "Prof 03")
+        self.assertEqual(por_id[antigo.id]["disciplinas_nomes"], "-")
+        director = DirectorTurma.objects.get().professor
+        self.assertEqual(por_id[director.id]["nome_com_cargos"], "Prof 02 (DT)")
+
+        # O detalhe devolve o mesmo resultado
+        detalhe = self.client.get(reverse('professor-detail', args=[professor.id]))
+        self.assertEqual(detalhe.data, por_id[professor.id])
+
+    def test_disciplinas_delegados_em_cache(self):
+        url = reverse('disciplina-list')
+        disciplinas = [Disciplina.objects.create(school=self.school, nome=f"Disciplina {i}") for i in range(5)]
+        professor = self._professor()
+        professor.disciplinas.add(disciplinas[0])
+        # Delegação de outro ano não conta para o ano ativo (2026)
+        DelegadoDisciplina.objects.create(
+            school=self.school, professor=self._professor(), disciplina=disciplinas[1], ano_letivo=2025
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            DAEService.atribuir_cargo(self.school, professor.id, 'DD', disciplinas[0].id, 2026)
+
+        primeira, response = self._count_queries(url)
+        nomes = {d["id"]: d["delegado_nome"] for d in response.data}
+        self.assertEqual(nomes[disciplinas[0].id], "Prof 01")
+        self.assertEqual(nomes[disciplinas[1].id], "-")
+
+        # Segunda listagem: delegados servidos da cache, só a query das disciplinas
+        segunda, _ = self._count_queries(url)
+        self.assertEqual(segunda, primeira - 1)
+        dashboard_url = reverse('instituicoes:director-get-disciplinas')
+        queries, response = self._count_queries(dashboard_url)
+        self.assertEqual(queries, segunda)
+        self.assertEqual({d["id"]: d["delegado_nome"] for d in response.data}, nomes)
+
+        # Atribuir o cargo invalida a cache da escola, mas só depois do commit
+        outro = self._professor()
+        outro.disciplinas.add(disciplinas[0])
+        with self.captureOnCommitCallbacks() as callbacks:
+            DAEService.atribuir_cargo(self.school, outro.id, 'DD', disciplinas[0].id, 2026)
+        _, response = self._count_queries(url)
+        self.assertEqual({d["id"]: d["delegado_nome"] for d in response.data}[disciplinas[0].id], "Prof 01")
+        for callback in callbacks:
+            callback()
+        _, response = self._count_queries(url)
+        self.assertEqual({d["id"]: d["delegado_nome"] for d in response.data}[disciplinas[0].id], "Prof 03")
+
+        # Mudança de nome do delegado
+        with self.captureOnCommitCallbacks(execute=True):
+            outro.user.first_name = "Docente"
+            outro.user.save()
+        _, response = self._count_queries(url)
+        self.assertEqual({d["id"]: d["delegado_nome"] for d in response.data}[disciplinas[0].id], "Docente 03")
+
+        # Professor apagado: a delegação desaparece em cascata
+        with self.captureOnCommitCallbacks(execute=True):
+            outro.delete()
+        _, response = self._count_queries(url)
+        self.assertEqual({d["id"]: d["delegado_nome"] for d in response.data}[disciplinas[0].id], "-")
+
+    def test_alunos_paginados_por_cursor(self):
+        url = reverse('aluno-list')
+        turma = self._turma(alunos=3, inativos=0)
+        # Primeiro pedido carrega a escola do utilizador autenticado
+        self._count_queries(url)
+        poucas, _ = self._count_queries(url)
+
+        for _ in range(3):
+            self._turma(alunos=4, inativos=0)
+        muitas, response = self._count_queries(url, {"page_size": 10})
+
+        self.assertEqual(poucas, muitas)
+        self.assertEqual(len(response.data["results"]), 10)
+        self.assertIsNotNone(response.data["next"])
+        primeiro = response.data["results"][0]
+        self.assertEqual(set(primeiro), {"id", "nome_completo", "numero_turma", "turma_atual", "turma_nome"})
+        self.assertEqual(primeiro["turma_nome"], "T01")
+
+        # A segunda página continua a partir do cursor, sem repetir alunos
+        segunda = self.client.get(response.data["next"])
+        self.assertEqual(len(segunda.data["results"]), 5)
+        self.assertIsNone(segunda.data["next"])
+        ids = [a["id"] for a in response.data["results"] + segunda.data["results"]]
+        self.assertEqual(len(set(ids)), 15)
+
+        # `fields=` escolhe os campos; o detalhe mantém o registo completo
+        _, response = self._count_queries(url, {"turma_id": turma.id, "fields": "id,sexo,classe_nome"})
+        self.assertEqual(set(response.data["results"][0]), {"id", "sexo", "classe_nome"})
+        detalhe = self.client.get(reverse('aluno-detail', args=[ids[0]]))
+        self.assertIn("data_nascimento", detalhe.data)
+        self.assertIn("classe_nome", detalhe.data)
+
+        response = self.client.get(url, {"fields": "id,senha"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # A pesquisa filtra no servidor, incluindo alunos fora da primeira página
+        Aluno.objects.filter(id=ids[-1]).update(contacto_encarregado="841234567")
+        response = self.client.get(url, {"search": "t04-3", "page_size": 10})
+        self.assertEqual([a["id"] for a in response.data["results"]], [ids[-1]])
+        response = self.client.get(url, {"search": "1234"})
+        self.assertEqual([a["id"] for a in response.data["results"]], [ids[-1]])
@@ -1,22 +1,24 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.http import HttpResponse
-from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import Count, Prefetch, Q
+from django.http import FileResponse
 from salamandra_sge.accounts.permissions import (
     IsAdminEscola, IsDAP, IsAdministrativo, IsDAE, IsSchoolNotBlocked, 
     IsDT, IsCC, IsDD, IsProfessor
 )
 from .models import Aluno, Turma, Classe, Disciplina, Professor, DirectorTurma, CoordenadorClasse, DelegadoDisciplina
-from .services import FormacaoTurmaService, DAEService
-from salamandra_sge.relatorios.services import ReportService
+from .services import FormacaoTurmaService, DAEService, ano_letivo_corrente
+from salamandra_sge.relatorios.cache import ReportCache
+from salamandra_sge.relatorios.etags import conditional_report
+from salamandra_sge.avaliacoes.services.estatisticas import marcar_turma_estatistica_desatualizada
+from salamandra_sge.relatorios import exports as report_exports
 from salamandra_sge.relatorios import xlsx as report_xlsx
-from salamandra_sge.relatorios.tasks import (
-    gerar_relatorio_xlsx,
-    build_cache_key,
-    REPORT_BUILDERS,
-)
+from salamandra_sge.relatorios.tasks import REPORT_BUILDERS
 from .academic_role_service import AcademicRoleService
 from .serializers import (
     DisciplinaSerializer, 
@@ -30,13 +32,25 @@ from .serializers import (
 )
 
 
+class AlunoCursorPagination(CursorPagination):
+    """Paginação por cursor: páginas estáveis mesmo com inscrições durante a navegação."""
+    ordering = ('nome_completo', 'id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
 class AlunoViewSet(viewsets.ModelViewSet):
     """
     ViewSet para gestão de alunos.
     Professores têm acesso somente de leitura aos alunos das turmas onde lecionam.
+    A listagem é paginada por cursor e devolve apenas os campos resumidos;
+    `?fields=a,b,c` escolhe os campos na listagem e no detalhe e `?search=`
+    procura no nome e no contacto do encarregado.
     """
-    queryset = Aluno.objects.all()
+    queryset = Aluno.objects.select_related('classe_atual', 'turma_atual')
     serializer_class = AlunoSerializer
+    pagination_class = AlunoCursorPagination
     permission_classes = [IsAuthenticated, IsSchoolNotBlocked]
 
     def get_permissions(self):
@@ -48,6 +62,24 @@ class AlunoViewSet(viewsets.ModelViewSet):
             return [IsAuthenticated(), IsSchoolNotBlocked()]
         return [IsAuthenticated(), IsSchoolNotBlocked(), (IsAdminEscola | IsDAP | IsAdministrativo)()]
 
+    def _campos_pedidos(self):
+        """Campos a serializar nas leituras: `fields=` do pedido ou o resumo da listagem."""
+        pedido = self.request.query_params.get('fields')
+        if pedido:
+            campos = [campo.strip() for campo in pedido.split(',') if campo.strip()]
+            invalidos = sorted(set(campos) - set(AlunoSerializer().fields))
+            if invalidos:
+                raise ValidationError({"fields": f"Campos inválidos: {', '.join(invalidos)}."})
+            return campos
+        if self.action == 'list':
+            return AlunoSerializer.CAMPOS_LISTA
+        return None
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in ['list', 'retrieve']:
+            kwargs.setdefault('fields', self._campos_pedidos())
+        return super().get_serializer(*args, **kwargs)
+
     def get_queryset(self):
         user = self.request.user
         qs = self.queryset.filter(school=user.school)
@@ -94,11 +126,26 @@ class AlunoViewSet(viewsets.ModelViewSet):
                 qs = qs.filter(classe_atual_id=classe_id)
             if turma_id:
                 qs = qs.filter(turma_atual_id=turma_id)
-            
+
+        # A pesquisa corre no servidor: a listagem só traz uma página de cada vez
+        search = (self.request.query_params.get('search') or '').strip()
+        if search:
+            qs = qs.filter(Q(nome_completo__icontains=search) | Q(contacto_encarregado__icontains=search))
         return qs
 
     def perform_create(self, serializer):
-        serializer.save(school=self.request.user.school)
+        aluno = serializer.save(school=self.request.user.school)
+        marcar_turma_estatistica_desatualizada([aluno.turma_atual_id])
+
+    def perform_update(self, serializer):
+        turma_anterior_id = serializer.instance.turma_atual_id
+        aluno = serializer.save()
+        marcar_turma_estatistica_desatualizada([turma_anterior_id, aluno.turma_atual_id])
+
+    def perform_destroy(self, instance):
+        turma_id = instance.turma_atual_id
+        instance.delete()
+        marcar_turma_estatistica_desatualizada([turma_id])
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdministrativo])
     def transferir(self, request, pk=None):
@@ -108,6 +155,7 @@ class AlunoViewSet(viewsets.ModelViewSet):
             aluno.ativo = False
             # Aqui poderíamos criar um log de transferência em auditoria
             aluno.save()
+            marcar_turma_estatistica_desatualizada([aluno.turma_atual_id])
             return Response({"status": "success", "message": f"Aluno {aluno.nome_completo} transferido."}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -118,8 +166,10 @@ class AlunoViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             try:
                 nova_turma = Turma.objects.get(id=serializer.validated_data['nova_turma_id'], school=request.user.school)
+                turma_anterior_id = aluno.turma_atual_id
                 aluno.turma_atual = nova_turma
                 aluno.save()
+                marcar_turma_estatistica_desatualizada([turma_anterior_id, nova_turma.id])
                 return Response({"status": "success", "message": f"Aluno {aluno.nome_completo} movido para turma {nova_turma.nome}."}, status=status.HTTP_200_OK)
             except Turma.DoesNotExist:
                 return Response({"error": "Turma destino não encontrada."}, status=status.HTTP_404_NOT_FOUND)
@@ -127,7 +177,7 @@ class AlunoViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def situacao_academica(self, request, pk=None):
-        report = ReportService.situacao_academica(user=request.user, aluno_id=pk)
+        report = ReportCache.obter("situacao_academica", request.user, {"aluno_id": pk})
         return Response(report["disciplinas"], status=status.HTTP_200_OK)
 
 class ProfessorViewSet(viewsets.ModelViewSet):
@@ -140,9 +190,24 @@ class ProfessorViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        if user.school:
-            return self.queryset.filter(school=user.school)
-        return self.queryset.none()
+        if not user.school:
+            return self.queryset.none()
+        ano = ano_letivo_corrente(user.school)
+        return (
+            self.queryset.filter(school=user.school)
+            .select_related('user')
+            .prefetch_related(
+                'disciplinas',
+                Prefetch('direccoes_turma', queryset=DirectorTurma.objects.filter(ano_letivo=ano), to_attr='direccoes_ano'),
+                Prefetch('coordenacoes_classe', queryset=CoordenadorClasse.objects.filter(ano_letivo=ano), to_attr='coordenacoes_ano'),
+                Prefetch('delegacoes_disciplina', queryset=DelegadoDisciplina.objects.filter(ano_letivo=ano), to_attr='delegacoes_ano'),
+            )
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['ano_letivo'] = ano_letivo_corrente(self.request.user.school)
+        return context
 
     def perform_create(self, serializer):
         serializer.save(school=self.request.user.school)
@@ -248,9 +313,13 @@ class TurmaViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         # Isolamento por escola
         user = self.request.user
-        if user.school:
-            return self.queryset.filter(school=user.school)
-        return self.queryset.none()
+        if not user.school:
+            return self.queryset.none()
+        return (
+            self.queryset.filter(school=user.school)
+            .select_related('classe', 'director_turma__professor__user')
+            .annotate(active_student_count=Count('alunos_na_turma', filter=Q(alunos_na_turma__ativo=True)))
+        )
 
     @action(detail=False, methods=['post'], permission_classes=[IsAdminEscola | IsDAP | IsAdministrativo, IsSchoolNotBlocked])
     def formar_turmas(self, request):
@@ -365,6 +434,13 @@ class TurmaViewSet(viewsets.ModelViewSet):
                 return Response({"error": "Disciplina não encontrada."}, status=status.HTTP_404_NOT_FOUND)
             
             from .models import ProfessorTurmaDisciplina
+            from salamandra_sge.accounts.access import UserAccessContext
+
+            # Professor anterior e novo perdem/ganham acesso: invalidar os seus contextos
+            afetados = set(
+                ProfessorTurmaDisciplina.objects.filter(turma=turma, disciplina=disciplina)
+                .values_list('professor__user_id', flat=True)
+            )
             
             if prof_id:
                 try:
@@ -386,11 +462,15 @@ class TurmaViewSet(viewsets.ModelViewSet):
                         'school': school
                     }
                 )
+                marcar_turma_estatistica_desatualizada([turma.id])
+                UserAccessContext.invalidar(afetados | {prof.user_id})
                 
                 return Response({"status": "success", "message": f"Professor {prof} atribuído à {disciplina.nome}."}, status=status.HTTP_200_OK)
             else:
                 # Remove assignment
                 ProfessorTurmaDisciplina.objects.filter(turma=turma, disciplina=disciplina).delete()
+                marcar_turma_estatistica_desatualizada([turma.id])
+                UserAccessContext.invalidar(afetados)
                 return Response({"status": "success", "message": f"Atribuição removida de {disciplina.nome}."}, status=status.HTTP_200_OK)
                 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -454,6 +534,11 @@ class DisciplinaViewSet(viewsets.ModelViewSet):
             return self.queryset.filter(school=user.school)
         return self.queryset.none()
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['school'] = self.request.user.school
+        return context
+
     def perform_create(self, serializer):
         serializer.save(school=self.request.user.school)
 
@@ -490,21 +575,11 @@ class RelatorioViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['get'])
     def pauta_turma(self, request):
-        report = ReportService.pauta_turma(
-            user=request.user,
-            turma_id=request.query_params.get('turma_id'),
-            disciplina_id=request.query_params.get('disciplina_id'),
-        )
-        return Response(report, status=status.HTTP_200_OK)
+        return conditional_report(request, "pauta_turma", request.query_params)
 
     @action(detail=False, methods=['get'])
     def pauta_turma_geral(self, request):
-        report = ReportService.pauta_turma_geral(
-            user=request.user,
-            turma_id=request.query_params.get('turma_id'),
-            trimestre=request.query_params.get('trimestre'),
-        )
-        return Response(report, status=status.HTTP_200_OK)
+        return conditional_report(request, "pauta_turma_geral", request.query_params)
 
     @action(detail=False, methods=['get'])
     def resumo_escola(self, request):
@@ -520,115 +595,51 @@ class RelatorioViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['get'])
     def declaracao_aluno(self, request):
-        report = ReportService.declaracao_aluno(
-            user=request.user,
-            aluno_id=request.query_params.get('aluno_id'),
-        )
-        return Response(report, status=status.HTTP_200_OK)
+        return conditional_report(request, "declaracao_aluno", request.query_params)
 
     @action(detail=False, methods=['get'])
     def lista_alunos_turma(self, request):
-        report = ReportService.lista_alunos_turma(
-            user=request.user,
-            turma_id=request.query_params.get('turma_id'),
-        )
-        return Response(report, status=status.HTTP_200_OK)
+        return conditional_report(request, "lista_alunos_turma", request.query_params)
 
     @action(detail=False, methods=['get'])
     def aprovados_reprovados_turma(self, request):
-        report = ReportService.aprovados_reprovados_turma(
-            user=request.user,
-            turma_id=request.query_params.get('turma_id'),
-            trimestre=request.query_params.get('trimestre'),
-        )
-        return Response(report, status=status.HTTP_200_OK)
+        return conditional_report(request, "aprovados_reprovados_turma", request.query_params)
 
     @action(detail=False, methods=['get'])
     def pauta_turma_xlsx(self, request):
-        report = ReportService.pauta_turma(
-            user=request.user,
-            turma_id=request.query_params.get('turma_id'),
-            disciplina_id=request.query_params.get('disciplina_id'),
-        )
-        content = report_xlsx.pauta_turma_xlsx(report)
-        response = HttpResponse(
-            content,
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        )
-        response["Content-Disposition"] = "attachment; filename=pauta_turma.xlsx"
-        return response
+        report = ReportCache.obter("pauta_turma", request.user, request.query_params)
+        return report_xlsx.streaming_response(report_xlsx.pauta_turma_sheets(report), "pauta_turma.xlsx")
 
     @action(detail=False, methods=['get'])
     def pauta_turma_geral_xlsx(self, request):
-        report = ReportService.pauta_turma_geral(
-            user=request.user,
-            turma_id=request.query_params.get('turma_id'),
-            trimestre=request.query_params.get('trimestre'),
-        )
-        content = report_xlsx.pauta_turma_geral_xlsx(report)
-        response = HttpResponse(
-            content,
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        )
-        response["Content-Disposition"] = "attachment; filename=pauta_turma_geral.xlsx"
-        return response
+        report = ReportCache.obter("pauta_turma_geral", request.user, request.query_params)
+        return report_xlsx.streaming_response(report_xlsx.pauta_turma_geral_sheets(report), "pauta_turma_geral.xlsx")
 
     @action(detail=False, methods=['get'])
     def declaracao_aluno_xlsx(self, request):
-        report = ReportService.declaracao_aluno(
-            user=request.user,
-            aluno_id=request.query_params.get('aluno_id'),
-        )
-        content = report_xlsx.declaracao_aluno_xlsx(report)
-        response = HttpResponse(
-            content,
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        )
-        response["Content-Disposition"] = "attachment; filename=declaracao_aluno.xlsx"
-        return response
+        report = ReportCache.obter("declaracao_aluno", request.user, request.query_params)
+        return report_xlsx.streaming_response(report_xlsx.declaracao_aluno_sheets(report), "declaracao_aluno.xlsx")
 
     @action(detail=False, methods=['get'])
     def situacao_academica_xlsx(self, request):
-        report = ReportService.situacao_academica(
-            user=request.user,
-            aluno_id=request.query_params.get('aluno_id'),
-        )
-        content = report_xlsx.situacao_academica_xlsx(report)
-        response = HttpResponse(
-            content,
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        )
-        response["Content-Disposition"] = "attachment; filename=situacao_academica.xlsx"
-        return response
+        report = ReportCache.obter("situacao_academica", request.user, request.query_params)
+        return report_xlsx.streaming_response(report_xlsx.situacao_academica_sheets(report), "situacao_academica.xlsx")
 
     @action(detail=False, methods=['get'])
     def lista_alunos_turma_xlsx(self, request):
-        report = ReportService.lista_alunos_turma(
-            user=request.user,
-            turma_id=request.query_params.get('turma_id'),
-        )
-        content = report_xlsx.lista_alunos_turma_xlsx(report)
-        response = HttpResponse(
-            content,
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        )
-        response["Content-Disposition"] = "attachment; filename=lista_alunos_turma.xlsx"
-        return response
+        report = ReportCache.obter("lista_alunos_turma", request.user, request.query_params)
+        return report_xlsx.streaming_response(report_xlsx.lista_alunos_turma_sheets(report), "lista_alunos_turma.xlsx")
 
     @action(detail=False, methods=['get'])
     def aprovados_reprovados_turma_xlsx(self, request):
-        report = ReportService.aprovados_reprovados_turma(
-            user=request.user,
-            turma_id=request.query_params.get('turma_id'),
-            trimestre=request.query_params.get('trimestre'),
-        )
-        content = report_xlsx.aprovados_reprovados_turma_xlsx(report)
-        response = HttpResponse(
-            content,
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        )
-        response["Content-Disposition"] = "attachment; filename=aprovados_reprovados_turma.xlsx"
-        return response
+        report = ReportCache.obter("aprovados_reprovados_turma", request.user, request.query_params)
+        return report_xlsx.streaming_response(report_xlsx.aprovados_reprovados_turma_sheets(report), "aprovados_reprovados_turma.xlsx")
+
+    @action(detail=False, methods=['get'])
+    def cache_metricas(self, request):
+        if request.user.role not in ReportCache.ADMIN_ROLES:
+            return Response({"error": "Sem permissão."}, status=status.HTTP_403_FORBIDDEN)
+        return Response(ReportCache.metricas(), status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['post'])
     def exportar_xlsx_async(self, request):
@@ -636,30 +647,46 @@ class RelatorioViewSet(viewsets.ViewSet):
         params = request.data.get('params') or {}
         if tipo not in REPORT_BUILDERS:
             return Response({"error": "tipo inválido."}, status=status.HTTP_400_BAD_REQUEST)
-        cache_key = build_cache_key()
-        task = gerar_relatorio_xlsx.delay(tipo, request.user.id, params, cache_key)
+        exportacao = report_exports.solicitar_exportacao(tipo, request.user, params)
+        exportacao["status_url"] = report_exports.url_estado(exportacao["task_id"])
         return Response(
-            {"task_id": task.id, "cache_key": cache_key},
-            status=status.HTTP_202_ACCEPTED
+            exportacao,
+            status=status.HTTP_200_OK if exportacao["pronto"] else status.HTTP_202_ACCEPTED
         )
 
     @action(detail=False, methods=['get'])
-    def baixar_xlsx(self, request):
-        cache_key = request.query_params.get('cache_key')
-        if not cache_key:
-            return Response({"error": "cache_key é obrigatório."}, status=status.HTTP_400_BAD_REQUEST)
+    def estado_exportacao(self, request):
+        task_id = request.query_params.get('task_id')
+        if not task_id:
+            return Response({"error": "task_id é obrigatório."}, status=status.HTTP_400_BAD_REQUEST)
+
+        estado = report_exports.estado_exportacao(task_id, request.user)
+        if estado is None:
+            return Response({"error": "Tarefa não encontrada."}, status=status.HTTP_404_NOT_FOUND)
+
+        headers = {"Cache-Control": "no-store"}
+        if estado["retry_after"]:
+            headers["Retry-After"] = str(estado["retry_after"])
+        return Response(estado, status=status.HTTP_200_OK, headers=headers)
 
-        content = cache.get(cache_key)
-        if not content:
+    @action(detail=False, methods=['get'])
+    def baixar_xlsx(self, request):
+        token = request.query_params.get('token')
+        if not token:
+            return Response({"error": "token é obrigatório."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Tokens de outro utilizador, ou de relatórios que deixou de poder ver,
+        # respondem como inexistentes
+        exportacao = report_exports.exportacao_do_token(token, request.user)
+        if not exportacao:
             return Response({"error": "Arquivo não encontrado ou expirado."}, status=status.HTTP_404_NOT_FOUND)
 
-        filename = request.query_params.get('filename') or f"{cache_key}.xlsx"
-        response = HttpResponse(
-            content,
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        return FileResponse(
+            default_storage.open(exportacao["path"], "rb"),
+            as_attachment=True,
+            filename=request.query_params.get('filename') or exportacao["filename"],
+            content_type=report_xlsx.XLSX_CONTENT_TYPE,
         )
-        response["Content-Disposition"] = f"attachment; filename={filename}"
-        return response
 
 class DirectorTurmaViewSet(viewsets.ViewSet):
     """
@@ -730,6 +757,7 @@ class DirectorTurmaViewSet(viewsets.ViewSet):
             aluno.turma_atual = nova_turma
             aluno.cargo_turma = 'Nenhum' # Reset cargo on move
             aluno.save()
+            marcar_turma_estatistica_desatualizada([dt_obj.turma_id, nova_turma.id])
             
             return Response({"status": "success", "message": f"Aluno {aluno.nome_completo} movido para {nova_turma.nome}."})
             
@@ -756,6 +784,7 @@ class DirectorTurmaViewSet(viewsets.ViewSet):
                 aluno.situacao_social = 'TRANSFERIDO' # Optional status update
                 # Log transfer details if needed
                 aluno.save()
+                marcar_turma_estatistica_desatualizada([dt_obj.turma_id])
                 
                 return Response({"status": "success", "message": f"Aluno {aluno.nome_completo} transferido."})
             
@@ -780,6 +809,7 @@ class DirectorTurmaViewSet(viewsets.ViewSet):
             
             aluno.status = novo_status
             aluno.save()
+            marcar_turma_estatistica_desatualizada([dt_obj.turma_id])
             
             return Response({"status": "success", "message": f"Status do aluno {aluno.nome_completo} alterado para {aluno.get_status_display()}."})
         except (DirectorTurma.DoesNotExist, Aluno.DoesNotExist):
@@ -832,7 +862,8 @@ class CoordenadorClasseViewSet(viewsets.ViewSet):
             classe_id = serializer.validated_data.get('classe_atual').id
             if not CoordenadorClasse.objects.filter(professor__user=request.user, classe_id=classe_id).exists():
                 return Response({"error": "Você não coordena esta classe."}, status=status.HTTP_403_FORBIDDEN)
-            serializer.save(school=request.user.school)
+            aluno = serializer.save(school=request.user.school)
+            marcar_turma_estatistica_desatualizada([aluno.turma_atual_id])
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
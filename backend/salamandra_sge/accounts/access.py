@@ -0,0 +1,89 @@
+from django.core.cache import cache
+
+
+class UserAccessContext:
+    """
+    Cargos e atribuições pedagógicas de um utilizador (DT, CC, DD e turmas/disciplinas
+    que lecciona), carregados uma vez por pedido e guardados em cache por utilizador.
+    As verificações de permissão são respondidas a partir da memória.
+    """
+
+    CACHE_TTL = 300
+    _ATTR = '_access_context'
+
+    def __init__(self, dt_turmas=(), cc_classes=(), dd_disciplinas=(), atribuicoes=()):
+        self.dt_turmas = frozenset(dt_turmas)
+        self.cc_classes = frozenset(cc_classes)
+        self.dd_disciplinas = frozenset(dd_disciplinas)
+        self.atribuicoes = frozenset(tuple(par) for par in atribuicoes)
+
+    @staticmethod
+    def cache_key(user_id):
+        return f"acesso:utilizador:{user_id}"
+
+    @classmethod
+    def for_user(cls, user):
+        """Devolve o contexto do utilizador, memorizado no próprio objeto do pedido."""
+        contexto = getattr(user, cls._ATTR, None)
+        if contexto is None:
+            contexto = cls._load(user)
+            setattr(user, cls._ATTR, contexto)
+        return contexto
+
+    @classmethod
+    def _load(cls, user):
+        if not user.is_authenticated or not hasattr(user, 'docente_profile'):
+            return cls()
+
+        key = cls.cache_key(user.id)
+        dados = cache.get(key)
+        if dados is None:
+            dados = cls._query(user)
+            cache.set(key, dados, timeout=cls.CACHE_TTL)
+        return cls(**dados)
+
+    @staticmethod
+    def _query(user):
+        from salamandra_sge.academico.models import (
+            DirectorTurma,
+            CoordenadorClasse,
+            DelegadoDisciplina,
+            ProfessorTurmaDisciplina,
+        )
+
+        return {
+            "dt_turmas": list(
+                DirectorTurma.objects.filter(professor__user=user).values_list('turma_id', flat=True)
+            ),
+            "cc_classes": list(
+                CoordenadorClasse.objects.filter(professor__user=user).values_list('classe_id', flat=True)
+            ),
+            "dd_disciplinas": list(
+                DelegadoDisciplina.objects.filter(professor__user=user).values_list('disciplina_id', flat=True)
+            ),
+            "atribuicoes": list(
+                ProfessorTurmaDisciplina.objects.filter(professor__user=user).values_list('turma_id', 'disciplina_id')
+            ),
+        }
+
+    @classmethod
+    def invalidar(cls, user_ids):
+        cache.delete_many([cls.cache_key(user_id) for user_id in user_ids if user_id])
+
+    def is_dt(self, turma_id=None):
+        if turma_id is None:
+            return bool(self.dt_turmas)
+        return turma_id in self.dt_turmas
+
+    def is_cc(self, classe_id=None):
+        if classe_id is None:
+            return bool(self.cc_classes)
+        return classe_id in self.cc_classes
+
+    def is_dd(self, disciplina_id=None):
+        if disciplina_id is None:
+            return bool(self.dd_disciplinas)
+        return disciplina_id in self.dd_disciplinas
+
+    def lecciona(self, turma_id, disciplina_id):
+        return (turma_id, disciplina_id) in self.atribuicoes
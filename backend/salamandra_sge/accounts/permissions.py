@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from .access import UserAccessContext
+
 class IsAdminSistema(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user.is_authenticated and request.user.role == 'ADMIN_SISTEMA'
@@ -66,21 +68,18 @@ class IsDT(permissions.BasePermission):
     def has_permission(self, request, view):
         if not request.user.is_authenticated or not hasattr(request.user, 'docente_profile'):
             return False
-        from salamandra_sge.academico.models import DirectorTurma
-        return DirectorTurma.objects.filter(professor__user=request.user).exists()
+        return UserAccessContext.for_user(request.user).is_dt()
 
 class IsCC(permissions.BasePermission):
     """Permite se o professor for Coordenador de Classe (CC)."""
     def has_permission(self, request, view):
         if not request.user.is_authenticated or not hasattr(request.user, 'docente_profile'):
             return False
-        from salamandra_sge.academico.models import CoordenadorClasse
-        return CoordenadorClasse.objects.filter(professor__user=request.user).exists()
+        return UserAccessContext.for_user(request.user).is_cc()
 
 class IsDD(permissions.BasePermission):
     """Permite se o professor for Delegado de Disciplina (DD)."""
     def has_permission(self, request, view):
         if not request.user.is_authenticated or not hasattr(request.user, 'docente_profile'):
             return False
-        from salamandra_sge.academico.models import DelegadoDisciplina
-        return DelegadoDisciplina.objects.filter(professor__user=request.user).exists()
+        return UserAccessContext.for_user(request.user).is_dd()
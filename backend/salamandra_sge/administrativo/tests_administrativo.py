@@ -54,7 +54,7 @@ class AdministrativoTests(TestCase):
         url = reverse('aluno-list') + f"?classe_id={self.classe.id}"
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data["results"]), 1)
 
     def test_mover_turma(self):
         aluno = Aluno.objects.create(nome_completo="Aluno 1", data_nascimento="2010-01-01", school=self.school, classe_atual=self.classe, turma_atual=self.turma)
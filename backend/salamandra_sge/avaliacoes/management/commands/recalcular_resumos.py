@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from salamandra_sge.avaliacoes.services.recalculo import BATCH_SIZE, recalcular_resumos
+
+
+class Command(BaseCommand):
+    help = "Reconstrói em massa os ResumoTrimestral de uma escola, turma, disciplina ou ano letivo."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escola', type=int, dest='school_id', help="ID da escola")
+        parser.add_argument('--turma', type=int, dest='turma_id', help="ID da turma")
+        parser.add_argument('--disciplina', type=int, dest='disciplina_id', help="ID da disciplina")
+        parser.add_argument('--ano-letivo', type=int, dest='ano_letivo', help="Ano letivo")
+        parser.add_argument('--trimestre', type=int, choices=[1, 2, 3], help="Limitar a um trimestre")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Resumos por upsert")
+
+    def handle(self, *args, **options):
+        try:
+            total = recalcular_resumos(
+                school=options['school_id'],
+                turma=options['turma_id'],
+                disciplina=options['disciplina_id'],
+                ano_letivo=options['ano_letivo'],
+                trimestre=options['trimestre'],
+                batch_size=options['batch_size'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f"{total} resumos trimestrais recalculados."))
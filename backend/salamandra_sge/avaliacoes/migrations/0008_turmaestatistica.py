@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academico', '0013_alter_disciplina_options'),
+        ('avaliacoes', '0007_nota_ano_letivo_valor_constraint'),
+        ('core', '0006_school_current_period'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TurmaEstatistica',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ano_letivo', models.IntegerField()),
+                ('trimestre', models.IntegerField(choices=[(0, 'Anual'), (1, '1º Trimestre'), (2, '2º Trimestre'), (3, '3º Trimestre')], default=0)),
+                ('total_alunos', models.PositiveIntegerField(default=0)),
+                ('homens', models.PositiveIntegerField(default=0)),
+                ('mulheres', models.PositiveIntegerField(default=0)),
+                ('aprovados', models.PositiveIntegerField(default=0)),
+                ('aprovados_homens', models.PositiveIntegerField(default=0)),
+                ('aprovados_mulheres', models.PositiveIntegerField(default=0)),
+                ('pendentes', models.PositiveIntegerField(default=0)),
+                ('pendentes_homens', models.PositiveIntegerField(default=0)),
+                ('pendentes_mulheres', models.PositiveIntegerField(default=0)),
+                ('reprovados', models.PositiveIntegerField(default=0)),
+                ('reprovados_homens', models.PositiveIntegerField(default=0)),
+                ('reprovados_mulheres', models.PositiveIntegerField(default=0)),
+                ('desatualizado', models.BooleanField(default=False)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.school')),
+                ('turma', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estatisticas', to='academico.turma')),
+            ],
+            options={
+                'verbose_name': 'Estatística da Turma',
+                'verbose_name_plural': 'Estatísticas das Turmas',
+                'unique_together': {('turma', 'trimestre')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academico', '0013_alter_disciplina_options'),
+        ('avaliacoes', '0008_turmaestatistica'),
+        ('core', '0006_school_current_period'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersaoNotas',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ano_letivo', models.IntegerField()),
+                ('trimestre', models.IntegerField(choices=[(1, '1º Trimestre'), (2, '2º Trimestre'), (3, '3º Trimestre')])),
+                ('versao', models.PositiveBigIntegerField(default=0)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('disciplina', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versoes_notas', to='academico.disciplina')),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.school')),
+                ('turma', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versoes_notas', to='academico.turma')),
+            ],
+            options={
+                'verbose_name': 'Versão das Notas',
+                'verbose_name_plural': 'Versões das Notas',
+                'unique_together': {('turma', 'disciplina', 'ano_letivo', 'trimestre')},
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academico', '0014_indices_consultas'),
+        ('avaliacoes', '0009_versaonotas'),
+        ('core', '0006_school_current_period'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='nota',
+            index=models.Index(fields=['turma', 'disciplina', 'ano_letivo', 'trimestre'], name='nota_turma_disc_ano_tri_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nota',
+            index=models.Index(fields=['aluno', 'ano_letivo'], name='nota_aluno_ano_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nota',
+            index=models.Index(fields=['school', 'disciplina'], name='nota_school_disc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resumotrimestral',
+            index=models.Index(fields=['turma', 'ano_letivo', 'trimestre'], name='resumo_turma_ano_tri_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resumotrimestral',
+            index=models.Index(fields=['aluno', 'ano_letivo'], name='resumo_aluno_ano_idx'),
+        ),
+        migrations.AlterField(
+            model_name='nota',
+            name='aluno',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='notas', to='academico.aluno'),
+        ),
+        migrations.AlterField(
+            model_name='nota',
+            name='school',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.school'),
+        ),
+        migrations.AlterField(
+            model_name='nota',
+            name='turma',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='academico.turma'),
+        ),
+        migrations.AlterField(
+            model_name='resumotrimestral',
+            name='aluno',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='resumos_trimestrais', to='academico.aluno'),
+        ),
+        migrations.AlterField(
+            model_name='resumotrimestral',
+            name='turma',
+            field=models.ForeignKey(db_index=False, help_text='Turma onde o aluno obteve a nota', on_delete=django.db.models.deletion.CASCADE, to='academico.turma'),
+        ),
+    ]
@@ -19,9 +19,10 @@ class Nota(models.Model):
         (3, '3º Trimestre'),
     ]
 
-    school = models.ForeignKey(School, on_delete=models.CASCADE)
-    aluno = models.ForeignKey(Aluno, on_delete=models.CASCADE, related_name='notas')
-    turma = models.ForeignKey(Turma, on_delete=models.CASCADE)
+    # school, aluno e turma são servidos pelos índices compostos em Meta.indexes
+    school = models.ForeignKey(School, on_delete=models.CASCADE, db_index=False)
+    aluno = models.ForeignKey(Aluno, on_delete=models.CASCADE, related_name='notas', db_index=False)
+    turma = models.ForeignKey(Turma, on_delete=models.CASCADE, db_index=False)
     disciplina = models.ForeignKey(Disciplina, on_delete=models.CASCADE)
     
     tipo = models.CharField(max_length=10, choices=TIPOS_AVALIACAO)
@@ -39,6 +40,12 @@ class Nota(models.Model):
                 name='unique_nota_por_contexto'
             )
         ]
+        # A restrição única começa por (school, aluno); os relatórios filtram por turma/disciplina
+        indexes = [
+            models.Index(fields=['turma', 'disciplina', 'ano_letivo', 'trimestre'], name='nota_turma_disc_ano_tri_idx'),
+            models.Index(fields=['aluno', 'ano_letivo'], name='nota_aluno_ano_idx'),
+            models.Index(fields=['school', 'disciplina'], name='nota_school_disc_idx'),
+        ]
 
     def __str__(self):
         return f"{self.aluno} - {self.disciplina}: {self.valor}"
@@ -61,9 +68,9 @@ class ResumoTrimestral(models.Model):
     ]
 
     school = models.ForeignKey(School, on_delete=models.CASCADE)
-    aluno = models.ForeignKey(Aluno, on_delete=models.CASCADE, related_name='resumos_trimestrais')
+    aluno = models.ForeignKey(Aluno, on_delete=models.CASCADE, related_name='resumos_trimestrais', db_index=False)
     disciplina = models.ForeignKey(Disciplina, on_delete=models.CASCADE)
-    turma = models.ForeignKey(Turma, on_delete=models.CASCADE, help_text="Turma onde o aluno obteve a nota")
+    turma = models.ForeignKey(Turma, on_delete=models.CASCADE, help_text="Turma onde o aluno obteve a nota", db_index=False)
     ano_letivo = models.IntegerField()
     trimestre = models.IntegerField(choices=TRIMESTRE_CHOICES)
     
@@ -75,10 +82,58 @@ class ResumoTrimestral(models.Model):
         verbose_name = "Resumo Trimestral"
         verbose_name_plural = "Resumos Trimestrais"
         unique_together = ('school', 'aluno', 'disciplina', 'ano_letivo', 'trimestre')
+        indexes = [
+            models.Index(fields=['turma', 'ano_letivo', 'trimestre'], name='resumo_turma_ano_tri_idx'),
+            models.Index(fields=['aluno', 'ano_letivo'], name='resumo_aluno_ano_idx'),
+        ]
 
     def __str__(self):
         return f"{self.aluno} - {self.disciplina} (Trimestre {self.trimestre}): MT={self.mt}"
 
+class TurmaEstatistica(models.Model):
+    """
+    Snapshot do aproveitamento de uma turma (aprovados/pendentes/reprovados por sexo)
+    num trimestre, ou no ano (trimestre 0, por MFD).
+    Marcado como desatualizado quando um ResumoTrimestral da turma é recalculado
+    e refeito na leitura seguinte.
+    """
+    TRIMESTRE_ANUAL = 0
+    TRIMESTRE_CHOICES = [
+        (TRIMESTRE_ANUAL, 'Anual'),
+        (1, '1º Trimestre'),
+        (2, '2º Trimestre'),
+        (3, '3º Trimestre'),
+    ]
+
+    school = models.ForeignKey(School, on_delete=models.CASCADE)
+    turma = models.ForeignKey(Turma, on_delete=models.CASCADE, related_name='estatisticas')
+    ano_letivo = models.IntegerField()
+    trimestre = models.IntegerField(choices=TRIMESTRE_CHOICES, default=TRIMESTRE_ANUAL)
+
+    total_alunos = models.PositiveIntegerField(default=0)
+    homens = models.PositiveIntegerField(default=0)
+    mulheres = models.PositiveIntegerField(default=0)
+    aprovados = models.PositiveIntegerField(default=0)
+    aprovados_homens = models.PositiveIntegerField(default=0)
+    aprovados_mulheres = models.PositiveIntegerField(default=0)
+    pendentes = models.PositiveIntegerField(default=0)
+    pendentes_homens = models.PositiveIntegerField(default=0)
+    pendentes_mulheres = models.PositiveIntegerField(default=0)
+    reprovados = models.PositiveIntegerField(default=0)
+    reprovados_homens = models.PositiveIntegerField(default=0)
+    reprovados_mulheres = models.PositiveIntegerField(default=0)
+
+    desatualizado = models.BooleanField(default=False)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Estatística da Turma"
+        verbose_name_plural = "Estatísticas das Turmas"
+        unique_together = ('turma', 'trimestre')
+
+    def __str__(self):
+        return f"{self.turma} (Trimestre {self.trimestre}): {self.aprovados}/{self.total_alunos} aprovados"
+
 class Falta(models.Model):
     """Representa uma falta (ausência) de um aluno."""
     TIPO_FALTA = [
@@ -110,3 +165,26 @@ class Falta(models.Model):
 
     def __str__(self):
         return f"Falta de {self.aluno} em {self.data} ({self.tipo})"
+
+
+class VersaoNotas(models.Model):
+    """
+    Contador de alterações das notas de uma turma/disciplina num trimestre.
+    Incrementado a cada escrita de Nota ou recálculo de ResumoTrimestral,
+    serve de chave de versão para caches de relatórios e documentos.
+    """
+    school = models.ForeignKey(School, on_delete=models.CASCADE)
+    turma = models.ForeignKey(Turma, on_delete=models.CASCADE, related_name='versoes_notas')
+    disciplina = models.ForeignKey(Disciplina, on_delete=models.CASCADE, related_name='versoes_notas')
+    ano_letivo = models.IntegerField()
+    trimestre = models.IntegerField(choices=Nota.TRIMESTRE_CHOICES)
+    versao = models.PositiveBigIntegerField(default=0)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Versão das Notas"
+        verbose_name_plural = "Versões das Notas"
+        unique_together = ('turma', 'disciplina', 'ano_letivo', 'trimestre')
+
+    def __str__(self):
+        return f"{self.turma} - {self.disciplina} T{self.trimestre}/{self.ano_letivo}: v{self.versao}"
@@ -22,6 +22,30 @@ class NotaUpsertSerializer(serializers.Serializer):
             raise serializers.ValidationError("valor deve estar entre 0 e 20.")
         return value
 
+class NotaCelulaSerializer(serializers.Serializer):
+    aluno_id = serializers.IntegerField()
+    tipo = serializers.ChoiceField(choices=Nota.TIPOS_AVALIACAO)
+    valor = serializers.DecimalField(
+        max_digits=4,
+        decimal_places=2,
+        required=False,
+        allow_null=True
+    )
+
+    def validate_valor(self, value):
+        if value is None:
+            return value
+        if value < 0 or value > 20:
+            raise serializers.ValidationError("valor deve estar entre 0 e 20.")
+        return value
+
+
+class NotaUpsertLoteSerializer(serializers.Serializer):
+    turma_id = serializers.IntegerField()
+    disciplina_id = serializers.IntegerField()
+    trimestre = serializers.ChoiceField(choices=Nota.TRIMESTRE_CHOICES)
+    notas = NotaCelulaSerializer(many=True, allow_empty=False)
+
 class NotaSerializer(serializers.ModelSerializer):
     class Meta:
         model = Nota
@@ -1,9 +1,12 @@
 from decimal import Decimal, ROUND_HALF_UP
 
 from salamandra_sge.avaliacoes.models import Nota, ResumoTrimestral
+from salamandra_sge.avaliacoes.services.versoes import incrementar_versao
 
 
 TIPOS_NOTA = ("ACS1", "ACS2", "ACS3", "MAP", "ACP")
+RESUMO_UNIQUE_FIELDS = ["school", "aluno", "disciplina", "ano_letivo", "trimestre"]
+RESUMO_UPDATE_FIELDS = ["turma", "macs", "mt", "com"]
 
 
 def arredondar_media(valor):
@@ -34,7 +37,33 @@ def calcular_com(mt):
     return "E"
 
 
+def calcular_resumo(valores):
+    """
+    Calcula (macs, mt, com) a partir de um dicionário tipo -> valor.
+    MACS = média de ACS1..ACS3 e MAP; MT = (2 * MACS + ACP) / 3.
+    """
+    macs_base = [
+        valores.get("ACS1"),
+        valores.get("ACS2"),
+        valores.get("ACS3"),
+        valores.get("MAP"),
+    ]
+    macs_vals = [v for v in macs_base if v is not None]
+    macs = None
+    if macs_vals:
+        macs = arredondar_decimal(Decimal(sum(macs_vals)) / Decimal(len(macs_vals)))
+
+    mt = None
+    if macs is not None and valores.get("ACP") is not None:
+        mt = arredondar_media((Decimal(macs) * 2 + Decimal(valores["ACP"])) / Decimal(3))
+
+    return macs, mt, calcular_com(mt)
+
+
 def recalcular_resumo_trimestral(school, aluno, turma, disciplina, ano_letivo, trimestre):
+    from salamandra_sge.avaliacoes.services.estatisticas import marcar_turma_estatistica_desatualizada
+    from salamandra_sge.instituicoes.services import DashboardService
+
     notas = Nota.objects.filter(
         school=school,
         aluno=aluno,
@@ -48,22 +77,7 @@ def recalcular_resumo_trimestral(school, aluno, turma, disciplina, ano_letivo, t
     for nota in notas:
         valores[nota.tipo] = nota.valor
 
-    macs_base = [
-        valores["ACS1"],
-        valores["ACS2"],
-        valores["ACS3"],
-        valores["MAP"],
-    ]
-    macs_vals = [v for v in macs_base if v is not None]
-    macs = None
-    if macs_vals:
-        macs = arredondar_decimal(Decimal(sum(macs_vals)) / Decimal(len(macs_vals)))
-
-    mt = None
-    if macs is not None and valores["ACP"] is not None:
-        mt = arredondar_media((Decimal(macs) * 2 + Decimal(valores["ACP"])) / Decimal(3))
-
-    com = calcular_com(mt)
+    macs, mt, com = calcular_resumo(valores)
 
     resumo, _ = ResumoTrimestral.objects.update_or_create(
         school=school,
@@ -78,4 +92,55 @@ def recalcular_resumo_trimestral(school, aluno, turma, disciplina, ano_letivo, t
             "com": com,
         },
     )
+    incrementar_versao(school.id, turma.id, disciplina.id, ano_letivo, trimestre)
+    marcar_turma_estatistica_desatualizada([turma.id], trimestre=trimestre)
+    DashboardService.invalidar(school.id)
     return resumo
+
+
+def recalcular_resumos_em_lote(school, turma, disciplina, ano_letivo, trimestre, aluno_ids):
+    """
+    Recalcula numa só passagem os ResumoTrimestral dos alunos indicados
+    (uma query de notas e um upsert em massa) e devolve os resumos gravados.
+    """
+    from salamandra_sge.avaliacoes.services.estatisticas import marcar_turma_estatistica_desatualizada
+    from salamandra_sge.instituicoes.services import DashboardService
+
+    aluno_ids = list(aluno_ids)
+    valores_por_aluno = {aluno_id: {tipo: None for tipo in TIPOS_NOTA} for aluno_id in aluno_ids}
+    notas = Nota.objects.filter(
+        school=school,
+        aluno_id__in=aluno_ids,
+        turma=turma,
+        disciplina=disciplina,
+        ano_letivo=ano_letivo,
+        trimestre=trimestre,
+    ).values_list("aluno_id", "tipo", "valor")
+    for aluno_id, tipo, valor in notas:
+        valores_por_aluno[aluno_id][tipo] = valor
+
+    resumos = []
+    for aluno_id, valores in valores_por_aluno.items():
+        macs, mt, com = calcular_resumo(valores)
+        resumos.append(ResumoTrimestral(
+            school=school,
+            aluno_id=aluno_id,
+            disciplina=disciplina,
+            turma=turma,
+            ano_letivo=ano_letivo,
+            trimestre=trimestre,
+            macs=macs,
+            mt=Decimal(mt) if mt is not None else None,
+            com=com,
+        ))
+
+    ResumoTrimestral.objects.bulk_create(
+        resumos,
+        update_conflicts=True,
+        unique_fields=RESUMO_UNIQUE_FIELDS,
+        update_fields=RESUMO_UPDATE_FIELDS,
+    )
+    incrementar_versao(school.id, turma.id, disciplina.id, ano_letivo, trimestre)
+    marcar_turma_estatistica_desatualizada([turma.id], trimestre=trimestre)
+    DashboardService.invalidar(school.id)
+    return resumos
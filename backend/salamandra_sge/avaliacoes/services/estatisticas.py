@@ -0,0 +1,130 @@
+from salamandra_sge.academico.models import Aluno, ProfessorTurmaDisciplina
+from salamandra_sge.avaliacoes.models import ResumoTrimestral, TurmaEstatistica
+from salamandra_sge.avaliacoes.services import AvaliacaoService
+
+
+def _trimestre_key(trimestre):
+    return int(trimestre) if trimestre else TurmaEstatistica.TRIMESTRE_ANUAL
+
+
+def calcular_turma_estatistica(turma, trimestre=None):
+    """
+    Calcula a situação (Aprovado/Pendente/Reprovado) de cada aluno ativo da turma
+    a partir dos ResumoTrimestral e devolve os totais por sexo.
+    Sem trimestre, usa a MFD das disciplinas (exige os três trimestres).
+    """
+    from salamandra_sge.relatorios.services import ReportService
+
+    alunos = list(Aluno.objects.filter(turma_atual=turma, ativo=True))
+    disciplina_ids = list(
+        ProfessorTurmaDisciplina.objects.filter(turma=turma)
+        .values_list('disciplina_id', flat=True)
+        .distinct()
+    )
+
+    resumos = ResumoTrimestral.objects.filter(
+        turma=turma,
+        ano_letivo=turma.ano_letivo,
+        disciplina_id__in=disciplina_ids,
+        aluno__in=alunos,
+    )
+    if trimestre:
+        resumos = resumos.filter(trimestre=int(trimestre))
+    resumo_map = {
+        (aluno_id, disciplina_id, tri): mt
+        for aluno_id, disciplina_id, tri, mt in resumos.values_list(
+            'aluno_id', 'disciplina_id', 'trimestre', 'mt'
+        )
+    }
+
+    contagem = {
+        "total_alunos": len(alunos),
+        "homens": sum(1 for a in alunos if a.sexo == 'HOMEM'),
+        "mulheres": sum(1 for a in alunos if a.sexo == 'MULHER'),
+    }
+    for situacao in ("aprovados", "pendentes"):
+        contagem[situacao] = 0
+        contagem[f"{situacao}_homens"] = 0
+        contagem[f"{situacao}_mulheres"] = 0
+
+    for aluno in alunos:
+        medias = []
+        for disc_id in disciplina_ids:
+            if trimestre:
+                mt = resumo_map.get((aluno.id, disc_id, int(trimestre)))
+                medias.append(int(mt) if mt is not None else None)
+                continue
+            chaves = [(aluno.id, disc_id, tri) for tri in (1, 2, 3)]
+            if not all(chave in resumo_map for chave in chaves):
+                medias.append(None)
+                continue
+            mfd = AvaliacaoService.calculate_mfd(*(resumo_map[chave] for chave in chaves))
+            medias.append(float(mfd) if mfd is not None else None)
+
+        situacao = ReportService._situacao_aprovacao(aluno, medias)
+        if situacao == "Aprovado":
+            chave = "aprovados"
+        elif situacao == "Pendente":
+            chave = "pendentes"
+        else:
+            continue
+        contagem[chave] += 1
+        if aluno.sexo == 'HOMEM':
+            contagem[f"{chave}_homens"] += 1
+        elif aluno.sexo == 'MULHER':
+            contagem[f"{chave}_mulheres"] += 1
+
+    contagem["reprovados"] = contagem["total_alunos"] - contagem["aprovados"] - contagem["pendentes"]
+    contagem["reprovados_homens"] = contagem["homens"] - contagem["aprovados_homens"] - contagem["pendentes_homens"]
+    contagem["reprovados_mulheres"] = (
+        contagem["mulheres"] - contagem["aprovados_mulheres"] - contagem["pendentes_mulheres"]
+    )
+    return contagem
+
+
+def atualizar_turma_estatistica(turma, trimestre=None):
+    """Recalcula e grava o snapshot de estatísticas da turma."""
+    estatistica, _ = TurmaEstatistica.objects.update_or_create(
+        turma=turma,
+        trimestre=_trimestre_key(trimestre),
+        defaults={
+            "school_id": turma.school_id,
+            "ano_letivo": turma.ano_letivo,
+            "desatualizado": False,
+            **calcular_turma_estatistica(turma, trimestre=trimestre),
+        },
+    )
+    return estatistica
+
+
+def obter_turma_estatisticas(turmas, trimestre=None):
+    """
+    Devolve {turma_id: TurmaEstatistica} lendo os snapshots numa única query;
+    apenas turmas sem snapshot ou desatualizadas são recalculadas.
+    """
+    turmas = list(turmas)
+    existentes = {
+        e.turma_id: e
+        for e in TurmaEstatistica.objects.filter(
+            turma__in=turmas,
+            trimestre=_trimestre_key(trimestre),
+        )
+    }
+    resultado = {}
+    for turma in turmas:
+        estatistica = existentes.get(turma.id)
+        if estatistica is None or estatistica.desatualizado or estatistica.ano_letivo != turma.ano_letivo:
+            estatistica = atualizar_turma_estatistica(turma, trimestre=trimestre)
+        resultado[turma.id] = estatistica
+    return resultado
+
+
+def marcar_turma_estatistica_desatualizada(turma_ids, trimestre=None):
+    """
+    Invalida os snapshots das turmas. Com trimestre, apenas esse trimestre
+    e o anual (que depende dele) são marcados.
+    """
+    qs = TurmaEstatistica.objects.filter(turma_id__in=turma_ids)
+    if trimestre:
+        qs = qs.filter(trimestre__in=[int(trimestre), TurmaEstatistica.TRIMESTRE_ANUAL])
+    qs.update(desatualizado=True)
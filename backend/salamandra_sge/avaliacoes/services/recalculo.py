@@ -0,0 +1,178 @@
+from decimal import Decimal
+
+from django.db.models import Exists, OuterRef
+
+from salamandra_sge.avaliacoes.models import Nota, ResumoTrimestral
+from salamandra_sge.avaliacoes.services.caderneta import (
+    TIPOS_NOTA,
+    RESUMO_UNIQUE_FIELDS,
+    RESUMO_UPDATE_FIELDS,
+    calcular_resumo,
+)
+from salamandra_sge.avaliacoes.services.versoes import incrementar_versoes
+
+
+BATCH_SIZE = 2000
+
+
+def _validar_escopo(school, turma, disciplina, ano_letivo):
+    if not any(valor is not None for valor in (school, turma, disciplina, ano_letivo)):
+        raise ValueError("Indique pelo menos escola, turma, disciplina ou ano letivo.")
+
+
+def _notas_do_escopo(school=None, turma=None, disciplina=None, ano_letivo=None, trimestre=None):
+    """
+    Notas dos resumos do escopo. Com `turma`, o escopo são os resumos com notas
+    nessa turma, mas lêem-se as notas desses resumos em todas as turmas: a turma
+    do resumo é escolhida depois, como no recálculo por célula.
+    """
+    _validar_escopo(school, turma, disciplina, ano_letivo)
+
+    notas = Nota.objects.filter(ano_letivo__isnull=False)
+    if school is not None:
+        notas = notas.filter(school=school)
+    if turma is not None:
+        notas = notas.filter(Exists(Nota.objects.filter(
+            turma=turma,
+            school_id=OuterRef('school_id'),
+            aluno_id=OuterRef('aluno_id'),
+            disciplina_id=OuterRef('disciplina_id'),
+            ano_letivo=OuterRef('ano_letivo'),
+            trimestre=OuterRef('trimestre'),
+        )))
+    if disciplina is not None:
+        notas = notas.filter(disciplina=disciplina)
+    if ano_letivo is not None:
+        notas = notas.filter(ano_letivo=ano_letivo)
+    if trimestre is not None:
+        notas = notas.filter(trimestre=trimestre)
+    return notas
+
+
+def _resumos_sem_notas(school=None, turma=None, disciplina=None, ano_letivo=None, trimestre=None):
+    """ResumoTrimestral do escopo cujas notas foram todas apagadas."""
+    resumos = ResumoTrimestral.objects.all()
+    for campo, valor in (
+        ('school', school), ('turma', turma), ('disciplina', disciplina),
+        ('ano_letivo', ano_letivo), ('trimestre', trimestre),
+    ):
+        if valor is not None:
+            resumos = resumos.filter(**{campo: valor})
+    return resumos.filter(~Exists(Nota.objects.filter(
+        school_id=OuterRef('school_id'),
+        aluno_id=OuterRef('aluno_id'),
+        disciplina_id=OuterRef('disciplina_id'),
+        ano_letivo=OuterRef('ano_letivo'),
+        trimestre=OuterRef('trimestre'),
+    )))
+
+
+def _agrupar_por_resumo(linhas):
+    """
+    Agrupa as linhas ordenadas de notas por ResumoTrimestral e escolhe a turma
+    do resumo como NotaViewSet._update_resumo: a turma atual do aluno e, sem
+    ela, a turma das notas (a de maior id, se houver mais de uma). O resumo é
+    calculado só com as notas dessa turma, como no recálculo por célula.
+    Devolve (chave, turma_id, valores, turmas_das_notas).
+    """
+    chave_atual = None
+    turma_aluno = None
+    por_turma = {}
+    for school_id, aluno_id, disciplina_id, ano_letivo, trimestre, turma_id, turma_atual_id, tipo, valor in linhas:
+        chave = (school_id, aluno_id, disciplina_id, ano_letivo, trimestre)
+        if chave != chave_atual:
+            if chave_atual is not None:
+                yield _resumo_agrupado(chave_atual, turma_aluno, por_turma)
+            chave_atual = chave
+            turma_aluno = turma_atual_id
+            por_turma = {}
+        por_turma.setdefault(turma_id, {t: None for t in TIPOS_NOTA})[tipo] = valor
+    if chave_atual is not None:
+        yield _resumo_agrupado(chave_atual, turma_aluno, por_turma)
+
+
+def _resumo_agrupado(chave, turma_aluno, por_turma):
+    turma_id = turma_aluno if turma_aluno is not None else max(por_turma)
+    return chave, turma_id, por_turma.get(turma_id) or {t: None for t in TIPOS_NOTA}, set(por_turma)
+
+
+def recalcular_resumos(school=None, turma=None, disciplina=None, ano_letivo=None, trimestre=None,
+                       batch_size=BATCH_SIZE):
+    """
+    Reconstrói em massa os ResumoTrimestral do escopo indicado (escola, turma,
+    disciplina e/ou ano letivo, opcionalmente limitado a um trimestre).
+    As notas são lidas numa única query em streaming e os resumos gravados
+    por upsert em lotes de `batch_size`; os resumos do escopo que já não têm
+    notas são apagados. Devolve o total de resumos gravados.
+    """
+    from salamandra_sge.avaliacoes.services.estatisticas import marcar_turma_estatistica_desatualizada
+    from salamandra_sge.instituicoes.services import DashboardService
+
+    _validar_escopo(school, turma, disciplina, ano_letivo)
+    versoes = set()
+    turma_ids = set()
+    school_ids = set()
+
+    orfaos = list(
+        _resumos_sem_notas(school, turma, disciplina, ano_letivo, trimestre)
+        .values_list('id', 'school_id', 'turma_id', 'disciplina_id', 'ano_letivo', 'trimestre')
+    )
+    for inicio in range(0, len(orfaos), batch_size):
+        ResumoTrimestral.objects.filter(id__in=[o[0] for o in orfaos[inicio:inicio + batch_size]]).delete()
+    for _, school_id, turma_id, disciplina_id, ano, tri in orfaos:
+        versoes.add((school_id, turma_id, disciplina_id, ano, tri))
+        turma_ids.add(turma_id)
+        school_ids.add(school_id)
+
+    linhas = (
+        _notas_do_escopo(school, turma, disciplina, ano_letivo, trimestre)
+        .order_by('school_id', 'aluno_id', 'disciplina_id', 'ano_letivo', 'trimestre', 'turma_id')
+        .values_list(
+            'school_id', 'aluno_id', 'disciplina_id', 'ano_letivo', 'trimestre', 'turma_id',
+            'aluno__turma_atual_id', 'tipo', 'valor'
+        )
+        .iterator(chunk_size=batch_size)
+    )
+
+    total = 0
+    lote = []
+    for (school_id, aluno_id, disciplina_id, ano, tri), turma_id, valores, turmas_notas in _agrupar_por_resumo(linhas):
+        macs, mt, com = calcular_resumo(valores)
+        lote.append(ResumoTrimestral(
+            school_id=school_id,
+            aluno_id=aluno_id,
+            disciplina_id=disciplina_id,
+            turma_id=turma_id,
+            ano_letivo=ano,
+            trimestre=tri,
+            macs=macs,
+            mt=Decimal(mt) if mt is not None else None,
+            com=com,
+        ))
+        # As células das turmas onde as notas foram lançadas também mudam
+        for turma_nota in turmas_notas | {turma_id}:
+            versoes.add((school_id, turma_nota, disciplina_id, ano, tri))
+            turma_ids.add(turma_nota)
+        school_ids.add(school_id)
+        if len(lote) >= batch_size:
+            total += _gravar(lote)
+            lote = []
+    if lote:
+        total += _gravar(lote)
+
+    incrementar_versoes(versoes)
+    if turma_ids:
+        marcar_turma_estatistica_desatualizada(turma_ids, trimestre=trimestre)
+    for school_id in school_ids:
+        DashboardService.invalidar(school_id)
+    return total
+
+
+def _gravar(resumos):
+    ResumoTrimestral.objects.bulk_create(
+        resumos,
+        update_conflicts=True,
+        unique_fields=RESUMO_UNIQUE_FIELDS,
+        update_fields=RESUMO_UPDATE_FIELDS,
+    )
+    return len(resumos)
@@ -0,0 +1,174 @@
+import logging
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Max, Q, Sum
+
+from salamandra_sge.avaliacoes.models import VersaoNotas
+
+
+logger = logging.getLogger(__name__)
+
+# Valores vindos da base de dados ficam pouco tempo: um leitor que leu a versão
+# antes de um commit pode gravá-la depois de o escritor apagar a chave, e a
+# versão antiga só dura até este prazo
+CACHE_TTL = 60
+LOTE_CHAVES = 500
+
+
+def cache_key(turma_id, disciplina_id, ano_letivo, trimestre):
+    return f"notas:versao:{turma_id}:{disciplina_id}:{ano_letivo}:{trimestre}"
+
+
+def _cache_get_many(chaves):
+    try:
+        return cache.get_many(chaves)
+    except Exception:  # noqa: BLE001 - sem Redis, a base de dados responde
+        logger.warning("Cache indisponível ao ler versões de notas", exc_info=True)
+        return {}
+
+
+def _cache_add_many(valores):
+    # add() não sobrepõe uma versão mais recente gravada entretanto por outro leitor
+    try:
+        for chave, valor in valores.items():
+            cache.add(chave, valor, timeout=CACHE_TTL)
+    except Exception:  # noqa: BLE001
+        logger.warning("Cache indisponível ao gravar versões de notas", exc_info=True)
+
+
+def _cache_delete_many(chaves):
+    try:
+        cache.delete_many(chaves)
+    except Exception:  # noqa: BLE001
+        logger.warning("Cache indisponível ao invalidar versões de notas", exc_info=True)
+
+
+def _filtro(chaves):
+    filtro = Q()
+    for turma_id, disciplina_id, ano_letivo, trimestre in chaves:
+        filtro |= Q(turma_id=turma_id, disciplina_id=disciplina_id, ano_letivo=ano_letivo, trimestre=trimestre)
+    return filtro
+
+
+def incrementar_versoes(chaves):
+    """
+    Incrementa as versões das notas para cada (school_id, turma_id, disciplina_id,
+    ano_letivo, trimestre). A base de dados é a fonte de verdade: depois do commit
+    as chaves são apagadas da cache e obter_versoes volta a lê-las da base de dados.
+    Gravar o valor no commit deixaria um escritor mais lento repor uma versão
+    antiga por cima da nova. Devolve {(turma_id, disciplina_id, ano_letivo, trimestre): versao}.
+    """
+    por_chave = {tuple(chave[1:]): chave[0] for chave in chaves}
+    if not por_chave:
+        return {}
+
+    chaves = list(por_chave)
+    versoes = {}
+    # Cada incremento é um UPDATE com F(), atómico por linha; dispensa transação própria
+    VersaoNotas.objects.bulk_create(
+        [
+            VersaoNotas(
+                school_id=por_chave[chave],
+                turma_id=chave[0],
+                disciplina_id=chave[1],
+                ano_letivo=chave[2],
+                trimestre=chave[3],
+            )
+            for chave in chaves
+        ],
+        ignore_conflicts=True,
+    )
+    for inicio in range(0, len(chaves), LOTE_CHAVES):
+        filtro = _filtro(chaves[inicio:inicio + LOTE_CHAVES])
+        VersaoNotas.objects.filter(filtro).update(versao=F('versao') + 1)
+        for *chave, versao in VersaoNotas.objects.filter(filtro).values_list(
+            'turma_id', 'disciplina_id', 'ano_letivo', 'trimestre', 'versao'
+        ):
+            versoes[tuple(chave)] = versao
+
+    chaves_cache = [cache_key(*chave) for chave in versoes]
+    transaction.on_commit(lambda: _cache_delete_many(chaves_cache))
+    return versoes
+
+
+def incrementar_versao(school_id, turma_id, disciplina_id, ano_letivo, trimestre):
+    versoes = incrementar_versoes([(school_id, turma_id, disciplina_id, ano_letivo, trimestre)])
+    return versoes[(turma_id, disciplina_id, ano_letivo, trimestre)]
+
+
+def obter_versoes(chaves):
+    """
+    Versões atuais para (turma_id, disciplina_id, ano_letivo, trimestre), lidas
+    da cache e, em falta, da base de dados. Combinações sem notas têm versão 0.
+    """
+    chaves = list(dict.fromkeys(tuple(chave) for chave in chaves))
+    if not chaves:
+        return {}
+
+    em_cache = _cache_get_many([cache_key(*chave) for chave in chaves])
+    versoes = {}
+    em_falta = []
+    for chave in chaves:
+        valor = em_cache.get(cache_key(*chave))
+        if valor is None:
+            em_falta.append(chave)
+        else:
+            versoes[chave] = valor
+
+    if em_falta:
+        encontradas = {chave: 0 for chave in em_falta}
+        for inicio in range(0, len(em_falta), LOTE_CHAVES):
+            for *chave, versao in VersaoNotas.objects.filter(
+                _filtro(em_falta[inicio:inicio + LOTE_CHAVES])
+            ).values_list('turma_id', 'disciplina_id', 'ano_letivo', 'trimestre', 'versao'):
+                encontradas[tuple(chave)] = versao
+        versoes.update(encontradas)
+        _cache_add_many({cache_key(*chave): versao for chave, versao in encontradas.items()})
+    return versoes
+
+
+def obter_versao(turma_id, disciplina_id, ano_letivo, trimestre):
+    return obter_versoes([(turma_id, disciplina_id, ano_letivo, trimestre)])[
+        (turma_id, disciplina_id, ano_letivo, trimestre)
+    ]
+
+
+def versoes_turma(turma, ano_letivo=None, disciplina_ids=None, trimestres=(1, 2, 3)):
+    """
+    Versões das notas de uma turma por disciplina e trimestre. Sem disciplinas
+    indicadas, usa as atribuídas à turma e as que já têm versão registada.
+    """
+    from salamandra_sge.academico.models import ProfessorTurmaDisciplina
+
+    ano_letivo = ano_letivo or turma.ano_letivo
+    if disciplina_ids is None:
+        disciplina_ids = set(
+            ProfessorTurmaDisciplina.objects.filter(turma=turma).values_list('disciplina_id', flat=True)
+        )
+        disciplina_ids.update(
+            VersaoNotas.objects.filter(turma=turma, ano_letivo=ano_letivo).values_list('disciplina_id', flat=True)
+        )
+    chaves = [
+        (turma.id, disciplina_id, ano_letivo, trimestre)
+        for disciplina_id in sorted(disciplina_ids)
+        for trimestre in trimestres
+    ]
+    versoes = obter_versoes(chaves)
+    return [
+        {"disciplina_id": disciplina_id, "trimestre": trimestre, "versao": versoes[(turma_id, disciplina_id, ano, trimestre)]}
+        for turma_id, disciplina_id, ano, trimestre in chaves
+    ]
+
+
+def estado_versoes(*condicoes, **filtros):
+    """
+    Soma das versões e data da última alteração das linhas que satisfazem os
+    filtros. Como os contadores só crescem, a soma muda sempre que alguma nota
+    do conjunto muda. Devolve (total, ultima_alteracao).
+    """
+    agregado = VersaoNotas.objects.filter(*condicoes, **filtros).aggregate(
+        total=Sum('versao'),
+        ultima=Max('atualizado_em'),
+    )
+    return agregado['total'] or 0, agregado['ultima']
@@ -0,0 +1,15 @@
+from celery import shared_task
+
+from .services.recalculo import recalcular_resumos
+
+
+@shared_task
+def recalcular_resumos_task(school_id=None, turma_id=None, disciplina_id=None, ano_letivo=None, trimestre=None):
+    total = recalcular_resumos(
+        school=school_id,
+        turma=turma_id,
+        disciplina=disciplina_id,
+        ano_letivo=ano_letivo,
+        trimestre=trimestre,
+    )
+    return {"resumos": total}
@@ -1,8 +1,18 @@
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from rest_framework import status
 from core.models import CustomUser, School, District
 from salamandra_sge.academico.models import Aluno, Classe, Turma, Disciplina, Professor, ProfessorTurmaDisciplina
+from salamandra_sge.avaliacoes.models import Nota, ResumoTrimestral
+from salamandra_sge.avaliacoes.services import versoes
+from salamandra_sge.avaliacoes.services.recalculo import recalcular_resumos
+from salamandra_sge.avaliacoes.services.versoes import obter_versao
 
 
 class CadernetaTests(TestCase):
@@ -75,3 +85,159 @@ class CadernetaTests(TestCase):
         row = response.data["rows"][0]
         self.assertEqual(row["mfd"], 10.0)
         self.assertEqual(row["resumo"]["1"]["mt"], 10)
+
+    def test_upsert_lote(self):
+        self.school.current_ano_letivo = 2026
+        self.school.current_trimestre = 1
+        self.school.save()
+        dap = CustomUser.objects.create_user(
+            email="dap@escola.com", password="password123", role="DAP", school=self.school
+        )
+        self.client.force_authenticate(user=dap)
+        url = "/api/avaliacoes/notas/upsert/lote/"
+
+        def payload(alunos):
+            notas = []
+            for aluno in alunos:
+                notas += [
+                    {"aluno_id": aluno.id, "tipo": "ACS1", "valor": 9},
+                    {"aluno_id": aluno.id, "tipo": "ACS2", "valor": 10},
+                    {"aluno_id": aluno.id, "tipo": "ACP", "valor": 9},
+                ]
+            return {
+                "turma_id": self.turma.id,
+                "disciplina_id": self.disciplina.id,
+                "trimestre": 1,
+                "notas": notas,
+            }
+
+        with CaptureQueriesContext(connection) as poucos:
+            response = self.client.put(url, data=payload([self.aluno]), format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        resumo = response.data["resumos"][0]
+        self.assertEqual(resumo["macs"], 9.5)
+        self.assertEqual(resumo["mt"], 9)
+        self.assertEqual(resumo["com"], "NS")
+        self.assertEqual(resumo["mfd"], 9.0)
+
+        alunos = [self.aluno] + [
+            Aluno.objects.create(
+                nome_completo=f"Aluno {i}", data_nascimento="2010-01-01", school=self.school,
+                classe_atual=self.classe, turma_atual=self.turma
+            )
+            for i in range(20)
+        ]
+        dados = payload(alunos)
+        dados["notas"].append({"aluno_id": self.aluno.id, "tipo": "ACP", "valor": 15})
+        with CaptureQueriesContext(connection) as muitos:
+            response = self.client.put(url, data=dados, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(muitos), len(poucos))
+        self.assertEqual(len(response.data["resumos"]), 21)
+        self.assertEqual(Nota.objects.filter(turma=self.turma).count(), 63)
+        self.assertEqual(ResumoTrimestral.objects.get(aluno=self.aluno).mt, 11)
+
+        outra_escola = School.objects.create(name="Outra", district=self.district)
+        estranho = Aluno.objects.create(
+            nome_completo="Estranho", data_nascimento="2010-01-01", school=outra_escola
+        )
+        response = self.client.put(url, data=payload([estranho]), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_versao_notas(self):
+        self.school.current_ano_letivo = 2026
+        self.school.current_trimestre = 1
+        self.school.save()
+        dap = CustomUser.objects.create_user(
+            email="dap@escola.com", password="password123", role="DAP", school=self.school
+        )
+        self.client.force_authenticate(user=dap)
+        celula = {
+            "turma_id": self.turma.id,
+            "disciplina_id": self.disciplina.id,
+            "trimestre": 1,
+            "notas": [{"aluno_id": self.aluno.id, "tipo": "ACS1", "valor": 12}],
+        }
+        chave = (self.turma.id, self.disciplina.id, 2026, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put("/api/avaliacoes/notas/upsert/lote/", data=celula, format="json")
+            self.client.put(
+                "/api/avaliacoes/notas/upsert/",
+                data={**celula, "aluno_id": self.aluno.id, "tipo": "ACS2", "valor": 13},
+                format="json",
+            )
+        # O commit apaga a chave; a leitura seguinte repõe-na a partir da base de dados
+        self.assertIsNone(cache.get(versoes.cache_key(*chave)))
+        self.assertEqual(obter_versao(*chave), 2)
+        self.assertEqual(cache.get(versoes.cache_key(*chave)), 2)
+
+        # Leitor lento: leu a versão 1 antes do commit e só a grava depois de o
+        # escritor apagar a chave. O valor desatualizado dura no máximo CACHE_TTL
+        cache.delete(versoes.cache_key(*chave))
+        versoes._cache_add_many({versoes.cache_key(*chave): 1})
+        self.assertEqual(obter_versao(*chave), 1)
+        with mock.patch("time.time", return_value=time.time() + versoes.CACHE_TTL + 1):
+            self.assertEqual(obter_versao(*chave), 2)
+
+        recalcular_resumos(turma=self.turma)
+        cache.clear()  # sem cache, a versão vem da base de dados
+        self.assertEqual(obter_versao(*chave), 3)
+
+        response = self.client.get(f"/api/avaliacoes/notas/versoes/?turma_id={self.turma.id}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["versao_total"], 3)
+        self.assertEqual(
+            [(v["trimestre"], v["versao"]) for v in response.data["versoes"]],
+            [(1, 3), (2, 0), (3, 0)],
+        )
+
+        # Professor: só as disciplinas que leciona na turma
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(f"/api/avaliacoes/notas/versoes/?turma_id={self.turma.id}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({v["disciplina_id"] for v in response.data["versoes"]}, {self.disciplina.id})
+        fisica = Disciplina.objects.create(school=self.school, nome="Física")
+        response = self.client.get(
+            f"/api/avaliacoes/notas/versoes/?turma_id={self.turma.id}&disciplina_id={fisica.id}"
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        outro = CustomUser.objects.create_user(
+            email="outro@escola.com", password="password123", role="PROFESSOR", school=self.school
+        )
+        Professor.objects.create(user=outro, school=self.school)
+        self.client.force_authenticate(user=outro)
+        response = self.client.get(f"/api/avaliacoes/notas/versoes/?turma_id={self.turma.id}")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_versao_nota_movida(self):
+        self.school.current_ano_letivo = 2026
+        self.school.current_trimestre = 1
+        self.school.save()
+        dap = CustomUser.objects.create_user(
+            email="dap@escola.com", password="password123", role="DAP", school=self.school
+        )
+        Professor.objects.create(user=dap, school=self.school)
+        self.client.force_authenticate(user=dap)
+        fisica = Disciplina.objects.create(school=self.school, nome="Física")
+        nota = Nota.objects.create(
+            school=self.school, aluno=self.aluno, turma=self.turma, disciplina=self.disciplina,
+            tipo="ACS1", trimestre=1, valor=12,
+        )
+        antiga = (self.turma.id, self.disciplina.id, 2026, 1)
+        nova = (self.turma.id, fisica.id, 2026, 1)
+        self.assertEqual((obter_versao(*antiga), obter_versao(*nova)), (0, 0))
+
+        # Mudar a disciplina altera as duas células: a de origem e a de destino
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/avaliacoes/notas/{nota.id}/", data={"disciplina": fisica.id}, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((obter_versao(*antiga), obter_versao(*nova)), (1, 1))
+
+        # Editar só o valor não mexe noutras células
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f"/api/avaliacoes/notas/{nota.id}/", data={"valor": 14}, format="json")
+        self.assertEqual((obter_versao(*antiga), obter_versao(*nova)), (1, 2))
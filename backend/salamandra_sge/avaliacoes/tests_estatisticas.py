@@ -0,0 +1,111 @@
+from decimal import Decimal
+
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import CustomUser, School, District
+from salamandra_sge.academico.academic_role_service import AcademicRoleService
+from salamandra_sge.academico.models import Aluno, Classe, Turma, Disciplina, Professor, ProfessorTurmaDisciplina
+from salamandra_sge.avaliacoes.models import Nota, TurmaEstatistica
+from salamandra_sge.avaliacoes.services.caderneta import recalcular_resumo_trimestral
+
+
+class TurmaEstatisticaTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.district = District.objects.create(name="Distrito Teste")
+        self.school = School.objects.create(name="Escola Teste", district=self.district)
+        self.dae = CustomUser.objects.create_user(
+            email="dae@escola.com", password="password123", role="DAE", school=self.school
+        )
+        prof_user = CustomUser.objects.create_user(
+            email="prof@escola.com", password="password123", role="PROFESSOR", school=self.school
+        )
+        professor = Professor.objects.create(user=prof_user, school=self.school)
+
+        self.classe = Classe.objects.create(school=self.school, nome="10ª Classe")
+        self.turma = Turma.objects.create(school=self.school, nome="A", classe=self.classe, ano_letivo=2026)
+        self.disc = Disciplina.objects.create(school=self.school, nome="Matemática")
+        ProfessorTurmaDisciplina.objects.create(
+            school=self.school, professor=professor, turma=self.turma, disciplina=self.disc
+        )
+        self.aluno = Aluno.objects.create(
+            nome_completo="Aluna", data_nascimento="2010-01-01", sexo="MULHER",
+            school=self.school, classe_atual=self.classe, turma_atual=self.turma
+        )
+        self.outro = Aluno.objects.create(
+            nome_completo="Aluno", data_nascimento="2010-01-01", sexo="HOMEM",
+            school=self.school, classe_atual=self.classe, turma_atual=self.turma
+        )
+
+    def _lancar(self, aluno, tipo, valor, trimestre=1):
+        Nota.objects.update_or_create(
+            school=self.school, aluno=aluno, turma=self.turma, disciplina=self.disc,
+            ano_letivo=2026, trimestre=trimestre, tipo=tipo,
+            defaults={"valor": Decimal(valor)},
+        )
+        recalcular_resumo_trimestral(
+            school=self.school, aluno=aluno, turma=self.turma, disciplina=self.disc,
+            ano_letivo=2026, trimestre=trimestre,
+        )
+
+    def test_snapshot_refeito_apos_recalculo(self):
+        stats = AcademicRoleService.get_turma_stats(self.turma, trimestre=1)
+        self.assertEqual(stats["pendentes"]["total"], 2)
+        snapshot = TurmaEstatistica.objects.get(turma=self.turma, trimestre=1)
+        self.assertFalse(snapshot.desatualizado)
+
+        self._lancar(self.aluno, "ACS1", 14)
+        self._lancar(self.aluno, "ACP", 12)
+        snapshot.refresh_from_db()
+        self.assertTrue(snapshot.desatualizado)
+
+        self._lancar(self.outro, "ACS1", 5)
+        self._lancar(self.outro, "ACP", 6)
+
+        stats = AcademicRoleService.get_turma_stats(self.turma, trimestre=1)
+        self.assertEqual(stats["aprovados"], {"total": 1, "homens": 0, "mulheres": 1})
+        self.assertEqual(stats["reprovados"], {"total": 1, "homens": 1, "mulheres": 0})
+        self.assertEqual(stats["pendentes"]["total"], 0)
+        self.assertEqual(stats["percentagem_aprovacao"]["mulheres"], 100)
+
+    def test_snapshot_anual_exige_tres_trimestres(self):
+        for trimestre in [1, 2]:
+            self._lancar(self.aluno, "ACS1", 14, trimestre=trimestre)
+            self._lancar(self.aluno, "ACP", 12, trimestre=trimestre)
+        stats = AcademicRoleService.get_turma_stats(self.turma)
+        self.assertEqual(stats["aprovados"]["total"], 0)
+
+        self._lancar(self.aluno, "ACS1", 14, trimestre=3)
+        self._lancar(self.aluno, "ACP", 12, trimestre=3)
+        stats = AcademicRoleService.get_turma_stats(self.turma)
+        self.assertEqual(stats["aprovados"]["total"], 1)
+
+    def test_estatisticas_aproveitamento_dae(self):
+        self._lancar(self.aluno, "ACS1", 14)
+        self.client.force_authenticate(user=self.dae)
+        url = reverse('dae-estatisticas-aproveitamento')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["por_turma"][0]["total"], 2)
+        self.assertEqual(TurmaEstatistica.objects.filter(turma=self.turma).count(), 1)
+
+        with self.assertNumQueries(3):
+            self.client.get(url)
+
+    def test_mudanca_de_estado_do_aluno_invalida_snapshot(self):
+        AcademicRoleService.get_turma_stats(self.turma, trimestre=1)
+        self.client.force_authenticate(user=self.dae)
+        nova = Turma.objects.create(school=self.school, nome="B", classe=self.classe, ano_letivo=2026)
+        admin = CustomUser.objects.create_user(
+            email="adm@escola.com", password="password123", role="ADMINISTRATIVO", school=self.school
+        )
+        self.client.force_authenticate(user=admin)
+        response = self.client.post(
+            reverse('aluno-mover-turma', args=[self.outro.id]), {"nova_turma_id": nova.id}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(TurmaEstatistica.objects.get(turma=self.turma, trimestre=1).desatualizado)
+        self.assertEqual(AcademicRoleService.get_turma_stats(self.turma, trimestre=1)["total_alunos"], 1)
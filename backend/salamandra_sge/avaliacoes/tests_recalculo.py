@@ -0,0 +1,115 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from core.models import School, District
+from salamandra_sge.academico.models import Aluno, Classe, Turma, Disciplina
+from salamandra_sge.avaliacoes.models import Nota, ResumoTrimestral
+from salamandra_sge.avaliacoes.services import AvaliacaoService
+from salamandra_sge.avaliacoes.services.caderneta import recalcular_resumo_trimestral
+from salamandra_sge.avaliacoes.services.recalculo import recalcular_resumos
+
+
+class RecalculoResumosTests(TestCase):
+    def setUp(self):
+        self.district = District.objects.create(name="Distrito Teste")
+        self.school = School.objects.create(name="Escola Teste", district=self.district)
+        self.classe = Classe.objects.create(school=self.school, nome="10ª Classe")
+        self.turma = Turma.objects.create(school=self.school, nome="A", classe=self.classe, ano_letivo=2026)
+        self.disciplinas = [
+            Disciplina.objects.create(school=self.school, nome=nome) for nome in ("Matemática", "Física")
+        ]
+        self.alunos = [
+            Aluno.objects.create(
+                nome_completo=f"Aluno {i}", data_nascimento="2010-01-01", school=self.school,
+                classe_atual=self.classe, turma_atual=self.turma
+            )
+            for i in range(5)
+        ]
+        for i, aluno in enumerate(self.alunos):
+            for disciplina in self.disciplinas:
+                for trimestre in (1, 2):
+                    for j, tipo in enumerate(("ACS1", "ACS2", "MAP", "ACP")):
+                        Nota.objects.create(
+                            school=self.school, aluno=aluno, turma=self.turma, disciplina=disciplina,
+                            ano_letivo=2026, trimestre=trimestre, tipo=tipo,
+                            valor=Decimal(6 + i + j + trimestre) + Decimal("0.5"),
+                        )
+
+    def _resumos(self):
+        return {
+            (r.aluno_id, r.disciplina_id, r.trimestre): (r.turma_id, r.macs, r.mt, r.com)
+            for r in ResumoTrimestral.objects.all()
+        }
+
+    def test_resultado_igual_ao_recalculo_por_celula(self):
+        for aluno in self.alunos:
+            for disciplina in self.disciplinas:
+                for trimestre in (1, 2):
+                    recalcular_resumo_trimestral(
+                        school=self.school, aluno=aluno, turma=self.turma, disciplina=disciplina,
+                        ano_letivo=2026, trimestre=trimestre,
+                    )
+        esperado = self._resumos()
+        ResumoTrimestral.objects.all().delete()
+
+        # 1 procura de resumos sem notas + 1 leitura em streaming + 3 upserts
+        # (lotes de 7) + 3 de versões das notas + 1 invalidação de estatísticas
+        with self.assertNumQueries(9):
+            total = recalcular_resumos(school=self.school, batch_size=7)
+        self.assertEqual(total, 20)
+        self.assertEqual(self._resumos(), esperado)
+
+    def test_escopo_e_comando(self):
+        recalcular_resumos(disciplina=self.disciplinas[0], trimestre=2)
+        self.assertEqual(
+            set(ResumoTrimestral.objects.values_list('disciplina_id', 'trimestre')),
+            {(self.disciplinas[0].id, 2)},
+        )
+
+        out = StringIO()
+        call_command('recalcular_resumos', '--escola', str(self.school.id), '--ano-letivo', '2026', stdout=out)
+        self.assertIn("20 resumos", out.getvalue())
+        self.assertEqual(ResumoTrimestral.objects.count(), 20)
+
+        with self.assertRaises(CommandError):
+            call_command('recalcular_resumos', stdout=StringIO())
+
+    def test_aluno_com_notas_em_duas_turmas(self):
+        # O aluno mudou para a turma B (id maior que a atual A) a meio do trimestre
+        aluno = self.alunos[0]
+        turma_b = Turma.objects.create(school=self.school, nome="B", classe=self.classe, ano_letivo=2026)
+        disciplina = self.disciplinas[0]
+        nota_b = Nota.objects.create(
+            school=self.school, aluno=aluno, turma=turma_b, disciplina=disciplina,
+            ano_letivo=2026, trimestre=1, tipo="ACS3", valor=Decimal("20"),
+        )
+
+        # Recálculo por célula, como NotaViewSet._update_resumo: turma atual do aluno
+        AvaliacaoService.update_resumo_trimestral(
+            student=aluno, discipline=disciplina, trimester=1, year=2026,
+            turma_context=aluno.turma_atual or nota_b.turma,
+        )
+        esperado = self._resumos()[(aluno.id, disciplina.id, 1)]
+        self.assertEqual(esperado[0], self.turma.id)
+
+        # O mesmo resultado, qualquer que seja o escopo do recálculo em massa
+        for escopo in ({"school": self.school}, {"turma": turma_b}, {"turma": self.turma}):
+            ResumoTrimestral.objects.all().delete()
+            recalcular_resumos(**escopo)
+            self.assertEqual(self._resumos()[(aluno.id, disciplina.id, 1)], esperado, escopo)
+
+    def test_resumos_sem_notas_sao_apagados(self):
+        recalcular_resumos(school=self.school)
+        aluno, disciplina = self.alunos[0], self.disciplinas[0]
+        Nota.objects.filter(aluno=aluno, disciplina=disciplina, trimestre=1).delete()
+
+        # Fora do escopo, o resumo fica; dentro, deixa de existir
+        recalcular_resumos(disciplina=self.disciplinas[1])
+        self.assertIn((aluno.id, disciplina.id, 1), self._resumos())
+        recalcular_resumos(turma=self.turma, trimestre=1)
+        self.assertNotIn((aluno.id, disciplina.id, 1), self._resumos())
+        self.assertEqual(ResumoTrimestral.objects.count(), 19)
@@ -5,8 +5,10 @@ from .views import (
     FaltaViewSet,
     ResumoTrimestralViewSet,
     NotaUpsertView,
+    NotaUpsertLoteView,
     CadernetaView,
     CadernetaXLSXView,
+    NotaVersoesView,
 )
 
 router = DefaultRouter()
@@ -18,6 +20,8 @@ app_name = 'avaliacoes'
 
 urlpatterns = [
     path('notas/upsert/', NotaUpsertView.as_view(), name='nota-upsert'),
+    path('notas/upsert/lote/', NotaUpsertLoteView.as_view(), name='nota-upsert-lote'),
+    path('notas/versoes/', NotaVersoesView.as_view(), name='nota-versoes'),
     path('caderneta/', CadernetaView.as_view(), name='caderneta'),
     path('caderneta/xlsx/', CadernetaXLSXView.as_view(), name='caderneta-xlsx'),
     path('', include(router.urls)),
@@ -1,22 +1,32 @@
-from django.db import models
+from django.db import models, transaction
 from decimal import Decimal
 from rest_framework import viewsets, status, permissions
 from rest_framework.views import APIView
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.http import HttpResponse
 from salamandra_sge.accounts.permissions import IsProfessor, IsDT, IsSchoolNotBlocked
 from .models import Nota, Falta, ResumoTrimestral
-from .serializers import NotaSerializer, FaltaSerializer, ResumoTrimestralSerializer, NotaUpsertSerializer
+from .serializers import (
+    NotaSerializer,
+    FaltaSerializer,
+    ResumoTrimestralSerializer,
+    NotaUpsertSerializer,
+    NotaUpsertLoteSerializer,
+)
 from salamandra_sge.academico.models import ProfessorTurmaDisciplina, DirectorTurma, Turma, Disciplina, Aluno
 from .services import AvaliacaoService
 from salamandra_sge.avaliacoes.services.caderneta import (
     recalcular_resumo_trimestral,
+    recalcular_resumos_em_lote,
     arredondar_media,
     arredondar_decimal,
 )
+from salamandra_sge.avaliacoes.services.versoes import incrementar_versao, versoes_turma
+from salamandra_sge.accounts.access import UserAccessContext
+from salamandra_sge.relatorios.cache import ReportCache
 from salamandra_sge.relatorios.services import ReportService
+from salamandra_sge.relatorios.etags import conditional_report
 from salamandra_sge.relatorios import xlsx as report_xlsx
 
 class NotaViewSet(viewsets.ModelViewSet):
@@ -63,8 +73,24 @@ class NotaViewSet(viewsets.ModelViewSet):
     def perform_update(self, serializer):
         self._enforce_period(serializer.validated_data, instance=serializer.instance)
         self._enforce_professor_assignment(serializer.validated_data, instance=serializer.instance)
+        anterior = self._chave_versao(serializer.instance)
         instance = serializer.save()
         self._update_resumo(instance)
+        if anterior != self._chave_versao(instance):
+            # A nota saiu de (turma, disciplina, ano, trimestre): a célula antiga também mudou
+            incrementar_versao(*anterior)
+
+    def perform_destroy(self, instance):
+        chave = self._chave_versao(instance)
+        instance.delete()
+        incrementar_versao(*chave)
+
+    @staticmethod
+    def _chave_versao(instance):
+        return (
+            instance.school_id, instance.turma_id, instance.disciplina_id,
+            instance.ano_letivo or instance.turma.ano_letivo, instance.trimestre,
+        )
 
     def _enforce_professor_assignment(self, validated_data, instance=None):
         user = self.request.user
@@ -113,6 +139,12 @@ class NotaViewSet(viewsets.ModelViewSet):
             year=instance.turma.ano_letivo,
             turma_context=turma_atual
         )
+        if turma_atual.id != instance.turma_id:
+            # O recálculo versiona a turma atual; a turma da nota também mudou
+            incrementar_versao(
+                instance.school_id, instance.turma_id, instance.disciplina_id,
+                instance.turma.ano_letivo, instance.trimestre,
+            )
 
 class ResumoTrimestralViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -302,6 +334,107 @@ class NotaUpsertView(APIView):
         }, status=status.HTTP_200_OK)
 
 
+class NotaUpsertLoteView(APIView):
+    """
+    Lança/atualiza várias células da caderneta de uma turma/disciplina/trimestre
+    num único pedido (ex.: colar uma coluna de notas).
+    """
+    permission_classes = [IsAuthenticated, IsSchoolNotBlocked]
+
+    def put(self, request):
+        serializer = NotaUpsertLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        user = request.user
+        if user.role not in ['ADMIN_ESCOLA', 'DAP', 'ADMINISTRATIVO']:
+            return Response({"error": "Sem permissão para lançar notas."}, status=status.HTTP_403_FORBIDDEN)
+
+        turma = Turma.objects.filter(id=serializer.validated_data['turma_id'], school=user.school).first()
+        disciplina = Disciplina.objects.filter(
+            id=serializer.validated_data['disciplina_id'],
+            school=user.school
+        ).first()
+        if not turma or not disciplina:
+            return Response({"error": "Dados inválidos para escola."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # A última célula enviada para o mesmo (aluno, tipo) prevalece
+        celulas = {
+            (celula['aluno_id'], celula['tipo']): celula.get('valor')
+            for celula in serializer.validated_data['notas']
+        }
+        aluno_ids = {aluno_id for aluno_id, _ in celulas}
+        alunos_validos = set(
+            Aluno.objects.filter(id__in=aluno_ids, school=user.school).values_list('id', flat=True)
+        )
+        if alunos_validos != aluno_ids:
+            return Response({"error": "Dados inválidos para escola."}, status=status.HTTP_400_BAD_REQUEST)
+
+        ano_letivo = turma.ano_letivo
+        trimestre = int(serializer.validated_data['trimestre'])
+        school = user.school
+        if not school or not school.current_ano_letivo or not school.current_trimestre:
+            return Response({"error": "Período letivo não definido."}, status=status.HTTP_403_FORBIDDEN)
+        if ano_letivo != school.current_ano_letivo or trimestre != int(school.current_trimestre):
+            return Response({"error": "Período não editável."}, status=status.HTTP_403_FORBIDDEN)
+
+        with transaction.atomic():
+            Nota.objects.bulk_create(
+                [
+                    Nota(
+                        school=school,
+                        aluno_id=aluno_id,
+                        turma=turma,
+                        disciplina=disciplina,
+                        ano_letivo=ano_letivo,
+                        trimestre=trimestre,
+                        tipo=tipo,
+                        valor=valor,
+                    )
+                    for (aluno_id, tipo), valor in celulas.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['school', 'aluno', 'turma', 'disciplina', 'ano_letivo', 'trimestre', 'tipo'],
+                update_fields=['valor'],
+            )
+            resumos = recalcular_resumos_em_lote(
+                school=school,
+                turma=turma,
+                disciplina=disciplina,
+                ano_letivo=ano_letivo,
+                trimestre=trimestre,
+                aluno_ids=aluno_ids,
+            )
+
+        mts_por_aluno = {}
+        for aluno_id, mt in ResumoTrimestral.objects.filter(
+            school=school,
+            aluno_id__in=aluno_ids,
+            disciplina=disciplina,
+            ano_letivo=ano_letivo,
+            mt__isnull=False,
+        ).values_list("aluno_id", "mt"):
+            mts_por_aluno.setdefault(aluno_id, []).append(mt)
+
+        resultado = []
+        for resumo in resumos:
+            mts_vals = mts_por_aluno.get(resumo.aluno_id)
+            mfd = None
+            if mts_vals:
+                mfd = float(arredondar_decimal(Decimal(sum(mts_vals)) / Decimal(len(mts_vals))))
+            resultado.append({
+                "aluno_id": resumo.aluno_id,
+                "macs": float(resumo.macs) if resumo.macs is not None else None,
+                "mt": int(resumo.mt) if resumo.mt is not None else None,
+                "com": resumo.com,
+                "mfd": mfd,
+            })
+
+        return Response({
+            "total_notas": len(celulas),
+            "resumos": resultado,
+        }, status=status.HTTP_200_OK)
+
+
 class CadernetaView(APIView):
     """
     Retorna a caderneta da turma/disciplinas com notas e resumos.
@@ -309,13 +442,7 @@ class CadernetaView(APIView):
     permission_classes = [IsAuthenticated, IsSchoolNotBlocked]
 
     def get(self, request):
-        report = ReportService.caderneta(
-            user=request.user,
-            turma_id=request.query_params.get('turma_id'),
-            disciplina_id=request.query_params.get('disciplina_id'),
-            ano_letivo=request.query_params.get('ano_letivo'),
-        )
-        return Response(report, status=status.HTTP_200_OK)
+        return conditional_report(request, "caderneta", request.query_params)
 
 
 class CadernetaXLSXView(APIView):
@@ -325,16 +452,64 @@ class CadernetaXLSXView(APIView):
     permission_classes = [IsAuthenticated, IsSchoolNotBlocked]
 
     def get(self, request):
-        report = ReportService.caderneta(
-            user=request.user,
-            turma_id=request.query_params.get('turma_id'),
-            disciplina_id=request.query_params.get('disciplina_id'),
-            ano_letivo=request.query_params.get('ano_letivo'),
-        )
-        content = report_xlsx.caderneta_xlsx(report)
-        response = HttpResponse(
-            content,
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        )
-        response["Content-Disposition"] = "attachment; filename=caderneta.xlsx"
-        return response
+        report = ReportCache.obter("caderneta", request.user, request.query_params)
+        return report_xlsx.streaming_response(report_xlsx.caderneta_sheets(report), "caderneta.xlsx")
+
+
+class NotaVersoesView(APIView):
+    """
+    Versões das notas de uma turma (por disciplina e trimestre), para usar como
+    chave de cache ou ETag por quem constrói relatórios e painéis.
+    Mesmas regras de acesso das notas: administração e DT/CC da turma veem todas
+    as disciplinas; os restantes professores só as que lecionam na turma ou de
+    que são Delegados de Disciplina.
+    """
+    permission_classes = [IsAuthenticated, IsSchoolNotBlocked]
+
+    @staticmethod
+    def _disciplinas_visiveis(user, turma):
+        """None quando o utilizador vê todas as disciplinas da turma."""
+        if ReportService._can_view_pauta(user, turma):
+            return None
+        if user.role != 'PROFESSOR':
+            return set()
+        acesso = UserAccessContext.for_user(user)
+        lecionadas = {disciplina_id for turma_id, disciplina_id in acesso.atribuicoes if turma_id == turma.id}
+        return lecionadas | acesso.dd_disciplinas
+
+    def get(self, request):
+        try:
+            turma_id = int(request.query_params['turma_id'])
+            disciplina_id = request.query_params.get('disciplina_id')
+            disciplina_ids = [int(disciplina_id)] if disciplina_id else None
+            trimestre = request.query_params.get('trimestre')
+            trimestres = (int(trimestre),) if trimestre else (1, 2, 3)
+            ano_letivo = request.query_params.get('ano_letivo')
+            ano_letivo = int(ano_letivo) if ano_letivo else None
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "turma_id é obrigatório; disciplina_id, trimestre e ano_letivo devem ser números."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        turma = Turma.objects.filter(id=turma_id, school=request.user.school).first()
+        if not turma:
+            return Response({"error": "Turma não encontrada."}, status=status.HTTP_404_NOT_FOUND)
+
+        visiveis = self._disciplinas_visiveis(request.user, turma)
+        if visiveis is not None:
+            if disciplina_ids is None:
+                disciplina_ids = sorted(visiveis)
+            if not disciplina_ids or not set(disciplina_ids) <= visiveis:
+                return Response(
+                    {"error": "Sem permissão para consultar as notas desta turma/disciplina."},
+                    status=status.HTTP_403_FORBIDDEN,
+                )
+
+        versoes = versoes_turma(turma, ano_letivo, disciplina_ids=disciplina_ids, trimestres=trimestres)
+        return Response({
+            "turma_id": turma.id,
+            "ano_letivo": ano_letivo or turma.ano_letivo,
+            "versao_total": sum(item["versao"] for item in versoes),
+            "versoes": versoes,
+        }, status=status.HTTP_200_OK)
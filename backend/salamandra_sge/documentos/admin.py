@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.db import transaction
 
-from .models import ProfessorProfile, DocumentTemplate, TemplateMapping, GeneratedDocument
+from .models import ProfessorProfile, DocumentTemplate, TemplateMapping, GeneratedDocument, DocumentBatch, DocumentJob
 
 
 @admin.register(ProfessorProfile)
@@ -53,3 +53,39 @@ class GeneratedDocumentAdmin(admin.ModelAdmin):
     )
     list_filter = ("doc_type", "trimestre", "ano_lectivo")
     search_fields = ("turma__nome", "disciplina__nome", "school__name")
+
+
+@admin.register(DocumentBatch)
+class DocumentBatchAdmin(admin.ModelAdmin):
+    list_display = (
+        "school",
+        "scope",
+        "scope_id",
+        "trimestre",
+        "ano_lectivo",
+        "status",
+        "completed_items",
+        "failed_items",
+        "total_items",
+        "created_at",
+    )
+    list_filter = ("status", "scope", "trimestre", "ano_lectivo")
+    search_fields = ("school__name",)
+
+
+@admin.register(DocumentJob)
+class DocumentJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "school",
+        "turma",
+        "disciplina",
+        "trimestre",
+        "ano_lectivo",
+        "template_version",
+        "status",
+        "parts_total",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status", "trimestre", "ano_lectivo")
+    search_fields = ("school__name", "turma__nome", "disciplina__nome")
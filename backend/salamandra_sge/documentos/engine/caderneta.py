@@ -1,3 +1,5 @@
+import hashlib
+import json
 import logging
 import math
 import os
@@ -6,8 +8,9 @@ from io import BytesIO
 from types import SimpleNamespace
 
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.utils.text import slugify
-from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
 
 from salamandra_sge.academico.models import (
     Aluno,
@@ -20,6 +23,7 @@ from salamandra_sge.avaliacoes.models import Nota
 from salamandra_sge.relatorios.services import ReportService
 
 from ..models import DocumentTemplate, GeneratedDocument, ProfessorProfile, TemplateMapping
+from .template_cache import template_cache
 
 
 logger = logging.getLogger(__name__)
@@ -108,10 +112,12 @@ def _build_header_values(
     ano_lectivo,
     total_alunos,
     alunos,
+    diretor_nome=None,
 ):
     homens = sum(1 for aluno in alunos if aluno.sexo == "HOMEM")
     mulheres = sum(1 for aluno in alunos if aluno.sexo == "MULHER")
-    diretor = DirectorTurma.objects.filter(turma=turma).select_related("professor__user").first()
+    if diretor_nome is None:
+        diretor_nome = _diretor_nome(turma)
 
     return {
         "professor_nome": professor.user.get_full_name(),
@@ -127,10 +133,21 @@ def _build_header_values(
         "total_alunos": total_alunos,
         "M": mulheres,
         "H": homens,
-        "DT": diretor.professor.user.get_full_name() if diretor else "",
+        "DT": diretor_nome,
     }
 
 
+def _diretor_nome(turma):
+    diretor = DirectorTurma.objects.filter(turma=turma).select_related("professor__user").first()
+    return diretor.professor.user.get_full_name() if diretor else ""
+
+
+def _alunos_turma(turma):
+    return list(
+        Aluno.objects.filter(turma_atual=turma, ativo=True).order_by("numero_turma", "nome_completo")
+    )
+
+
 def _collect_notes(school, turma, disciplina, ano_lectivo, trimestre):
     notas = Nota.objects.filter(
         school=school,
@@ -145,41 +162,73 @@ def _collect_notes(school, turma, disciplina, ano_lectivo, trimestre):
     return notas_por_aluno
 
 
-def _write_header(ws, mapping, values):
+def _collect_notes_turma(school, turma, ano_lectivo, trimestre, disciplina_ids):
+    """Notas de todas as disciplinas da turma numa só query: {disciplina_id: {aluno_id: {tipo: valor}}}."""
+    notas = Nota.objects.filter(
+        school=school,
+        turma=turma,
+        disciplina_id__in=disciplina_ids,
+        ano_letivo=ano_lectivo,
+        trimestre=trimestre,
+    ).values_list("disciplina_id", "aluno_id", "tipo", "valor")
+    notas_por_disciplina = {disciplina_id: {} for disciplina_id in disciplina_ids}
+    for disciplina_id, aluno_id, tipo, valor in notas:
+        notas_por_disciplina[disciplina_id].setdefault(aluno_id, {})[tipo] = valor
+    return notas_por_disciplina
+
+
+def _write_header(ws, mapping, values, merged_index=None):
     for key, cell in (mapping.header_cells or {}).items():
         if cell and key in values:
-            _safe_set_cell(ws, cell, values.get(key, ""))
+            _safe_set_cell(ws, cell, values.get(key, ""), merged_index)
+
+
+def _merged_index(ws):
+    """Mapa coordenada -> célula âncora para todas as células fundidas da folha."""
+    index = {}
+    for merged in ws.merged_cells.ranges:
+        anchor = merged.start_cell.coordinate
+        for row in range(merged.min_row, merged.max_row + 1):
+            for col in range(merged.min_col, merged.max_col + 1):
+                index[f"{get_column_letter(col)}{row}"] = anchor
+    return index
 
 
-def _safe_set_cell(ws, cell, value):
+def _safe_set_cell(ws, cell, value, merged_index=None):
     if not cell:
         return
-    for merged in ws.merged_cells.ranges:
-        if cell in merged:
-            cell = merged.start_cell.coordinate
-            break
+    if merged_index is not None:
+        cell = merged_index.get(cell, cell)
+    else:
+        for merged in ws.merged_cells.ranges:
+            if cell in merged:
+                cell = merged.start_cell.coordinate
+                break
     ws[cell] = value
 
 
-def _write_students(ws, mapping, alunos, notas_por_aluno, start_row, max_students):
+def _valor_aluno(aluno, key):
+    if key == "numero":
+        return aluno.numero_turma
+    if key == "nome":
+        return aluno.nome_completo
+    if key == "sexo":
+        return aluno.sexo or ""
+    if key == "status":
+        return aluno.status or ""
+    if hasattr(aluno, key):
+        return getattr(aluno, key) or ""
+    return ""
+
+
+def _write_students(ws, mapping, alunos, notas_por_aluno, start_row, max_students, merged_index=None):
     for idx, aluno in enumerate(alunos):
         row = start_row + idx
         for key, col in (mapping.student_columns or {}).items():
             cell = _resolve_cell(col, row)
             if not cell:
                 continue
-            value = ""
-            if key == "numero":
-                value = aluno.numero_turma
-            elif key == "nome":
-                value = aluno.nome_completo
-            elif key == "sexo":
-                value = aluno.sexo or ""
-            elif key == "status":
-                value = aluno.status or ""
-            elif hasattr(aluno, key):
-                value = getattr(aluno, key) or ""
-            _safe_set_cell(ws, cell, value)
+            _safe_set_cell(ws, cell, _valor_aluno(aluno, key), merged_index)
 
         notas = notas_por_aluno.get(aluno.id, {})
         for key, col in (mapping.grade_columns or {}).items():
@@ -188,7 +237,7 @@ def _write_students(ws, mapping, alunos, notas_por_aluno, start_row, max_student
             cell = _resolve_cell(col, row)
             if not cell:
                 continue
-            _safe_set_cell(ws, cell, notas.get(key))
+            _safe_set_cell(ws, cell, notas.get(key), merged_index)
 
     used = len(alunos)
     for idx in range(used, max_students):
@@ -196,14 +245,11 @@ def _write_students(ws, mapping, alunos, notas_por_aluno, start_row, max_student
         ws.row_dimensions[row].hidden = True
 
 
-def gerar_caderneta_documento(
-    *,
-    user,
-    turma_id,
-    disciplina_id,
-    trimestre,
-    ano_lectivo=None,
-):
+def validar_pedido_caderneta(*, user, turma_id, disciplina_id):
+    """
+    Verifica se o utilizador pode gerar a caderneta pedida.
+    Devolve (turma, disciplina, profile) ou levanta PermissionError.
+    """
     turma = Turma.objects.select_related("classe").get(id=turma_id, school=user.school)
     disciplina = Disciplina.objects.get(id=disciplina_id, school=user.school)
 
@@ -220,18 +266,123 @@ def gerar_caderneta_documento(
     profile, _ = ProfessorProfile.objects.get_or_create(professor=user.docente_profile)
     if not profile.is_complete:
         raise PermissionError("Perfil profissional incompleto. Complete o perfil antes de gerar documentos.")
+    return turma, disciplina, profile
+
 
+def versao_template_caderneta(school, turma):
+    """Versão do template que seria usado para a turma (id:versão ou 'default')."""
+    total_alunos = Aluno.objects.filter(turma_atual=turma, ativo=True).count()
+    template = _select_template(school, DocumentTemplate.DOC_TYPE_CADERNETA, total_alunos)
+    if template is None:
+        return "default"
+    return f"{template.id}:{template.version}"
+
+
+def gerar_caderneta_documento(
+    *,
+    user,
+    turma_id,
+    disciplina_id,
+    trimestre,
+    ano_lectivo=None,
+):
+    turma, disciplina, profile = validar_pedido_caderneta(
+        user=user, turma_id=turma_id, disciplina_id=disciplina_id
+    )
     ano_lectivo = ano_lectivo or turma.ano_letivo
-    alunos = list(
-        Aluno.objects.filter(turma_atual=turma, ativo=True).order_by("numero_turma", "nome_completo")
+    alunos = _alunos_turma(turma)
+
+    return _gerar_documentos(
+        school=user.school,
+        generated_by=user,
+        professor=user.docente_profile,
+        profile=profile,
+        turma=turma,
+        disciplina=disciplina,
+        trimestre=trimestre,
+        ano_lectivo=ano_lectivo,
+        alunos=alunos,
+        notas_por_aluno=_collect_notes(user.school, turma, disciplina, ano_lectivo, trimestre),
+        diretor_nome=_diretor_nome(turma),
+    )
+
+
+def gerar_cadernetas_turma(*, turma, trimestre, ano_lectivo=None, disciplina_ids=None, generated_by=None):
+    """
+    Gera as cadernetas de várias disciplinas de uma turma partilhando a leitura
+    de alunos, notas, director de turma e atribuições. O cabeçalho de cada
+    caderneta usa o professor atribuído à disciplina.
+    Devolve (documentos, erros), onde erros é uma lista de {disciplina_id, erro}.
+    """
+    school = turma.school
+    ano_lectivo = ano_lectivo or turma.ano_letivo
+    atribuicoes = (
+        ProfessorTurmaDisciplina.objects.filter(turma=turma)
+        .select_related("disciplina", "professor__user", "professor__profile")
+        .order_by("disciplina__nome")
     )
+    if disciplina_ids is not None:
+        atribuicoes = atribuicoes.filter(disciplina_id__in=disciplina_ids)
+    atribuicoes = list(atribuicoes)
+    if not atribuicoes:
+        return [], []
+
+    alunos = _alunos_turma(turma)
+    diretor_nome = _diretor_nome(turma)
+    notas_por_disciplina = _collect_notes_turma(
+        school, turma, ano_lectivo, trimestre, [a.disciplina_id for a in atribuicoes]
+    )
+
+    documentos, erros = [], []
+    for atribuicao in atribuicoes:
+        profile = getattr(atribuicao.professor, "profile", None)
+        if profile is None or not profile.is_complete:
+            erros.append({
+                "turma_id": turma.id,
+                "disciplina_id": atribuicao.disciplina_id,
+                "erro": "Perfil profissional incompleto.",
+            })
+            continue
+        try:
+            documentos.extend(_gerar_documentos(
+                school=school,
+                generated_by=generated_by,
+                professor=atribuicao.professor,
+                profile=profile,
+                turma=turma,
+                disciplina=atribuicao.disciplina,
+                trimestre=trimestre,
+                ano_lectivo=ano_lectivo,
+                alunos=alunos,
+                notas_por_aluno=notas_por_disciplina[atribuicao.disciplina_id],
+                diretor_nome=diretor_nome,
+            ))
+        except (FileNotFoundError, ValueError, KeyError) as exc:
+            erros.append({"turma_id": turma.id, "disciplina_id": atribuicao.disciplina_id, "erro": str(exc)})
+    return documentos, erros
+
+
+def _gerar_documentos(
+    *,
+    school,
+    generated_by,
+    professor,
+    profile,
+    turma,
+    disciplina,
+    trimestre,
+    ano_lectivo,
+    alunos,
+    notas_por_aluno,
+    diretor_nome,
+):
     total_alunos = len(alunos)
 
-    template = _select_template(user.school, DocumentTemplate.DOC_TYPE_CADERNETA, total_alunos)
+    template = _select_template(school, DocumentTemplate.DOC_TYPE_CADERNETA, total_alunos)
     template_path, template_record, faixa_fallback = _load_template_file(template, total_alunos)
     if not template_path:
         raise FileNotFoundError(
-            f"Nenhum template ativo encontrado para CADERNETA na escola {user.school}."
+            f"Nenhum template ativo encontrado para CADERNETA na escola {school}."
         )
 
     mapping = template_record.mapping if template_record else None
@@ -250,10 +401,46 @@ def gerar_caderneta_documento(
             continuation_cell="",
         )
 
-    notas_por_aluno = _collect_notes(user.school, turma, disciplina, ano_lectivo, trimestre)
+    header_values = _build_header_values(
+        profile=profile,
+        professor=professor,
+        turma=turma,
+        disciplina=disciplina,
+        ano_lectivo=ano_lectivo,
+        total_alunos=total_alunos,
+        alunos=alunos,
+        diretor_nome=diretor_nome,
+    )
 
     max_students = mapping.max_students
     parts_total = max(1, math.ceil(total_alunos / max_students))
+
+    fingerprint = _fingerprint(
+        template_key=template_cache.build_key(template_path, template_record),
+        mapping=mapping,
+        header_values=header_values,
+        alunos=alunos,
+        notas_por_aluno=notas_por_aluno,
+        trimestre=trimestre,
+    )
+    existentes = _documentos_existentes(
+        school=school,
+        turma=turma,
+        disciplina=disciplina,
+        trimestre=trimestre,
+        ano_lectivo=ano_lectivo,
+        fingerprint=fingerprint,
+        parts_total=parts_total,
+    )
+    if existentes:
+        logger.info(
+            "Caderneta reutilizada: turma=%s disciplina=%s impressao=%s",
+            turma.id,
+            disciplina.id,
+            fingerprint[:12],
+        )
+        return existentes
+
     generated = []
 
     for part_index in range(parts_total):
@@ -261,19 +448,11 @@ def gerar_caderneta_documento(
         end = start + max_students
         alunos_parte = alunos[start:end]
 
-        workbook = load_workbook(template_path)
+        workbook = template_cache.load(template_path, template_record)
         ws = _safe_sheet(workbook, mapping.sheet_name)
+        merged_index = _merged_index(ws)
 
-        header_values = _build_header_values(
-            profile=profile,
-            professor=user.docente_profile,
-            turma=turma,
-            disciplina=disciplina,
-            ano_lectivo=ano_lectivo,
-            total_alunos=total_alunos,
-            alunos=alunos,
-        )
-        _write_header(ws, mapping, header_values)
+        _write_header(ws, mapping, header_values, merged_index)
 
         if mapping.continuation_cell and parts_total > 1:
             ws[mapping.continuation_cell] = f"Parte {part_index + 1} de {parts_total}"
@@ -285,6 +464,7 @@ def gerar_caderneta_documento(
             notas_por_aluno=notas_por_aluno,
             start_row=mapping.start_row_alunos,
             max_students=max_students,
+            merged_index=merged_index,
         )
 
         filename_base = (
@@ -300,17 +480,18 @@ def gerar_caderneta_documento(
         output.seek(0)
 
         doc = GeneratedDocument(
-            school=user.school,
+            school=school,
             doc_type=DocumentTemplate.DOC_TYPE_CADERNETA,
             turma=turma,
             disciplina=disciplina,
             trimestre=trimestre,
             ano_lectivo=ano_lectivo,
-            generated_by=user,
+            generated_by=generated_by,
             parts_total=parts_total,
             part_number=part_index + 1,
             template_used=template_record,
             template_version=template_record.version if template_record else "default",
+            fingerprint=fingerprint,
         )
         doc.file.save(filename, ContentFile(output.read()), save=False)
         doc.save()
@@ -325,3 +506,62 @@ def gerar_caderneta_documento(
         )
 
     return generated
+
+
+MAPPING_FIELDS = (
+    "sheet_name",
+    "header_cells",
+    "start_row_alunos",
+    "max_students",
+    "grade_columns",
+    "student_columns",
+    "continuation_cell",
+)
+
+
+def _fingerprint(*, template_key, mapping, header_values, alunos, notas_por_aluno, trimestre):
+    """
+    Impressão digital do conteúdo da caderneta: template (id, versão, mtime),
+    mapeamento, cabeçalho, dados dos alunos nas colunas mapeadas e as notas.
+    Duas gerações com a mesma impressão produzem ficheiros equivalentes.
+    """
+    digest = hashlib.sha256()
+    contexto = {
+        "template": template_key,
+        "mapping": {campo: getattr(mapping, campo, None) for campo in MAPPING_FIELDS},
+        "header": header_values,
+        "trimestre": trimestre,
+    }
+    digest.update(json.dumps(contexto, sort_keys=True, default=str).encode())
+
+    colunas = sorted(mapping.student_columns or {})
+    for aluno in alunos:
+        notas = notas_por_aluno.get(aluno.id, {})
+        linha = [
+            aluno.id,
+            [_valor_aluno(aluno, key) for key in colunas],
+            sorted((tipo, str(valor)) for tipo, valor in notas.items()),
+        ]
+        digest.update(json.dumps(linha, default=str).encode())
+    return digest.hexdigest()
+
+
+def _documentos_existentes(*, school, turma, disciplina, trimestre, ano_lectivo, fingerprint, parts_total):
+    """Devolve as partes já geradas com a mesma impressão, se estiverem todas em disco."""
+    documentos = GeneratedDocument.objects.filter(
+        school=school,
+        turma=turma,
+        disciplina=disciplina,
+        trimestre=trimestre,
+        ano_lectivo=ano_lectivo,
+        fingerprint=fingerprint,
+        parts_total=parts_total,
+    ).order_by("part_number", "-id")
+
+    por_parte = {}
+    for doc in documentos:
+        por_parte.setdefault(doc.part_number, doc)
+    partes = [por_parte.get(numero) for numero in range(1, parts_total + 1)]
+    if not all(partes) or not all(default_storage.exists(doc.file.name) for doc in partes):
+        return []
+    return partes
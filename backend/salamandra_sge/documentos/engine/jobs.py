@@ -0,0 +1,101 @@
+import logging
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from ..models import DocumentJob, DocumentTemplate
+from .caderneta import gerar_caderneta_documento, versao_template_caderneta
+
+
+logger = logging.getLogger(__name__)
+
+# Um job activo há mais tempo do que isto é dado como perdido (worker morto)
+JOB_TIMEOUT = timedelta(minutes=15)
+
+
+def dedup_key(turma, disciplina, trimestre, ano_lectivo, template_version, professor):
+    # O cabeçalho usa o perfil do professor que pede: pedidos de professores diferentes não se juntam
+    return (
+        f"{DocumentTemplate.DOC_TYPE_CADERNETA}:{turma.id}:{disciplina.id}:"
+        f"{ano_lectivo}:T{trimestre}:{template_version}:P{professor.id}"
+    )
+
+
+def _expirar_job_perdido(key):
+    limite = timezone.now() - JOB_TIMEOUT
+    DocumentJob.objects.filter(
+        dedup_key=key,
+        status__in=DocumentJob.ACTIVE_STATUSES,
+        created_at__lt=limite,
+    ).update(
+        status=DocumentJob.STATUS_FAILED,
+        error="Tempo limite excedido.",
+        finished_at=timezone.now(),
+    )
+
+
+def solicitar_caderneta(*, user, turma, disciplina, trimestre, ano_lectivo):
+    """
+    Cria (ou reaproveita) o job de geração da caderneta.
+    Devolve (job, criado). Se já existir um job em fila ou em execução para a
+    mesma turma/disciplina/trimestre, versão do template e professor, devolve esse job.
+    """
+    template_version = versao_template_caderneta(user.school, turma)
+    key = dedup_key(turma, disciplina, trimestre, ano_lectivo, template_version, user.docente_profile)
+    _expirar_job_perdido(key)
+
+    existente = DocumentJob.objects.filter(dedup_key=key, status__in=DocumentJob.ACTIVE_STATUSES).first()
+    if existente:
+        return existente, False
+
+    try:
+        with transaction.atomic():
+            job = DocumentJob.objects.create(
+                school=user.school,
+                requested_by=user,
+                turma=turma,
+                disciplina=disciplina,
+                trimestre=trimestre,
+                ano_lectivo=ano_lectivo,
+                template_version=template_version,
+                dedup_key=key,
+            )
+    except IntegrityError:
+        # Outro pedido concorrente criou o job entre a verificação e a criação
+        return DocumentJob.objects.get(dedup_key=key, status__in=DocumentJob.ACTIVE_STATUSES), False
+    return job, True
+
+
+def executar_job(job):
+    """Gera a caderneta do job, registando tempos, partes e erros."""
+    updated = DocumentJob.objects.filter(id=job.id, status=DocumentJob.STATUS_QUEUED).update(
+        status=DocumentJob.STATUS_RUNNING,
+        started_at=timezone.now(),
+    )
+    if not updated:
+        return job
+    job.refresh_from_db()
+
+    try:
+        documentos = gerar_caderneta_documento(
+            user=job.requested_by,
+            turma_id=job.turma_id,
+            disciplina_id=job.disciplina_id,
+            trimestre=job.trimestre,
+            ano_lectivo=job.ano_lectivo,
+        )
+    except Exception as exc:  # noqa: BLE001 - o erro fica registado no job
+        logger.exception("Falha no job de caderneta %s", job.id)
+        job.status = DocumentJob.STATUS_FAILED
+        job.error = str(exc)
+        job.finished_at = timezone.now()
+        job.save(update_fields=["status", "error", "finished_at"])
+        return job
+
+    job.documents.add(*documentos)
+    job.parts_total = len(documentos)
+    job.status = DocumentJob.STATUS_DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=["parts_total", "status", "finished_at"])
+    return job
@@ -0,0 +1,104 @@
+import logging
+import os
+import tempfile
+import zipfile
+
+from django.core.files import File
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from salamandra_sge.academico.models import ProfessorTurmaDisciplina, Turma
+
+from ..models import DocumentBatch
+from .caderneta import _clean_filename, gerar_cadernetas_turma
+
+
+logger = logging.getLogger(__name__)
+
+TURMAS_POR_PARTE = 5
+
+
+def turmas_do_lote(batch):
+    """Turmas abrangidas pelo escopo do lote, no ano lectivo do lote."""
+    turmas = Turma.objects.filter(school=batch.school, ano_letivo=batch.ano_lectivo)
+    if batch.scope == DocumentBatch.SCOPE_TURMA:
+        turmas = turmas.filter(id=batch.scope_id)
+    elif batch.scope == DocumentBatch.SCOPE_CLASSE:
+        turmas = turmas.filter(classe_id=batch.scope_id)
+    return turmas.order_by("classe__nome", "nome")
+
+
+def planear_lote(batch, chunk_size=TURMAS_POR_PARTE):
+    """
+    Conta as cadernetas (pares turma/disciplina atribuídos) e divide as turmas
+    em partes. Cada parte é processada por um worker, mantendo todas as
+    disciplinas de uma turma juntas para partilhar alunos e notas.
+    """
+    turma_ids = list(turmas_do_lote(batch).values_list("id", flat=True))
+    batch.total_items = ProfessorTurmaDisciplina.objects.filter(turma_id__in=turma_ids).count()
+    batch.status = DocumentBatch.STATUS_RUNNING
+    batch.started_at = timezone.now()
+    batch.save(update_fields=["total_items", "status", "started_at"])
+    return [turma_ids[i:i + chunk_size] for i in range(0, len(turma_ids), chunk_size)]
+
+
+def processar_parte(batch, turma_ids):
+    for turma in Turma.objects.filter(id__in=turma_ids).select_related("school", "classe"):
+        try:
+            documentos, erros = gerar_cadernetas_turma(
+                turma=turma,
+                trimestre=batch.trimestre,
+                ano_lectivo=batch.ano_lectivo,
+                generated_by=batch.requested_by,
+            )
+        except Exception as exc:  # noqa: BLE001 - uma turma não deve abortar o lote
+            logger.exception("Falha ao gerar cadernetas da turma %s no lote %s", turma.id, batch.id)
+            total = ProfessorTurmaDisciplina.objects.filter(turma=turma).count()
+            _registar(batch, [], [{"turma_id": turma.id, "disciplina_id": None, "erro": str(exc)}], 0, total)
+            continue
+        concluidas = len({doc.disciplina_id for doc in documentos})
+        _registar(batch, documentos, erros, concluidas, len(erros))
+
+
+def _registar(batch, documentos, erros, concluidas, falhadas):
+    with transaction.atomic():
+        if documentos:
+            batch.documents.add(*documentos)
+        DocumentBatch.objects.filter(id=batch.id).update(
+            completed_items=F("completed_items") + concluidas,
+            failed_items=F("failed_items") + falhadas,
+        )
+        if erros:
+            bloqueado = DocumentBatch.objects.select_for_update().get(id=batch.id)
+            bloqueado.errors = bloqueado.errors + erros
+            bloqueado.save(update_fields=["errors"])
+
+
+def finalizar_lote(batch):
+    """Empacota os documentos gerados num ZIP e fecha o lote."""
+    batch.refresh_from_db()
+    documentos = list(batch.documents.select_related("turma__classe").order_by("turma__nome", "file"))
+
+    if documentos:
+        with tempfile.TemporaryFile() as tmp:
+            with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+                for doc in documentos:
+                    pasta = f"{_clean_filename(doc.turma.classe.nome)}/{_clean_filename(doc.turma.nome)}"
+                    with doc.file.open("rb") as origem, bundle.open(
+                        f"{pasta}/{os.path.basename(doc.file.name)}", "w"
+                    ) as destino:
+                        for chunk in iter(lambda: origem.read(1024 * 1024), b""):
+                            destino.write(chunk)
+            tmp.seek(0)
+            batch.bundle.save(
+                f"Cadernetas_{batch.scope}_{batch.ano_lectivo}_T{batch.trimestre}_{batch.id}.zip",
+                File(tmp),
+                save=False,
+            )
+
+    falhou = batch.total_items > 0 and not documentos
+    batch.status = DocumentBatch.STATUS_FAILED if falhou else DocumentBatch.STATUS_DONE
+    batch.finished_at = timezone.now()
+    batch.save(update_fields=["bundle", "status", "finished_at"])
+    return batch
@@ -0,0 +1,117 @@
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from django.conf import settings
+from openpyxl import load_workbook
+
+
+DEFAULT_MAX_TEMPLATES = 4
+
+
+def _shell(obj):
+    """Cópia superficial sem passar pelo __copy__ (profundo) dos objetos openpyxl."""
+    clone = object.__new__(type(obj))
+    clone.__dict__.update(obj.__dict__)
+    return clone
+
+
+class _PristineTemplate:
+    """
+    Workbook de template já interpretado, guardado intacto.
+    As células/estilos ficam serializados (pickle) e as imagens, que dominam o
+    custo de cópia, são partilhadas: cada cópia recebe apenas cascas novas com
+    um buffer próprio sobre os mesmos bytes.
+    Depende de detalhes internos do openpyxl (_images, _data, _add_row/_add_column),
+    por isso a versão está fixada em requirements.txt; ao atualizá-la, o teste
+    test_template_cache_copia_igual_ao_ficheiro compara a cópia com um load_workbook.
+    """
+
+    def __init__(self, workbook):
+        dados_partilhados = {}
+        self.imagens = []
+        for ws in workbook.worksheets:
+            imagens = getattr(ws, "_images", [])
+            for img in imagens:
+                dados = img._data() if not isinstance(img.ref, BytesIO) else img.ref.getvalue()
+                img.ref = dados_partilhados.setdefault(dados, dados)
+            self.imagens.append(imagens)
+            ws._images = []
+        self.blob = pickle.dumps(workbook, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def copy(self):
+        workbook = pickle.loads(self.blob)
+        for ws, imagens in zip(workbook.worksheets, self.imagens):
+            # O pickle de DimensionHolder (defaultdict) perde a fábrica de linhas/colunas
+            ws.row_dimensions.default_factory = ws._add_row
+            ws.column_dimensions.default_factory = ws._add_column
+            copias = []
+            for img in imagens:
+                copia = _shell(img)
+                copia.anchor = _shell(img.anchor) if not isinstance(img.anchor, str) else img.anchor
+                copia.ref = BytesIO(img.ref)
+                copias.append(copia)
+            ws._images = copias
+        return workbook
+
+
+class TemplateCache:
+    """
+    Cache LRU de templates XLSX interpretados, partilhada pelo processo.
+    Evita reler e reinterpretar o mesmo ficheiro em cada parte de cada caderneta.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _limite(self):
+        if self.max_size is not None:
+            return self.max_size
+        return getattr(settings, "CADERNETA_TEMPLATE_CACHE_SIZE", DEFAULT_MAX_TEMPLATES)
+
+    @staticmethod
+    def build_key(path, template_record=None):
+        """
+        Templates da escola: id + versão (+ ficheiro); templates por omissão:
+        caminho. O mtime do ficheiro entra sempre, para apanhar substituições.
+        """
+        mtime = os.path.getmtime(path)
+        if template_record is not None:
+            return ("template", template_record.id, template_record.version, template_record.template_file.name, mtime)
+        return ("default", os.path.abspath(path), mtime)
+
+    def load(self, path, template_record=None):
+        """Devolve uma cópia pronta a editar do template em `path`."""
+        key = self.build_key(path, template_record)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is None:
+            entry = _PristineTemplate(load_workbook(path))
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > max(self._limite(), 1):
+                    self._entries.popitem(last=False)
+        return entry.copy()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+template_cache = TemplateCache()
@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from salamandra_sge.documentos.models import DocumentBatch, GeneratedDocument
+
+
+PASTAS = ("generated_documents", "document_bundles")
+
+
+def _listar(pasta):
+    if not default_storage.exists(pasta):
+        return
+    subpastas, ficheiros = default_storage.listdir(pasta)
+    for nome in ficheiros:
+        yield f"{pasta}/{nome}"
+    for subpasta in subpastas:
+        yield from _listar(f"{pasta}/{subpasta}")
+
+
+class Command(BaseCommand):
+    help = "Remove ficheiros de documentos gerados que já não pertencem a nenhum registo."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Apenas listar, sem remover")
+        parser.add_argument(
+            '--min-idade-horas',
+            type=int,
+            default=1,
+            dest='min_idade_horas',
+            help="Ignorar ficheiros mais recentes (gravações em curso)",
+        )
+
+    def handle(self, *args, **options):
+        referenciados = set(GeneratedDocument.objects.values_list('file', flat=True))
+        referenciados.update(DocumentBatch.objects.exclude(bundle='').values_list('bundle', flat=True))
+        limite = timezone.now() - timedelta(hours=options['min_idade_horas'])
+
+        removidos = 0
+        for pasta in PASTAS:
+            for nome in _listar(pasta):
+                if nome in referenciados or default_storage.get_modified_time(nome) > limite:
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(nome)
+                else:
+                    default_storage.delete(nome)
+                removidos += 1
+
+        acao = "a remover" if options['dry_run'] else "removidos"
+        self.stdout.write(self.style.SUCCESS(f"{removidos} ficheiros órfãos {acao}."))
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_school_current_period'),
+        ('documentos', '0002_alter_documenttemplate_faixa_alunos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('TURMA', 'Turma'), ('CLASSE', 'Classe'), ('ESCOLA', 'Escola')], max_length=10)),
+                ('scope_id', models.IntegerField(blank=True, null=True)),
+                ('trimestre', models.IntegerField()),
+                ('ano_lectivo', models.IntegerField()),
+                ('status', models.CharField(choices=[('QUEUED', 'Em fila'), ('RUNNING', 'Em execução'), ('DONE', 'Concluído'), ('FAILED', 'Falhou')], default='QUEUED', max_length=10)),
+                ('total_items', models.PositiveIntegerField(default=0)),
+                ('completed_items', models.PositiveIntegerField(default=0)),
+                ('failed_items', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('bundle', models.FileField(blank=True, upload_to='document_bundles/')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('documents', models.ManyToManyField(blank=True, related_name='batches', to='documentos.generateddocument')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='document_batches', to=settings.AUTH_USER_MODEL)),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_batches', to='core.school')),
+            ],
+            options={
+                'verbose_name': 'Lote de Documentos',
+                'verbose_name_plural': 'Lotes de Documentos',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
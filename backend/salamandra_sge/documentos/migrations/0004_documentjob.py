@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academico', '0013_alter_disciplina_options'),
+        ('core', '0006_school_current_period'),
+        ('documentos', '0003_documentbatch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(choices=[('CADERNETA', 'Caderneta'), ('PAUTA', 'Pauta')], default='CADERNETA', max_length=30)),
+                ('trimestre', models.IntegerField()),
+                ('ano_lectivo', models.IntegerField()),
+                ('template_version', models.CharField(blank=True, max_length=60)),
+                ('dedup_key', models.CharField(db_index=True, max_length=200)),
+                ('status', models.CharField(choices=[('QUEUED', 'Em fila'), ('RUNNING', 'Em execução'), ('DONE', 'Concluído'), ('FAILED', 'Falhou')], default='QUEUED', max_length=10)),
+                ('parts_total', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('disciplina', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_jobs', to='academico.disciplina')),
+                ('documents', models.ManyToManyField(blank=True, related_name='jobs', to='documentos.generateddocument')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='document_jobs', to=settings.AUTH_USER_MODEL)),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_jobs', to='core.school')),
+                ('turma', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_jobs', to='academico.turma')),
+            ],
+            options={
+                'verbose_name': 'Job de Documento',
+                'verbose_name_plural': 'Jobs de Documentos',
+                'ordering': ['-created_at'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['QUEUED', 'RUNNING'])), fields=('dedup_key',), name='documentos_job_ativo_unico')],
+            },
+        ),
+    ]
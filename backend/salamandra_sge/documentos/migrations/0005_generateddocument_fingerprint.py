@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documentos', '0004_documentjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generateddocument',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -202,6 +202,7 @@ class GeneratedDocument(models.Model):
         related_name="generated_documents",
     )
     template_version = models.CharField(max_length=40, blank=True)
+    fingerprint = models.CharField(max_length=64, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -211,3 +212,132 @@ class GeneratedDocument(models.Model):
 
     def __str__(self):
         return f"{self.doc_type} {self.turma} ({self.created_at.date()})"
+
+
+class DocumentBatch(models.Model):
+    """Geração em lote de cadernetas (turma, classe ou escola) com pacote ZIP."""
+
+    SCOPE_TURMA = "TURMA"
+    SCOPE_CLASSE = "CLASSE"
+    SCOPE_ESCOLA = "ESCOLA"
+    SCOPE_CHOICES = [
+        (SCOPE_TURMA, "Turma"),
+        (SCOPE_CLASSE, "Classe"),
+        (SCOPE_ESCOLA, "Escola"),
+    ]
+
+    STATUS_QUEUED = "QUEUED"
+    STATUS_RUNNING = "RUNNING"
+    STATUS_DONE = "DONE"
+    STATUS_FAILED = "FAILED"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Em fila"),
+        (STATUS_RUNNING, "Em execução"),
+        (STATUS_DONE, "Concluído"),
+        (STATUS_FAILED, "Falhou"),
+    ]
+
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name="document_batches")
+    requested_by = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="document_batches",
+    )
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    scope_id = models.IntegerField(null=True, blank=True)
+    trimestre = models.IntegerField()
+    ano_lectivo = models.IntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    total_items = models.PositiveIntegerField(default=0)
+    completed_items = models.PositiveIntegerField(default=0)
+    failed_items = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    documents = models.ManyToManyField(GeneratedDocument, blank=True, related_name="batches")
+    bundle = models.FileField(upload_to="document_bundles/", blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Lote de Documentos"
+        verbose_name_plural = "Lotes de Documentos"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"Lote {self.scope} {self.scope_id or ''} T{self.trimestre}/{self.ano_lectivo} ({self.status})"
+
+    @property
+    def progress(self):
+        if not self.total_items:
+            return 100 if self.status == self.STATUS_DONE else 0
+        return int((self.completed_items + self.failed_items) * 100 / self.total_items)
+
+
+class DocumentJob(models.Model):
+    """
+    Geração assíncrona de uma caderneta (turma/disciplina/trimestre).
+    Pedidos iguais em curso, para a mesma versão do template, partilham o mesmo job.
+    """
+
+    STATUS_QUEUED = DocumentBatch.STATUS_QUEUED
+    STATUS_RUNNING = DocumentBatch.STATUS_RUNNING
+    STATUS_DONE = DocumentBatch.STATUS_DONE
+    STATUS_FAILED = DocumentBatch.STATUS_FAILED
+    STATUS_CHOICES = DocumentBatch.STATUS_CHOICES
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name="document_jobs")
+    requested_by = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="document_jobs",
+    )
+    doc_type = models.CharField(
+        max_length=30,
+        choices=DocumentTemplate.DOC_TYPE_CHOICES,
+        default=DocumentTemplate.DOC_TYPE_CADERNETA,
+    )
+    turma = models.ForeignKey(Turma, on_delete=models.CASCADE, related_name="document_jobs")
+    disciplina = models.ForeignKey(Disciplina, on_delete=models.CASCADE, related_name="document_jobs")
+    trimestre = models.IntegerField()
+    ano_lectivo = models.IntegerField()
+    template_version = models.CharField(max_length=60, blank=True)
+    dedup_key = models.CharField(max_length=200, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    parts_total = models.PositiveIntegerField(default=0)
+    documents = models.ManyToManyField(GeneratedDocument, blank=True, related_name="jobs")
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Job de Documento"
+        verbose_name_plural = "Jobs de Documentos"
+        ordering = ["-created_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dedup_key"],
+                condition=Q(status__in=["QUEUED", "RUNNING"]),
+                name="documentos_job_ativo_unico",
+            )
+        ]
+
+    def __str__(self):
+        return f"Job {self.doc_type} {self.turma} T{self.trimestre}/{self.ano_lectivo} ({self.status})"
+
+    @property
+    def wait_seconds(self):
+        if not self.started_at:
+            return None
+        return (self.started_at - self.created_at).total_seconds()
+
+    @property
+    def run_seconds(self):
+        if not (self.started_at and self.finished_at):
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from .models import ProfessorProfile
+from .models import DocumentBatch, DocumentJob, ProfessorProfile
 
 
 class ProfessorProfileSerializer(serializers.ModelSerializer):
@@ -22,3 +22,85 @@ class CadernetaGenerateSerializer(serializers.Serializer):
     disciplina_id = serializers.IntegerField()
     trimestre = serializers.IntegerField()
     ano_lectivo = serializers.IntegerField(required=False)
+
+
+class CadernetaBatchSerializer(serializers.Serializer):
+    scope = serializers.ChoiceField(choices=DocumentBatch.SCOPE_CHOICES)
+    scope_id = serializers.IntegerField(required=False)
+    trimestre = serializers.IntegerField(min_value=1, max_value=3)
+    ano_lectivo = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if attrs["scope"] != DocumentBatch.SCOPE_ESCOLA and not attrs.get("scope_id"):
+            raise serializers.ValidationError({"scope_id": "Campo obrigatório para este escopo."})
+        return attrs
+
+
+class DocumentBatchSerializer(serializers.ModelSerializer):
+    progress = serializers.IntegerField(read_only=True)
+    bundle_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DocumentBatch
+        fields = [
+            "id",
+            "scope",
+            "scope_id",
+            "trimestre",
+            "ano_lectivo",
+            "status",
+            "progress",
+            "total_items",
+            "completed_items",
+            "failed_items",
+            "errors",
+            "bundle_url",
+            "created_at",
+            "started_at",
+            "finished_at",
+        ]
+
+    def get_bundle_url(self, obj):
+        return obj.bundle.url if obj.bundle else None
+
+
+class GeneratedDocumentLinkSerializer(serializers.Serializer):
+    document_id = serializers.IntegerField(source="id")
+    file_url = serializers.SerializerMethodField()
+    part_number = serializers.IntegerField()
+    parts_total = serializers.IntegerField()
+
+    def get_file_url(self, obj):
+        return obj.file.url
+
+
+class DocumentJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.IntegerField(source="id", read_only=True)
+    wait_seconds = serializers.FloatField(read_only=True)
+    run_seconds = serializers.FloatField(read_only=True)
+    documents = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DocumentJob
+        fields = [
+            "job_id",
+            "turma",
+            "disciplina",
+            "trimestre",
+            "ano_lectivo",
+            "template_version",
+            "status",
+            "parts_total",
+            "documents",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+            "wait_seconds",
+            "run_seconds",
+        ]
+
+    def get_documents(self, obj):
+        if obj.status != DocumentJob.STATUS_DONE:
+            return []
+        return GeneratedDocumentLinkSerializer(obj.documents.order_by("part_number"), many=True).data
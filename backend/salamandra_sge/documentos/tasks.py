@@ -0,0 +1,38 @@
+from celery import chord, shared_task
+
+from .engine.jobs import executar_job
+from .engine.lote import finalizar_lote, planear_lote, processar_parte
+from .models import DocumentBatch, DocumentJob
+
+
+@shared_task
+def gerar_lote_cadernetas(batch_id):
+    """Divide o lote em partes processadas em paralelo e empacota no fim."""
+    batch = DocumentBatch.objects.select_related("school").get(id=batch_id)
+    partes = planear_lote(batch)
+    if not partes:
+        finalizar_lote(batch)
+        return {"batch_id": batch_id, "partes": 0}
+    chord(
+        gerar_lote_cadernetas_parte.s(batch_id, turma_ids) for turma_ids in partes
+    )(finalizar_lote_cadernetas.si(batch_id))
+    return {"batch_id": batch_id, "partes": len(partes)}
+
+
+@shared_task
+def gerar_lote_cadernetas_parte(batch_id, turma_ids):
+    batch = DocumentBatch.objects.select_related("requested_by").get(id=batch_id)
+    processar_parte(batch, turma_ids)
+    return len(turma_ids)
+
+
+@shared_task
+def finalizar_lote_cadernetas(batch_id):
+    batch = finalizar_lote(DocumentBatch.objects.get(id=batch_id))
+    return {"batch_id": batch_id, "status": batch.status}
+
+
+@shared_task
+def gerar_caderneta_job(job_id):
+    job = executar_job(DocumentJob.objects.select_related("requested_by").get(id=job_id))
+    return {"job_id": job_id, "status": job.status}
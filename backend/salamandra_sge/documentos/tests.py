@@ -1,16 +1,33 @@
 import tempfile
+import zipfile
 from datetime import date
-from io import BytesIO
+from io import BytesIO, StringIO
 
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import TestCase, override_settings
 from openpyxl import Workbook, load_workbook
+from openpyxl.drawing.image import Image as XLImage
+from PIL import Image
 from rest_framework.test import APIClient
 
 from core.models import CustomUser, District, School
-from salamandra_sge.academico.models import Aluno, Classe, Disciplina, Professor, Turma, ProfessorTurmaDisciplina
-from salamandra_sge.documentos.engine.caderneta import gerar_caderneta_documento
-from salamandra_sge.documentos.models import DocumentTemplate, ProfessorProfile, TemplateMapping
+from salamandra_sge.avaliacoes.models import Nota
+from salamandra_sge.academico.models import Aluno, Classe, DirectorTurma, Disciplina, Professor, Turma, ProfessorTurmaDisciplina
+from salamandra_sge.documentos.engine.caderneta import _merged_index, _safe_set_cell, gerar_caderneta_documento
+from salamandra_sge.documentos.engine.template_cache import TemplateCache, template_cache
+from salamandra_sge.celery import app
+from salamandra_sge.documentos.engine.jobs import executar_job
+from salamandra_sge.documentos.models import (
+    DocumentBatch,
+    DocumentJob,
+    DocumentTemplate,
+    ProfessorProfile,
+    TemplateMapping,
+)
 
 
 def _make_template_file():
@@ -27,6 +44,7 @@ def _make_template_file():
 @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
 class CadernetaEngineTests(TestCase):
     def setUp(self):
+        template_cache.clear()
         self.district = District.objects.create(name="Maputo")
         self.school = School.objects.create(name="Escola X", district=self.district)
         self.user = CustomUser.objects.create_user(
@@ -179,3 +197,252 @@ class CadernetaEngineTests(TestCase):
         wb = load_workbook(docs[0].file.path)
         ws = wb.active
         self.assertEqual(ws["D2"].value, "=SUM(A2:B2)")
+
+    def test_template_cache_reutiliza_workbook(self):
+        template = self._create_template(50)
+        self._add_alunos(101)
+        gerar = lambda: gerar_caderneta_documento(
+            user=self.user,
+            turma_id=self.turma.id,
+            disciplina_id=self.disciplina.id,
+            trimestre=1,
+            ano_lectivo=2024,
+        )
+        docs = gerar()
+        self.assertEqual((template_cache.misses, template_cache.hits), (1, 2))
+        # Cada parte recebe uma cópia independente do template
+        self.assertEqual(load_workbook(docs[0].file.path).active["C2"].value, "Aluno 0")
+        self.assertEqual(load_workbook(docs[1].file.path).active["C2"].value, "Aluno 50")
+        self.assertEqual(load_workbook(docs[2].file.path).active["C3"].value, None)
+
+        template.version = "2"
+        template.save()
+        gerar()
+        self.assertEqual((template_cache.misses, template_cache.hits), (2, 4))
+
+    def test_template_cache_copia_igual_ao_ficheiro(self):
+        # A cópia usa detalhes internos do openpyxl (versão fixada em requirements.txt):
+        # depois de gravada tem de ser igual a um load_workbook do mesmo template
+        wb = Workbook()
+        ws = wb.active
+        ws.merge_cells("A1:F1")
+        ws.merge_cells("B3:B5")
+        ws.row_dimensions[1].height = 32
+        ws.row_dimensions[4].hidden = True
+        for ancora, cor in (("H1", "red"), ("H10", "blue")):
+            png = BytesIO()
+            Image.new("RGB", (8, 8), cor).save(png, format="PNG")
+            ws.add_image(XLImage(png), ancora)
+        caminho = f"{tempfile.mkdtemp()}/template.xlsx"
+        wb.save(caminho)
+
+        cache_local = TemplateCache(max_size=1)
+        cache_local.load(caminho)
+
+        def gravar_e_reabrir(wb):
+            ws = wb.worksheets[0]
+            ws["C10"] = "Aluno 1"
+            ws.row_dimensions[200].hidden = True
+            buffer = BytesIO()
+            wb.save(buffer)
+            buffer.seek(0)
+            return load_workbook(buffer)
+
+        copia = gravar_e_reabrir(cache_local.load(caminho))
+        fresco = gravar_e_reabrir(load_workbook(caminho))
+        self.assertEqual(cache_local.hits, 1)
+        self.assertEqual(len(copia.worksheets), len(fresco.worksheets))
+        for ws_copia, ws_fresco in zip(copia.worksheets, fresco.worksheets):
+            self.assertEqual(
+                sorted(map(str, ws_copia.merged_cells.ranges)),
+                sorted(map(str, ws_fresco.merged_cells.ranges)),
+            )
+            linhas = lambda ws: {i: (d.height, d.hidden) for i, d in ws.row_dimensions.items()}
+            self.assertEqual(linhas(ws_copia), linhas(ws_fresco))
+            self.assertTrue(ws_copia.row_dimensions[200].hidden)
+            ancoras = lambda ws: [(img.anchor._from.row, img.anchor._from.col) for img in ws._images]
+            self.assertEqual(ancoras(ws_copia), ancoras(ws_fresco))
+            self.assertEqual(len(ws_copia._images), 2)
+            self.assertEqual(ws_copia.row_dimensions[1].height, 32)
+            self.assertEqual(ws_copia["C10"].value, ws_fresco["C10"].value)
+
+    def test_merged_index_escreve_na_ancora(self):
+        ws = Workbook().active
+        ws.merge_cells("B2:D3")
+        index = _merged_index(ws)
+        self.assertEqual(index["C3"], "B2")
+        self.assertNotIn("A1", index)
+
+        _safe_set_cell(ws, "D3", "valor", index)
+        _safe_set_cell(ws, "A1", "livre", index)
+        self.assertEqual(ws["B2"].value, "valor")
+        self.assertEqual(ws["A1"].value, "livre")
+
+    def test_lote_cadernetas_classe(self):
+        self._create_template(50)
+        self._add_alunos(3)
+        fisica = Disciplina.objects.create(school=self.school, nome="Fisica")
+        ProfessorTurmaDisciplina.objects.create(
+            school=self.school,
+            professor=self.professor,
+            turma=self.turma,
+            disciplina=fisica,
+        )
+        dap = CustomUser.objects.create_user(
+            email="dap@example.com",
+            password="pass",
+            role="DAP",
+            school=self.school,
+        )
+        eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, "task_always_eager", eager)
+
+        client = APIClient()
+        client.force_authenticate(dap)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                "/api/documentos/caderneta/lote/",
+                {"scope": "CLASSE", "scope_id": self.classe.id, "trimestre": 1, "ano_lectivo": 2024},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 202)
+
+        status_response = client.get(f"/api/documentos/caderneta/lote/{response.data['id']}/")
+        self.assertEqual(status_response.data["status"], DocumentBatch.STATUS_DONE)
+        self.assertEqual(status_response.data["progress"], 100)
+        self.assertEqual(status_response.data["total_items"], 2)
+        self.assertEqual(status_response.data["errors"], [])
+
+        download = client.get(f"/api/documentos/caderneta/lote/{response.data['id']}/download/")
+        self.assertEqual(download.status_code, 200)
+        with zipfile.ZipFile(BytesIO(b"".join(download.streaming_content))) as bundle:
+            nomes = bundle.namelist()
+        self.assertEqual(len(nomes), 2)
+        self.assertTrue(all(nome.startswith("10a/a/") for nome in nomes))
+        # As duas disciplinas da turma partilham o mesmo template interpretado
+        self.assertEqual(template_cache.misses, 1)
+
+    def test_lote_rejeita_turma_de_outra_escola(self):
+        outra = School.objects.create(name="Escola Y", district=self.district)
+        dap = CustomUser.objects.create_user(email="dap@example.com", password="pass", role="DAP", school=outra)
+        client = APIClient()
+        client.force_authenticate(dap)
+        response = client.post(
+            "/api/documentos/caderneta/lote/",
+            {"scope": "TURMA", "scope_id": self.turma.id, "trimestre": 1},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_geracao_assincrona_e_coalescencia(self):
+        self._create_template(50)
+        self._add_alunos(60)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        payload = {"turma_id": self.turma.id, "disciplina_id": self.disciplina.id, "trimestre": 1}
+
+        primeiro = client.post("/api/documentos/caderneta/gerar/async/", payload, format="json")
+        segundo = client.post("/api/documentos/caderneta/gerar/async/", payload, format="json")
+        self.assertEqual(primeiro.status_code, 202)
+        self.assertEqual(primeiro.data["status"], DocumentJob.STATUS_QUEUED)
+        self.assertFalse(primeiro.data["coalesced"])
+        self.assertTrue(segundo.data["coalesced"])
+        self.assertEqual(primeiro.data["job_id"], segundo.data["job_id"])
+        self.assertEqual(DocumentJob.objects.count(), 1)
+
+        executar_job(DocumentJob.objects.get(id=primeiro.data["job_id"]))
+        estado = client.get(f"/api/documentos/jobs/{primeiro.data['job_id']}/")
+        self.assertEqual(estado.data["status"], DocumentJob.STATUS_DONE)
+        self.assertEqual(estado.data["parts_total"], 2)
+        self.assertEqual([d["part_number"] for d in estado.data["documents"]], [1, 2])
+        self.assertIsNotNone(estado.data["run_seconds"])
+
+        # Concluído o job, um novo pedido volta a gerar
+        terceiro = client.post("/api/documentos/caderneta/gerar/async/", payload, format="json")
+        self.assertFalse(terceiro.data["coalesced"])
+
+        # O director de turma tem o seu próprio job: o cabeçalho usa o perfil de quem pede
+        outro_user = CustomUser.objects.create_user(
+            email="prof2@example.com", password="pass", first_name="Outro", last_name="Prof",
+            role="PROFESSOR", school=self.school,
+        )
+        outro = Professor.objects.create(user=outro_user, school=self.school)
+        DirectorTurma.objects.create(school=self.school, professor=outro, turma=self.turma, ano_letivo=2024)
+        ProfessorProfile.objects.create(
+            professor=outro, area_formacao="Letras", nivel_academico="Licenciatura", contacto="5678"
+        )
+        client.force_authenticate(outro_user)
+        quarto = client.post("/api/documentos/caderneta/gerar/async/", payload, format="json")
+        self.assertEqual(quarto.status_code, 202)
+        self.assertFalse(quarto.data["coalesced"])
+        self.assertNotEqual(quarto.data["job_id"], terceiro.data["job_id"])
+
+    def test_geracao_assincrona_executa_no_worker(self):
+        self._create_template(50)
+        self._add_alunos(3)
+        eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, "task_always_eager", eager)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                "/api/documentos/caderneta/gerar/async/",
+                {"turma_id": self.turma.id, "disciplina_id": self.disciplina.id, "trimestre": 1},
+                format="json",
+            )
+        job = DocumentJob.objects.get(id=response.data["job_id"])
+        self.assertEqual(job.status, DocumentJob.STATUS_DONE)
+        self.assertEqual(job.documents.count(), 1)
+
+    def test_reutiliza_documentos_sem_alteracoes(self):
+        self._create_template(50)
+        aluno = self._add_alunos(2)[0]
+        gerar = lambda: gerar_caderneta_documento(
+            user=self.user,
+            turma_id=self.turma.id,
+            disciplina_id=self.disciplina.id,
+            trimestre=1,
+            ano_lectivo=2024,
+        )
+        primeiro = gerar()
+        self.assertEqual([doc.id for doc in gerar()], [doc.id for doc in primeiro])
+        self.assertEqual(len(primeiro[0].fingerprint), 64)
+
+        Nota.objects.create(
+            school=self.school,
+            aluno=aluno,
+            turma=self.turma,
+            disciplina=self.disciplina,
+            tipo="ACS1",
+            trimestre=1,
+            ano_letivo=2024,
+            valor=14,
+        )
+        novo = gerar()
+        self.assertNotEqual(novo[0].id, primeiro[0].id)
+        self.assertEqual(load_workbook(novo[0].file.path).active["A2"].value, 14)
+
+        # Ficheiro apagado do armazenamento: volta a gerar
+        default_storage.delete(novo[0].file.name)
+        self.assertNotEqual(gerar()[0].id, novo[0].id)
+
+    def test_limpar_documentos_orfaos(self):
+        self._create_template(50)
+        self._add_alunos(1)
+        doc = gerar_caderneta_documento(
+            user=self.user,
+            turma_id=self.turma.id,
+            disciplina_id=self.disciplina.id,
+            trimestre=1,
+            ano_lectivo=2024,
+        )[0]
+        orfao = default_storage.save("generated_documents/orfao.xlsx", ContentFile(b"x"))
+
+        call_command("limpar_documentos_orfaos", "--dry-run", "--min-idade-horas", "0", stdout=StringIO())
+        self.assertTrue(default_storage.exists(orfao))
+
+        call_command("limpar_documentos_orfaos", "--min-idade-horas", "0", stdout=StringIO())
+        self.assertFalse(default_storage.exists(orfao))
+        self.assertTrue(default_storage.exists(doc.file.name))
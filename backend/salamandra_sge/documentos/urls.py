@@ -1,7 +1,12 @@
 from django.urls import path
 
 from .views import (
+    CadernetaBatchDownloadView,
+    CadernetaBatchStatusView,
+    CadernetaBatchView,
+    CadernetaGenerateAsyncView,
     CadernetaGenerateView,
+    DocumentJobStatusView,
     DocumentDownloadView,
     ProfessorProfileStatusView,
     ProfessorProfileView,
@@ -11,5 +16,14 @@ urlpatterns = [
     path("me/profile-status/", ProfessorProfileStatusView.as_view(), name="profile-status"),
     path("me/profile/", ProfessorProfileView.as_view(), name="profile"),
     path("documentos/caderneta/gerar/", CadernetaGenerateView.as_view(), name="caderneta-gerar"),
+    path("documentos/caderneta/gerar/async/", CadernetaGenerateAsyncView.as_view(), name="caderneta-gerar-async"),
+    path("documentos/jobs/<int:job_id>/", DocumentJobStatusView.as_view(), name="document-job-status"),
+    path("documentos/caderneta/lote/", CadernetaBatchView.as_view(), name="caderneta-lote"),
+    path("documentos/caderneta/lote/<int:batch_id>/", CadernetaBatchStatusView.as_view(), name="caderneta-lote-status"),
+    path(
+        "documentos/caderneta/lote/<int:batch_id>/download/",
+        CadernetaBatchDownloadView.as_view(),
+        name="caderneta-lote-download",
+    ),
     path("documentos/<int:doc_id>/download/", DocumentDownloadView.as_view(), name="document-download"),
 ]
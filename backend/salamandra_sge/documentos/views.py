@@ -1,3 +1,4 @@
+from django.db import transaction
 from django.http import FileResponse
 from rest_framework import status
 from rest_framework.exceptions import PermissionDenied, ValidationError, NotFound
@@ -5,12 +6,27 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from salamandra_sge.accounts.permissions import IsProfessor, IsSchoolNotBlocked
+from salamandra_sge.accounts.permissions import (
+    IsAdminEscola,
+    IsAdministrativo,
+    IsDAP,
+    IsProfessor,
+    IsSchoolNotBlocked,
+)
+from salamandra_sge.academico.models import Classe, Disciplina, Turma
 from salamandra_sge.relatorios.services import ReportService
 
-from .engine.caderneta import gerar_caderneta_documento
-from .models import GeneratedDocument, ProfessorProfile
-from .serializers import CadernetaGenerateSerializer, ProfessorProfileSerializer
+from .engine.caderneta import gerar_caderneta_documento, validar_pedido_caderneta
+from .engine.jobs import solicitar_caderneta
+from .models import DocumentBatch, DocumentJob, GeneratedDocument, ProfessorProfile
+from .serializers import (
+    CadernetaBatchSerializer,
+    CadernetaGenerateSerializer,
+    DocumentBatchSerializer,
+    DocumentJobSerializer,
+    ProfessorProfileSerializer,
+)
+from .tasks import gerar_caderneta_job, gerar_lote_cadernetas
 
 
 class ProfessorProfileStatusView(APIView):
@@ -97,6 +113,60 @@ class CadernetaGenerateView(APIView):
         )
 
 
+class CadernetaGenerateAsyncView(APIView):
+    """
+    Variante assíncrona de CadernetaGenerateView: valida o pedido, enfileira a
+    geração e devolve 202 com o id do job. Pedidos iguais em curso partilham o job.
+    """
+    permission_classes = [IsAuthenticated, IsProfessor, IsSchoolNotBlocked]
+
+    def post(self, request):
+        serializer = CadernetaGenerateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        try:
+            turma, disciplina, _ = validar_pedido_caderneta(
+                user=request.user,
+                turma_id=data["turma_id"],
+                disciplina_id=data["disciplina_id"],
+            )
+        except (Turma.DoesNotExist, Disciplina.DoesNotExist) as exc:
+            raise NotFound("Turma ou disciplina não encontrada.") from exc
+        except PermissionError as exc:
+            raise PermissionDenied(str(exc)) from exc
+
+        job, criado = solicitar_caderneta(
+            user=request.user,
+            turma=turma,
+            disciplina=disciplina,
+            trimestre=data["trimestre"],
+            ano_lectivo=data.get("ano_lectivo") or turma.ano_letivo,
+        )
+        if criado:
+            transaction.on_commit(lambda: gerar_caderneta_job.delay(job.id))
+
+        payload = DocumentJobSerializer(job).data
+        payload["coalesced"] = not criado
+        return Response(payload, status=status.HTTP_202_ACCEPTED)
+
+
+class DocumentJobStatusView(APIView):
+    permission_classes = [IsAuthenticated, IsSchoolNotBlocked]
+
+    def get(self, request, job_id):
+        try:
+            job = DocumentJob.objects.select_related("turma", "disciplina").get(
+                id=job_id, school=request.user.school
+            )
+        except DocumentJob.DoesNotExist:
+            raise NotFound("Job não encontrado.")
+
+        if not ReportService._can_view_caderneta(request.user, job.turma, job.disciplina):
+            raise PermissionDenied("Sem permissão para consultar este job.")
+        return Response(DocumentJobSerializer(job).data)
+
+
 class DocumentDownloadView(APIView):
     permission_classes = [IsAuthenticated, IsSchoolNotBlocked]
 
@@ -114,3 +184,68 @@ class DocumentDownloadView(APIView):
         response = FileResponse(document.file.open("rb"), as_attachment=True)
         response["Content-Disposition"] = f'attachment; filename="{document.file.name.split("/")[-1]}"'
         return response
+
+
+class CadernetaBatchView(APIView):
+    """
+    Gera em segundo plano todas as cadernetas de uma turma, classe ou escola.
+    Devolve o id do lote para acompanhar o progresso e baixar o ZIP.
+    """
+    permission_classes = [IsAuthenticated, IsAdminEscola | IsDAP | IsAdministrativo, IsSchoolNotBlocked]
+
+    def post(self, request):
+        serializer = CadernetaBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        school = request.user.school
+
+        scope_id = data.get("scope_id") if data["scope"] != DocumentBatch.SCOPE_ESCOLA else None
+        ano_lectivo = data.get("ano_lectivo") or school.current_ano_letivo
+        if data["scope"] == DocumentBatch.SCOPE_TURMA:
+            turma = Turma.objects.filter(id=scope_id, school=school).first()
+            if not turma:
+                raise NotFound("Turma não encontrada.")
+            ano_lectivo = data.get("ano_lectivo") or turma.ano_letivo
+        elif data["scope"] == DocumentBatch.SCOPE_CLASSE:
+            if not Classe.objects.filter(id=scope_id, school=school).exists():
+                raise NotFound("Classe não encontrada.")
+        if not ano_lectivo:
+            raise ValidationError({"ano_lectivo": "Ano lectivo não definido."})
+
+        batch = DocumentBatch.objects.create(
+            school=school,
+            requested_by=request.user,
+            scope=data["scope"],
+            scope_id=scope_id,
+            trimestre=data["trimestre"],
+            ano_lectivo=ano_lectivo,
+        )
+        transaction.on_commit(lambda: gerar_lote_cadernetas.delay(batch.id))
+        return Response(DocumentBatchSerializer(batch).data, status=status.HTTP_202_ACCEPTED)
+
+
+class CadernetaBatchStatusView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminEscola | IsDAP | IsAdministrativo, IsSchoolNotBlocked]
+
+    def get(self, request, batch_id):
+        try:
+            batch = DocumentBatch.objects.get(id=batch_id, school=request.user.school)
+        except DocumentBatch.DoesNotExist:
+            raise NotFound("Lote não encontrado.")
+        return Response(DocumentBatchSerializer(batch).data)
+
+
+class CadernetaBatchDownloadView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminEscola | IsDAP | IsAdministrativo, IsSchoolNotBlocked]
+
+    def get(self, request, batch_id):
+        try:
+            batch = DocumentBatch.objects.get(id=batch_id, school=request.user.school)
+        except DocumentBatch.DoesNotExist:
+            raise NotFound("Lote não encontrado.")
+        if not batch.bundle:
+            raise NotFound("Pacote ainda não disponível.")
+
+        response = FileResponse(batch.bundle.open("rb"), as_attachment=True)
+        response["Content-Disposition"] = f'attachment; filename="{batch.bundle.name.split("/")[-1]}"'
+        return response
@@ -0,0 +1,293 @@
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, Q, Sum
+from django.utils import timezone
+
+from core.models import School
+from salamandra_sge.academico.models import Aluno, Professor, DelegadoDisciplina, Turma
+from salamandra_sge.administrativo.models import Funcionario
+from salamandra_sge.avaliacoes.models import Nota, ResumoTrimestral, TurmaEstatistica
+
+
+class DashboardService:
+    """
+    Dashboard do Director calculado com poucas queries agregadas
+    e guardado em cache por escola durante um curto período.
+    """
+
+    CACHE_TTL = 120
+
+    @staticmethod
+    def cache_key(school_id):
+        return f"dashboard:escola:{school_id}"
+
+    @classmethod
+    def invalidar(cls, school_id):
+        cache.delete(cls.cache_key(school_id))
+
+    @staticmethod
+    def _percentagem(linha):
+        if not linha or not linha['total']:
+            return 0.0
+        return float(linha['aprovados'] / linha['total'] * 100)
+
+    @classmethod
+    def get_dashboard(cls, school):
+        key = cls.cache_key(school.id)
+        data = cache.get(key)
+        if data is None:
+            data = cls.calcular(school)
+            cache.set(key, data, timeout=cls.CACHE_TTL)
+        return data
+
+    @classmethod
+    def calcular(cls, school):
+        total_alunos = Aluno.objects.filter(school=school, ativo=True).count()
+        total_professores = Professor.objects.filter(school=school).count()
+        total_tecnicos = Funcionario.objects.filter(school=school).count()
+
+        # Percentagem de notas >= 10, agrupada por classe, turma e disciplina
+        notas = Nota.objects.filter(school=school)
+        contagem = {
+            'total': Count('id'),
+            'aprovados': Count('id', filter=Q(valor__gte=10)),
+        }
+        por_classe = {
+            row['aluno__classe_atual']: row
+            for row in notas.values('aluno__classe_atual').annotate(**contagem)
+        }
+        por_turma = {
+            row['aluno__turma_atual']: row
+            for row in notas.values('aluno__turma_atual').annotate(**contagem)
+        }
+        por_disciplina = {
+            row['disciplina']: row
+            for row in notas.values('disciplina').annotate(**contagem)
+        }
+
+        estatisticas_classes = [
+            {
+                "classe": cl.nome,
+                "media": cls._percentagem(por_classe.get(cl.id)),
+            }
+            for cl in school.classes.all()
+        ]
+
+        estatisticas_turmas = []
+        for t in school.turmas.select_related('director_turma__professor__user'):
+            dt_nome = "-"
+            if hasattr(t, 'director_turma'):
+                dt_nome = t.director_turma.professor.user.get_full_name()
+            estatisticas_turmas.append({
+                "turma": t.nome,
+                "media": cls._percentagem(por_turma.get(t.id)),
+                "dt_nome": dt_nome
+            })
+
+        # Delegado mais recente de cada disciplina
+        delegados = {}
+        for dd in (
+            DelegadoDisciplina.objects.filter(school=school)
+            .select_related('professor__user')
+            .order_by('disciplina_id', '-ano_letivo')
+        ):
+            delegados.setdefault(dd.disciplina_id, dd.professor.user.get_full_name())
+
+        estatisticas_disciplinas = [
+            {
+                "disciplina": disc.nome,
+                "media": cls._percentagem(por_disciplina.get(disc.id)),
+                "delegado_nome": delegados.get(disc.id, "-")
+            }
+            for disc in school.disciplinas.all()
+        ]
+
+        # Aproveitamento Global da Escola (% de alunos com média >= 10)
+        aprovados_escola = (
+            Aluno.objects.filter(school=school, ativo=True)
+            .annotate(media=Avg('notas__valor'))
+            .filter(media__gte=10)
+            .count()
+        )
+        aproveitamento_global = (aprovados_escola / total_alunos * 100) if total_alunos > 0 else 0
+
+        return {
+            "total_alunos": total_alunos,
+            "total_professores": total_professores,
+            "total_tecnicos": total_tecnicos,
+            "aproveitamento_global": float(aproveitamento_global),
+            "aproveitamento_por_classe": estatisticas_classes,
+            "aproveitamento_por_turma": estatisticas_turmas,
+            "aproveitamento_por_disciplina": estatisticas_disciplinas
+        }
+
+
+class DistritoEstatisticasService:
+    """
+    Estatísticas agregadas das escolas de um distrito (SDEJT), por escola e
+    no total do distrito, calculadas a partir dos agregados já existentes
+    (TurmaEstatistica e ResumoTrimestral) em poucas queries agrupadas.
+    O resultado fica em cache e é refeito todas as noites pela tarefa
+    `atualizar_estatisticas_distritos`; sem cache, o pedido faz o mesmo que a
+    tarefa, para não guardar por 26h números de snapshots desatualizados.
+    """
+
+    CACHE_TTL = 60 * 60 * 26
+    SITUACOES = ("aprovados", "pendentes", "reprovados")
+
+    @staticmethod
+    def cache_key(district_id):
+        return f"distrito:estatisticas:{district_id}"
+
+    @staticmethod
+    def _ano_corrente():
+        # Ano ativo da escola; sem ano definido, o ano de cada turma
+        return Q(ano_letivo=F('school__current_ano_letivo')) | Q(
+            school__current_ano_letivo__isnull=True, ano_letivo=F('turma__ano_letivo')
+        )
+
+    @staticmethod
+    def _taxa(parte, total):
+        return round(parte / total * 100, 2) if total else 0.0
+
+    @classmethod
+    def get_estatisticas(cls, district):
+        key = cls.cache_key(district.id)
+        data = cache.get(key)
+        if data is None:
+            data = cls.atualizar(district)
+        return data
+
+    @classmethod
+    def atualizar(cls, district):
+        """Refaz os snapshots de turma desatualizados e regrava a cache do distrito."""
+        from salamandra_sge.avaliacoes.services.estatisticas import obter_turma_estatisticas
+
+        turmas = list(Turma.objects.filter(school__district=district))
+        for trimestre in (1, 2, 3, None):
+            obter_turma_estatisticas(turmas, trimestre=trimestre)
+        data = cls.calcular(district)
+        cache.set(cls.cache_key(district.id), data, timeout=cls.CACHE_TTL)
+        return data
+
+    @classmethod
+    def calcular(cls, district):
+        escolas = {
+            escola["id"]: {
+                "id": escola["id"],
+                "nome": escola["name"],
+                "ano_letivo": escola["current_ano_letivo"],
+                "alunos": {"total": 0, "homens": 0, "mulheres": 0, "por_classe": []},
+                "aproveitamento": [],
+                "disciplinas": [],
+                "estatisticas_desatualizadas": 0,
+            }
+            for escola in School.objects.filter(district=district).order_by('name').values(
+                'id', 'name', 'current_ano_letivo'
+            )
+        }
+
+        # Alunos ativos por escola, classe e sexo
+        alunos = (
+            Aluno.objects.filter(school__district=district, ativo=True)
+            .values('school_id', 'classe_atual__nome', 'sexo')
+            .annotate(total=Count('id'))
+            .order_by('school_id', 'classe_atual__nome')
+        )
+        totais_alunos = {"total": 0, "homens": 0, "mulheres": 0}
+        classes_escola = {}
+        classes_distrito = {}
+        for linha in alunos:
+            classe = linha['classe_atual__nome'] or "-"
+            for destino in (
+                escolas[linha['school_id']]["alunos"],
+                classes_escola.setdefault((linha['school_id'], classe), cls._contagem_classe(classe)),
+                classes_distrito.setdefault(classe, cls._contagem_classe(classe)),
+                totais_alunos,
+            ):
+                destino["total"] += linha['total']
+                if linha['sexo'] == 'HOMEM':
+                    destino["homens"] += linha['total']
+                elif linha['sexo'] == 'MULHER':
+                    destino["mulheres"] += linha['total']
+        for (school_id, _), classe in classes_escola.items():
+            escolas[school_id]["alunos"]["por_classe"].append(classe)
+
+        # Aproveitamento por escola e trimestre (0 = anual), a partir dos snapshots das turmas
+        somas = {"total_alunos": Sum('total_alunos'), **{s: Sum(s) for s in cls.SITUACOES}}
+        aproveitamento = (
+            TurmaEstatistica.objects.filter(school__district=district)
+            .filter(cls._ano_corrente())
+            .values('school_id', 'trimestre')
+            .annotate(**somas, desatualizadas=Count('id', filter=Q(desatualizado=True)))
+            .order_by('school_id', 'trimestre')
+        )
+        aproveitamento_distrito = {}
+        for linha in aproveitamento:
+            escola = escolas[linha['school_id']]
+            escola["estatisticas_desatualizadas"] += linha['desatualizadas']
+            escola["aproveitamento"].append(cls._linha_aproveitamento(linha))
+            total = aproveitamento_distrito.setdefault(
+                linha['trimestre'], {"trimestre": linha['trimestre'], "total_alunos": 0, **{s: 0 for s in cls.SITUACOES}}
+            )
+            for campo in ("total_alunos", *cls.SITUACOES):
+                total[campo] += linha[campo] or 0
+
+        # Média das MT por escola, disciplina e trimestre
+        medias = (
+            ResumoTrimestral.objects.filter(school__district=district, mt__isnull=False)
+            .filter(cls._ano_corrente())
+            .values('school_id', 'disciplina__nome', 'trimestre')
+            .annotate(media=Avg('mt'), avaliados=Count('id'))
+            .order_by('school_id', 'disciplina__nome', 'trimestre')
+        )
+        disciplinas_distrito = {}
+        for linha in medias:
+            media = float(linha['media'])
+            escolas[linha['school_id']]["disciplinas"].append({
+                "disciplina": linha['disciplina__nome'],
+                "trimestre": linha['trimestre'],
+                "media": round(media, 2),
+                "avaliados": linha['avaliados'],
+            })
+            total = disciplinas_distrito.setdefault(
+                (linha['disciplina__nome'], linha['trimestre']), {"soma": 0.0, "avaliados": 0}
+            )
+            total["soma"] += media * linha['avaliados']
+            total["avaliados"] += linha['avaliados']
+
+        return {
+            "distrito": {"id": district.id, "nome": district.name},
+            "gerado_em": timezone.now().isoformat(),
+            "escolas": list(escolas.values()),
+            "totais": {
+                "escolas": len(escolas),
+                "alunos": {**totais_alunos, "por_classe": sorted(classes_distrito.values(), key=lambda c: c["classe"])},
+                "aproveitamento": [
+                    cls._linha_aproveitamento(linha)
+                    for _, linha in sorted(aproveitamento_distrito.items())
+                ],
+                "disciplinas": [
+                    {
+                        "disciplina": disciplina,
+                        "trimestre": trimestre,
+                        "media": round(total["soma"] / total["avaliados"], 2),
+                        "avaliados": total["avaliados"],
+                    }
+                    for (disciplina, trimestre), total in sorted(disciplinas_distrito.items())
+                ],
+            },
+        }
+
+    @staticmethod
+    def _contagem_classe(classe):
+        return {"classe": classe, "total": 0, "homens": 0, "mulheres": 0}
+
+    @classmethod
+    def _linha_aproveitamento(cls, linha):
+        total = linha['total_alunos'] or 0
+        return {
+            "trimestre": linha['trimestre'],
+            "total_alunos": total,
+            **{situacao: linha[situacao] or 0 for situacao in cls.SITUACOES},
+            "taxa_aprovacao": cls._taxa(linha['aprovados'] or 0, total),
+        }
@@ -0,0 +1,14 @@
+from celery import shared_task
+
+from core.models import District
+
+from .services import DistritoEstatisticasService
+
+
+@shared_task
+def atualizar_estatisticas_distritos():
+    """Recalcula (de noite) as estatísticas agregadas de todos os distritos."""
+    distritos = list(District.objects.all())
+    for distrito in distritos:
+        DistritoEstatisticasService.atualizar(distrito)
+    return {"distritos": len(distritos)}
@@ -1,9 +1,14 @@
+from decimal import Decimal
+
+from django.core.cache import cache
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 from core.models import CustomUser, School, District
-from salamandra_sge.academico.models import Aluno, Classe, Turma
+from salamandra_sge.academico.models import Aluno, Classe, Turma, Disciplina
+from salamandra_sge.avaliacoes.models import Nota
+from salamandra_sge.avaliacoes.services.caderneta import recalcular_resumo_trimestral
 
 class DirectorTests(TestCase):
     def setUp(self):
@@ -79,3 +84,46 @@ class DirectorTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['total_alunos'], 1)
         self.assertIn('aproveitamento_por_classe', response.data)
+
+    def _aluno_com_notas(self, indice, disciplina, valores):
+        aluno = Aluno.objects.create(
+            nome_completo=f"Aluno {indice}", data_nascimento="2010-01-01", school=self.school,
+            classe_atual=self.classe, turma_atual=self.turma
+        )
+        for tipo, valor in zip(["ACS1", "ACS2", "ACP"], valores):
+            Nota.objects.create(
+                school=self.school, aluno=aluno, turma=self.turma, disciplina=disciplina,
+                tipo=tipo, trimestre=1, valor=Decimal(valor)
+            )
+        return aluno
+
+    def test_dashboard_consultas_constantes_e_cache(self):
+        self.client.force_authenticate(user=self.director_user)
+        url = reverse('instituicoes:director-dashboard')
+        disciplina = Disciplina.objects.create(school=self.school, nome="Matemática")
+        self._aluno_com_notas(0, disciplina, [12, 14, 8])
+
+        with self.assertNumQueries(11):
+            response = self.client.get(url)
+        self.assertEqual(response.data['aproveitamento_global'], 100.0)
+        self.assertAlmostEqual(response.data['aproveitamento_por_turma'][0]['media'], 200 / 3)
+
+        cache.clear()
+        for indice in range(1, 6):
+            self._aluno_com_notas(indice, disciplina, [5, 6, 7])
+        Turma.objects.create(school=self.school, nome="B", classe=self.classe, ano_letivo=2026)
+        with self.assertNumQueries(11):
+            response = self.client.get(url)
+        self.assertAlmostEqual(response.data['aproveitamento_global'], 100 / 6)
+        self.assertEqual(response.data['aproveitamento_por_disciplina'][0]['delegado_nome'], "-")
+
+        # Resposta servida da cache até uma escrita de notas invalidar
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        aluno = Aluno.objects.get(nome_completo="Aluno 0")
+        recalcular_resumo_trimestral(
+            school=self.school, aluno=aluno, turma=self.turma, disciplina=disciplina,
+            ano_letivo=2026, trimestre=1
+        )
+        with self.assertNumQueries(11):
+            self.client.get(url)
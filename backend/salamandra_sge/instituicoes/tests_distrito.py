@@ -0,0 +1,144 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import CustomUser, District, School
+from salamandra_sge.academico.models import (
+    Aluno,
+    Classe,
+    Disciplina,
+    Professor,
+    ProfessorTurmaDisciplina,
+    Turma,
+)
+from salamandra_sge.avaliacoes.models import ResumoTrimestral, TurmaEstatistica
+from salamandra_sge.instituicoes.services import DistritoEstatisticasService
+from salamandra_sge.instituicoes.tasks import atualizar_estatisticas_distritos
+
+
+class DistritoEstatisticasTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.district = District.objects.create(name="Distrito Teste")
+        self.sdejt = CustomUser.objects.create_user(
+            email="sdejt@distrito.com", password="password123", role="SDEJT_RAP", district=self.district
+        )
+        self.client.force_authenticate(user=self.sdejt)
+        self.url = reverse('instituicoes:escola-estatisticas-distrito')
+        self.total_escolas = 0
+
+    def _escola(self, medias, district=None):
+        """Cria uma escola com uma turma e um aluno por média (MT do 1º trimestre em Matemática)."""
+        self.total_escolas += 1
+        school = School.objects.create(
+            name=f"Escola {self.total_escolas:02d}", district=district or self.district, current_ano_letivo=2026
+        )
+        prof_user = CustomUser.objects.create_user(
+            email=f"prof{self.total_escolas}@escola.com", password="password123", role="PROFESSOR", school=school
+        )
+        professor = Professor.objects.create(user=prof_user, school=school)
+        classe = Classe.objects.create(school=school, nome="10ª Classe")
+        turma = Turma.objects.create(school=school, nome="A", classe=classe, ano_letivo=2026)
+        disciplina = Disciplina.objects.create(school=school, nome="Matemática")
+        ProfessorTurmaDisciplina.objects.create(school=school, professor=professor, turma=turma, disciplina=disciplina)
+        for indice, media in enumerate(medias):
+            aluno = Aluno.objects.create(
+                nome_completo=f"Aluno {indice}",
+                data_nascimento="2010-01-01",
+                school=school,
+                classe_atual=classe,
+                turma_atual=turma,
+                sexo="HOMEM" if indice % 2 == 0 else "MULHER",
+            )
+            ResumoTrimestral.objects.create(
+                school=school, aluno=aluno, disciplina=disciplina, turma=turma,
+                ano_letivo=2026, trimestre=1, mt=Decimal(media),
+            )
+        return school
+
+    def test_estatisticas_distrito(self):
+        escola_a = self._escola([14, 6])
+        escola_b = self._escola([12, 16, 10])
+        self._escola([18], district=District.objects.create(name="Outro Distrito"))
+        atualizar_estatisticas_distritos()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([e["id"] for e in response.data["escolas"]], [escola_a.id, escola_b.id])
+
+        a = response.data["escolas"][0]
+        self.assertEqual(a["alunos"], {
+            "total": 2, "homens": 1, "mulheres": 1,
+            "por_classe": [{"classe": "10ª Classe", "total": 2, "homens": 1, "mulheres": 1}],
+        })
+        tri1 = next(linha for linha in a["aproveitamento"] if linha["trimestre"] == 1)
+        self.assertEqual((tri1["total_alunos"], tri1["aprovados"]), (2, 1))
+        self.assertEqual(tri1["taxa_aprovacao"], 50.0)
+        self.assertEqual(a["disciplinas"], [{"disciplina": "Matemática", "trimestre": 1, "media": 10.0, "avaliados": 2}])
+
+        totais = response.data["totais"]
+        self.assertEqual(totais["escolas"], 2)
+        self.assertEqual(totais["alunos"]["total"], 5)
+        tri1 = next(linha for linha in totais["aproveitamento"] if linha["trimestre"] == 1)
+        self.assertEqual((tri1["total_alunos"], tri1["aprovados"]), (5, 4))
+        self.assertEqual(tri1["taxa_aprovacao"], 80.0)
+        # Média ponderada pelo número de alunos avaliados: (14+6+12+16+10)/5
+        self.assertEqual(totais["disciplinas"][0]["media"], 11.6)
+
+    def test_consultas_constantes_e_cache(self):
+        self._escola([14, 6])
+        with CaptureQueriesContext(connection) as ctx:
+            DistritoEstatisticasService.calcular(self.district)
+        poucas = len(ctx.captured_queries)
+
+        for _ in range(3):
+            self._escola([12, 16, 10])
+        with CaptureQueriesContext(connection) as ctx:
+            DistritoEstatisticasService.calcular(self.district)
+        self.assertEqual(len(ctx.captured_queries), poucas)
+
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('"avaliacoes_' in q["sql"] for q in ctx.captured_queries))
+
+    def test_cache_vazia_atualiza_snapshots(self):
+        escola = self._escola([14, 6])
+        atualizar_estatisticas_distritos()
+        # Nota corrigida depois da tarefa: snapshots marcados e cache expirada
+        ResumoTrimestral.objects.filter(school=escola, mt=6).update(mt=Decimal(12))
+        TurmaEstatistica.objects.filter(school=escola).update(desatualizado=True)
+        cache.delete(DistritoEstatisticasService.cache_key(self.district.id))
+
+        # O pedido seguinte refaz os snapshots antes de guardar na cache
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        a = response.data["escolas"][0]
+        self.assertEqual(a["estatisticas_desatualizadas"], 0)
+        tri1 = next(linha for linha in a["aproveitamento"] if linha["trimestre"] == 1)
+        self.assertEqual((tri1["total_alunos"], tri1["aprovados"]), (2, 2))
+        self.assertFalse(TurmaEstatistica.objects.filter(school=escola, desatualizado=True).exists())
+
+    def test_permissoes(self):
+        escola = self._escola([14])
+        director = CustomUser.objects.create_user(
+            email="director@escola.com", password="password123", role="ADMIN_ESCOLA", school=escola
+        )
+        self.client.force_authenticate(user=director)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+        admin = CustomUser.objects.create_user(
+            email="admin@sistema.com", password="password123", role="ADMIN_SISTEMA"
+        )
+        self.client.force_authenticate(user=admin)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(self.url, {"district_id": self.district.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["distrito"]["id"], self.district.id)
@@ -4,6 +4,8 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from .models import School, DetalheEscola 
 from .serializers import SchoolCreateWithUsersSerializer, SchoolSerializer, DetalheEscolaSerializer
+from core.models import District
+from .services import DashboardService, DistritoEstatisticasService
 from salamandra_sge.accounts.permissions import (
     IsSDEJT, IsAdminSistema, IsAdminEscola, IsDAP, IsDAE, IsAdministrativo, IsSchoolNotBlocked
 )
@@ -27,6 +29,8 @@ class SchoolViewSet(viewsets.ModelViewSet):
         if self.action == 'create':
             # Apenas SDEJT ou Admin Sistema podem criar escolas
             return [permissions.IsAuthenticated(), (IsSDEJT | IsAdminSistema)()]
+        if self.action == 'estatisticas_distrito':
+            return [permissions.IsAuthenticated(), (IsSDEJT | IsAdminSistema)()]
         if self.action in ['update', 'partial_update', 'destroy']:
             # Apenas ADMIN_SISTEMA pode editar/deletar escolas
             return [permissions.IsAuthenticated(), IsAdminSistema()]
@@ -43,6 +47,19 @@ class SchoolViewSet(viewsets.ModelViewSet):
             return School.objects.filter(id=user.school.id)
         return School.objects.none()
 
+    @action(detail=False, methods=['get'])
+    def estatisticas_distrito(self, request):
+        """Estatísticas agregadas das escolas do distrito (o do utilizador SDEJT ou `district_id`)."""
+        user = request.user
+        if user.role == 'ADMIN_SISTEMA':
+            district_id = request.query_params.get('district_id', '')
+            district = District.objects.filter(id=district_id).first() if district_id.isdigit() else None
+        else:
+            district = user.district
+        if district is None:
+            return Response({"error": "Distrito não encontrado."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(DistritoEstatisticasService.get_estatisticas(district))
+
     def perform_create(self, serializer):
         # Se for um SDEJT, forçamos o distrito da escola a ser o distrito do utilizador
         user = self.request.user
@@ -75,101 +92,12 @@ class DirectorViewSet(viewsets.ViewSet):
         from salamandra_sge.academico.models import Disciplina
         from salamandra_sge.academico.serializers import DisciplinaSerializer
         disciplinas = Disciplina.objects.filter(school=request.user.school)
-        serializer = DisciplinaSerializer(disciplinas, many=True)
+        serializer = DisciplinaSerializer(disciplinas, many=True, context={'school': request.user.school})
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def dashboard(self, request):
-        school = request.user.school
-        from salamandra_sge.academico.models import Aluno, Professor, Turma, Disciplina, DelegadoDisciplina, DirectorTurma
-        from salamandra_sge.administrativo.models import Funcionario
-        from salamandra_sge.avaliacoes.models import Nota
-        from django.db.models import Avg
-
-        total_alunos = Aluno.objects.filter(school=school, ativo=True).count()
-        total_professores = Professor.objects.filter(school=school).count()
-        total_tecnicos = Funcionario.objects.filter(school=school).count()
-        
-        # Aproveitamento por classe (Percentagem de Aprovados >= 10)
-        estatisticas_classes = []
-        classes = school.classes.all()
-        for cl in classes:
-            notas_classe = Nota.objects.filter(school=school, aluno__classe_atual=cl)
-            total_notas = notas_classe.count()
-            aprovados = notas_classe.filter(valor__gte=10).count()
-            percentagem = (aprovados / total_notas * 100) if total_notas > 0 else 0
-            
-            estatisticas_classes.append({
-                "classe": cl.nome,
-                "media": float(percentagem)
-            })
-
-        # Aproveitamento por Turma (Percentagem de Aprovados >= 10)
-        estatisticas_turmas = []
-        turmas = school.turmas.all()
-        for t in turmas:
-            notas_turma = Nota.objects.filter(school=school, aluno__turma_atual=t)
-            total_notas = notas_turma.count()
-            aprovados = notas_turma.filter(valor__gte=10).count()
-            percentagem = (aprovados / total_notas * 100) if total_notas > 0 else 0
-
-            # Buscar Director de Turma
-            dt_nome = "-"
-            # Assuming DirectorTurma is related to Turma via OneToOneField 'turma' or ForeignKey
-            # Model definition: turma = models.OneToOneField('Turma', ..., related_name='director_turma')
-            try:
-                if hasattr(t, 'director_turma'):
-                    dt_nome = t.director_turma.professor.user.get_full_name()
-            except:
-                pass
-
-            estatisticas_turmas.append({
-                "turma": t.nome,
-                "media": float(percentagem),
-                "dt_nome": dt_nome
-            })
-
-        # Aproveitamento por disciplina (Percentagem de Aprovados >= 10)
-        estatisticas_disciplinas = []
-        disciplinas = school.disciplinas.all()
-        for disc in disciplinas:
-            notas_disc = Nota.objects.filter(school=school, disciplina=disc)
-            total_notas = notas_disc.count()
-            aprovados = notas_disc.filter(valor__gte=10).count()
-            percentagem = (aprovados / total_notas * 100) if total_notas > 0 else 0
-
-            # Buscar Delegado
-            delegado_nome = "-"
-            delegado = DelegadoDisciplina.objects.filter(school=school, disciplina=disc).order_by('-ano_letivo').first()
-            if delegado:
-                delegado_nome = delegado.professor.user.get_full_name()
-
-            estatisticas_disciplinas.append({
-                "disciplina": disc.nome,
-                "media": float(percentagem),
-                "delegado_nome": delegado_nome
-            })
-
-        # Aproveitamento Global da Escola (% de alunos com média >= 10)
-        alunos_ativos = Aluno.objects.filter(school=school, ativo=True)
-        total_alunos_escola = alunos_ativos.count()
-        aprovados_escola = 0
-        for aluno in alunos_ativos:
-            media_aluno = Nota.objects.filter(aluno=aluno).aggregate(Avg('valor'))['valor__avg']
-            if media_aluno and media_aluno >= 10:
-                aprovados_escola += 1
-        
-        aproveitamento_global = (aprovados_escola / total_alunos_escola * 100) if total_alunos_escola > 0 else 0
-
-        return Response({
-            "total_alunos": total_alunos,
-            "total_professores": total_professores,
-            "total_tecnicos": total_tecnicos,
-            "aproveitamento_global": float(aproveitamento_global),
-            "aproveitamento_por_classe": estatisticas_classes,
-            "aproveitamento_por_turma": estatisticas_turmas,
-            "aproveitamento_por_disciplina": estatisticas_disciplinas
-        })
+        return Response(DashboardService.get_dashboard(request.user.school))
 
     @action(detail=False, methods=['get'])
     def periodo_atual(self, request):
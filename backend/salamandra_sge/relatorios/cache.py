@@ -0,0 +1,132 @@
+import hashlib
+import json
+import logging
+
+from django.core.cache import cache
+
+from .etags import report_etag
+from .services import ReportService
+
+
+logger = logging.getLogger(__name__)
+
+
+REPORTS = {
+    "pauta_turma": lambda user, params: ReportService.pauta_turma(
+        user=user,
+        turma_id=params.get("turma_id"),
+        disciplina_id=params.get("disciplina_id"),
+    ),
+    "pauta_turma_geral": lambda user, params: ReportService.pauta_turma_geral(
+        user=user,
+        turma_id=params.get("turma_id"),
+        trimestre=params.get("trimestre"),
+    ),
+    "declaracao_aluno": lambda user, params: ReportService.declaracao_aluno(
+        user=user,
+        aluno_id=params.get("aluno_id"),
+    ),
+    "situacao_academica": lambda user, params: ReportService.situacao_academica(
+        user=user,
+        aluno_id=params.get("aluno_id"),
+    ),
+    "lista_alunos_turma": lambda user, params: ReportService.lista_alunos_turma(
+        user=user,
+        turma_id=params.get("turma_id"),
+    ),
+    "aprovados_reprovados_turma": lambda user, params: ReportService.aprovados_reprovados_turma(
+        user=user,
+        turma_id=params.get("turma_id"),
+        trimestre=params.get("trimestre"),
+    ),
+    "caderneta": lambda user, params: ReportService.caderneta(
+        user=user,
+        turma_id=params.get("turma_id"),
+        disciplina_id=params.get("disciplina_id"),
+        ano_letivo=params.get("ano_letivo"),
+    ),
+}
+
+REPORT_PARAMS = {
+    "pauta_turma": ("turma_id", "disciplina_id"),
+    "pauta_turma_geral": ("turma_id", "trimestre"),
+    "declaracao_aluno": ("aluno_id",),
+    "situacao_academica": ("aluno_id",),
+    "lista_alunos_turma": ("turma_id",),
+    "aprovados_reprovados_turma": ("turma_id", "trimestre"),
+    "caderneta": ("turma_id", "disciplina_id", "ano_letivo"),
+}
+
+
+class ReportCache:
+    """
+    Cache dos resultados do ReportService, por relatório + parâmetros + estado
+    dos dados (o mesmo usado no ETag: versões das notas, alunos e disciplinas).
+    Uma alteração de notas, do estado de um aluno ou das atribuições muda a
+    chave apenas dos relatórios afetados; as entradas antigas expiram pelo TTL.
+    """
+
+    ADMIN_ROLES = ReportService.ADMIN_ROLES
+    CACHE_TTL = 60 * 30
+    PREFIXO = "relatorio:resultado"
+    PREFIXO_METRICAS = "relatorio:metricas"
+
+    @classmethod
+    def cache_key(cls, nome, params, etag):
+        canonicos = [str(params.get(campo) or "") for campo in REPORT_PARAMS[nome]]
+        assinatura = hashlib.sha256(json.dumps([canonicos, etag]).encode()).hexdigest()[:40]
+        return f"{cls.PREFIXO}:{nome}:{assinatura}"
+
+    @classmethod
+    def obter(cls, nome, user, params, etag=None):
+        """
+        Devolve o relatório `nome`, da cache quando o estado dos dados não mudou.
+        `etag` evita recalcular o estado quando o chamador já o tem.
+        Pedidos inválidos ou sem permissão não usam a cache e levantam o erro habitual.
+        """
+        if etag is None:
+            estado = report_etag(nome, user, params)
+            etag = estado[0] if estado else None
+        if etag is None:
+            return REPORTS[nome](user, params)
+
+        key = cls.cache_key(nome, params, etag)
+        data = cache.get(key)
+        if data is not None:
+            cls._contar(nome, "hits")
+            return data
+
+        cls._contar(nome, "misses")
+        data = REPORTS[nome](user, params)
+        cache.set(key, data, timeout=cls.CACHE_TTL)
+        return data
+
+    @classmethod
+    def _metrica_key(cls, nome, tipo):
+        return f"{cls.PREFIXO_METRICAS}:{nome}:{tipo}"
+
+    @classmethod
+    def _contar(cls, nome, tipo):
+        key = cls._metrica_key(nome, tipo)
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+        logger.debug("Cache de relatórios %s: %s", tipo, nome)
+
+    @classmethod
+    def metricas(cls):
+        keys = {
+            (nome, tipo): cls._metrica_key(nome, tipo)
+            for nome in REPORTS
+            for tipo in ("hits", "misses")
+        }
+        valores = cache.get_many(list(keys.values()))
+        resultado = {}
+        for (nome, tipo), key in keys.items():
+            resultado.setdefault(nome, {})[tipo] = valores.get(key, 0)
+        for contagem in resultado.values():
+            total = contagem["hits"] + contagem["misses"]
+            contagem["hit_ratio"] = round(contagem["hits"] / total, 3) if total else None
+        return resultado
@@ -0,0 +1,206 @@
+import hashlib
+import json
+
+from django.db.models import Q
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+from salamandra_sge.academico.models import Aluno, Disciplina, ProfessorTurmaDisciplina, Turma
+from salamandra_sge.avaliacoes.models import Nota, ResumoTrimestral
+from salamandra_sge.avaliacoes.services.versoes import estado_versoes
+
+from .services import ReportService
+
+
+# Incrementar quando o formato de algum relatório mudar, para invalidar ETags antigos
+FORMATO_VERSAO = 1
+
+CAMPOS_ALUNO = ('id', 'numero_turma', 'nome_completo', 'sexo', 'status', 'ativo')
+
+
+# ---------------------------------------------------------------------------
+# Estado de cada relatório: tudo o que o relatório lê, resumido em poucas
+# queries pequenas (contadores de versão das notas, lista de alunos e de
+# disciplinas), sem carregar notas nem calcular médias.
+# Devolve (partes, ultima_alteracao) ou None se o pedido for inválido ou não
+# permitido; nesse caso o relatório é construído e devolve o erro habitual.
+# ---------------------------------------------------------------------------
+
+def _inteiro(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def _turma(user, turma_id):
+    turma_id = _inteiro(turma_id)
+    if turma_id is None:
+        return None
+    return Turma.objects.select_related('classe').filter(id=turma_id, school=user.school).first()
+
+
+def _alunos_turma(turma, **filtros):
+    return list(Aluno.objects.filter(turma_atual=turma, **filtros).order_by('id').values_list(*CAMPOS_ALUNO))
+
+
+def _disciplinas_turma(turma):
+    return list(
+        Disciplina.objects.filter(
+            id__in=ProfessorTurmaDisciplina.objects.filter(turma=turma).values('disciplina_id')
+        ).order_by('id').values_list('id', 'nome', 'ordem')
+    )
+
+
+def _estado_pauta_turma(user, params):
+    turma = _turma(user, params.get('turma_id'))
+    disciplina_id = _inteiro(params.get('disciplina_id'))
+    if not turma or disciplina_id is None or not ReportService._can_view_pauta(user, turma):
+        return None
+    disciplina = Disciplina.objects.filter(id=disciplina_id, school=user.school).values_list('nome', flat=True).first()
+    if disciplina is None:
+        return None
+    if not ProfessorTurmaDisciplina.objects.filter(turma=turma, disciplina_id=disciplina_id).exists():
+        return None
+
+    versao, ultima = estado_versoes(turma=turma, disciplina_id=disciplina_id, ano_letivo=turma.ano_letivo)
+    partes = [
+        user.school.name, turma.nome, turma.classe.nome, turma.ano_letivo, disciplina,
+        _alunos_turma(turma, ativo=True), versao,
+    ]
+    return partes, ultima
+
+
+def _estado_pauta_turma_geral(user, params):
+    turma = _turma(user, params.get('turma_id'))
+    trimestre = _inteiro(params.get('trimestre'))
+    if not turma or trimestre is None or not ReportService._can_view_pauta(user, turma):
+        return None
+    disciplinas = _disciplinas_turma(turma)
+    if not disciplinas:
+        return None
+
+    versao, ultima = estado_versoes(turma=turma, ano_letivo=turma.ano_letivo, trimestre=trimestre)
+    partes = [
+        user.school.name, turma.nome, turma.classe.nome, turma.ano_letivo, trimestre,
+        disciplinas, _alunos_turma(turma), versao,
+    ]
+    return partes, ultima
+
+
+def _estado_declaracao_aluno(user, params):
+    aluno_id = _inteiro(params.get('aluno_id'))
+    if aluno_id is None:
+        return None
+    aluno = Aluno.objects.select_related('turma_atual__classe').filter(id=aluno_id, school=user.school).first()
+    if not aluno or not aluno.turma_atual or not ReportService._can_view_declaracao(user, aluno):
+        return None
+
+    turma = aluno.turma_atual
+    # Os resumos do aluno podem vir de turmas anteriores no mesmo ano
+    turmas_resumos = ResumoTrimestral.objects.filter(
+        aluno=aluno, ano_letivo=turma.ano_letivo
+    ).values('turma_id')
+    versao, ultima = estado_versoes(
+        Q(turma=turma) | Q(turma_id__in=turmas_resumos),
+        ano_letivo=turma.ano_letivo,
+    )
+    partes = [
+        [getattr(aluno, campo) for campo in CAMPOS_ALUNO],
+        turma.nome, turma.classe.nome, turma.ano_letivo,
+        _disciplinas_turma(turma), versao,
+    ]
+    return partes, ultima
+
+
+def _estado_situacao_academica(user, params):
+    aluno_id = _inteiro(params.get('aluno_id'))
+    if aluno_id is None:
+        return None
+    aluno = Aluno.objects.select_related('turma_atual').filter(id=aluno_id, school=user.school).first()
+    if not aluno or not ReportService._can_view_declaracao(user, aluno):
+        return None
+    ano_letivo = aluno.turma_atual.ano_letivo if aluno.turma_atual else user.school.current_ano_letivo
+    if not ano_letivo:
+        return None
+
+    turmas_notas = Nota.objects.filter(aluno=aluno, ano_letivo=ano_letivo).values('turma_id')
+    versao, ultima = estado_versoes(turma_id__in=turmas_notas, ano_letivo=ano_letivo)
+    disciplinas = list(
+        Disciplina.objects.filter(school=user.school).order_by('id').values_list('id', 'nome', 'ordem')
+    )
+    partes = [[getattr(aluno, campo) for campo in CAMPOS_ALUNO], ano_letivo, disciplinas, versao]
+    return partes, ultima
+
+
+def _estado_lista_alunos_turma(user, params):
+    turma = _turma(user, params.get('turma_id'))
+    if not turma or not ReportService._can_view_pauta(user, turma):
+        return None
+    return [turma.nome, turma.classe.nome, _alunos_turma(turma, ativo=True)], None
+
+
+def _estado_caderneta(user, params):
+    turma = _turma(user, params.get('turma_id'))
+    disciplina_id = _inteiro(params.get('disciplina_id'))
+    ano_letivo = _inteiro(params.get('ano_letivo'))
+    if not turma or disciplina_id is None or ano_letivo is None:
+        return None
+    disciplina = Disciplina.objects.filter(id=disciplina_id, school=user.school).first()
+    if not disciplina or not ReportService._can_view_caderneta(user, turma, disciplina):
+        return None
+
+    versao, ultima = estado_versoes(turma=turma, disciplina=disciplina, ano_letivo=ano_letivo)
+    partes = [turma.nome, turma.classe.nome, disciplina.nome, ano_letivo, _alunos_turma(turma), versao]
+    return partes, ultima
+
+
+REPORT_STATES = {
+    "pauta_turma": _estado_pauta_turma,
+    "pauta_turma_geral": _estado_pauta_turma_geral,
+    "aprovados_reprovados_turma": _estado_pauta_turma_geral,
+    "declaracao_aluno": _estado_declaracao_aluno,
+    "situacao_academica": _estado_situacao_academica,
+    "lista_alunos_turma": _estado_lista_alunos_turma,
+    "caderneta": _estado_caderneta,
+}
+
+
+def report_etag(nome, user, params):
+    """Devolve (etag, ultima_alteracao) do relatório, ou None se não for possível calcular."""
+    estado = REPORT_STATES[nome](user, params)
+    if estado is None:
+        return None
+    partes, ultima = estado
+    conteudo = json.dumps([nome, FORMATO_VERSAO, partes], default=str, sort_keys=True)
+    return f'"{hashlib.sha256(conteudo.encode()).hexdigest()[:32]}"', ultima
+
+
+def conditional_report(request, nome, params):
+    """
+    Responde 304 quando o If-None-Match coincide com o estado atual, sem
+    construir o relatório; caso contrário devolve-o (via ReportCache) com
+    ETag/Last-Modified. Só o ETag decide o 304: a data reflete as notas, mas
+    não as alterações de alunos ou disciplinas, que não têm data de modificação.
+    """
+    from .cache import ReportCache
+
+    estado = report_etag(nome, request.user, params)
+    if estado is None:
+        return Response(ReportCache.obter(nome, request.user, params), status=status.HTTP_200_OK)
+
+    etag, ultima = estado
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if ultima is not None:
+        headers["Last-Modified"] = http_date(ultima.timestamp())
+
+    nao_modificado = get_conditional_response(request, etag=etag)
+    if nao_modificado is not None:
+        for header, valor in headers.items():
+            nao_modificado[header] = valor
+        return nao_modificado
+
+    report = ReportCache.obter(nome, request.user, params, etag=etag)
+    return Response(report, status=status.HTTP_200_OK, headers=headers)
@@ -0,0 +1,292 @@
+import hashlib
+import json
+import secrets
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .cache import REPORT_PARAMS, ReportCache
+from .etags import REPORT_STATES, report_etag
+from .services import ReportService
+from .xlsx import write_xlsx
+
+
+PREFIXO = "relatorio:xlsx"
+PASTA = "report_exports"
+# Tempo máximo de uma exportação em curso; depois disso um novo pedido volta a gerá-la
+TAREFA_TTL = 60 * 15
+EXPORT_TTL = 60 * 60
+# Margem antes de apagar ficheiros cujos metadados já expiraram
+LIMPEZA_MARGEM = timedelta(minutes=10)
+ESTADO_PROGRESSO = "PROGRESS"
+# Intervalo sugerido aos clientes entre consultas ao estado (segundos)
+CONSULTA_MIN = 1
+CONSULTA_MAX = 30
+
+
+class ExportacaoErro(Exception):
+    """Falha esperada de uma exportação, com código e mensagem para o cliente."""
+
+    def __init__(self, codigo, mensagem, school_id=None):
+        super().__init__(codigo, mensagem, school_id)
+        self.codigo = codigo
+        self.mensagem = mensagem
+        self.school_id = school_id
+
+
+def ambito_permissao(user):
+    """
+    Quem partilha o mesmo ficheiro: os perfis de administração veem todos os
+    relatórios da escola e partilham por perfil; os restantes só veem o que
+    lhes foi atribuído e têm exportações próprias.
+    """
+    if ReportService._is_report_admin(user):
+        return user.role
+    return f"U{user.id}"
+
+
+def export_cache_key(tipo, user, params, etag):
+    """
+    Chave determinística da exportação (uso interno, nunca enviada ao cliente):
+    tipo, parâmetros normalizados, escola, âmbito de permissão e estado dos dados.
+    """
+    canonicos = [str(params.get(campo) or "") for campo in REPORT_PARAMS[tipo]]
+    assinatura = hashlib.sha256(
+        json.dumps([tipo, canonicos, user.school_id, ambito_permissao(user), etag]).encode()
+    ).hexdigest()[:40]
+    return f"{PREFIXO}:{tipo}:{assinatura}"
+
+
+def tarefa_key(cache_key):
+    return f"{cache_key}:tarefa"
+
+
+def token_key(token):
+    return f"{PREFIXO}:token:{token}"
+
+
+def emitir_token(cache_key, user, ttl=EXPORT_TTL):
+    """
+    Token aleatório, próprio de quem o pediu, que aponta para a exportação
+    partilhada. É o único identificador que chega ao cliente.
+    """
+    token = secrets.token_urlsafe(32)
+    cache.set(token_key(token), {"cache_key": cache_key, "user_id": user.id}, timeout=ttl)
+    return token
+
+
+def exportacao_do_token(token, user):
+    """
+    Metadados da exportação do token, ou None se não existe, expirou, é de outro
+    utilizador ou se o utilizador deixou de poder ver o relatório exportado.
+    """
+    entrada = cache.get(token_key(token)) if token else None
+    if not isinstance(entrada, dict) or entrada.get("user_id") != user.id:
+        return None
+    metadados = obter_exportacao(entrada["cache_key"], user.school_id)
+    if metadados is None or metadados.get("tipo") not in REPORT_STATES:
+        return None
+    # A permissão é a do relatório, verificada outra vez no momento do download
+    if REPORT_STATES[metadados["tipo"]](user, metadados.get("params") or {}) is None:
+        return None
+    return metadados
+
+
+def url_download(token):
+    return f"{reverse('relatorio-baixar-xlsx')}?token={token}"
+
+
+def chave_valida(cache_key):
+    partes = cache_key.split(":")
+    return len(partes) == 4 and cache_key.startswith(f"{PREFIXO}:") and partes[2] in REPORT_PARAMS
+
+
+def caminho_ficheiro(cache_key):
+    _, _, tipo, assinatura = cache_key.split(":")
+    return f"{PASTA}/{tipo}/{assinatura}-{uuid.uuid4().hex[:12]}.xlsx"
+
+
+def gravar_exportacao(cache_key, tipo, params, sheets, school_id, ttl=EXPORT_TTL, progresso=None):
+    """
+    Escreve o XLSX no armazenamento de ficheiros e guarda na cache apenas os
+    metadados (caminho, escola, relatório e parâmetros, nome, tamanho, datas).
+    Devolve os metadados.
+    Cada geração tem um nome próprio e os metadados só passam a apontar para ela
+    depois de escrita: um download do ficheiro anterior nunca o vê apagado ou a
+    meio. As cópias substituídas são removidas por limpar_exportacoes_expiradas.
+    """
+    with tempfile.TemporaryFile() as tmp:
+        write_xlsx(sheets, tmp, progresso=progresso)
+        tmp.seek(0)
+        caminho = default_storage.save(caminho_ficheiro(cache_key), File(tmp))
+
+    agora = timezone.now()
+    metadados = {
+        "path": caminho,
+        "school_id": school_id,
+        "tipo": tipo,
+        "params": {campo: params.get(campo) for campo in REPORT_PARAMS[tipo]},
+        "filename": f"{tipo}.xlsx",
+        "size": default_storage.size(caminho),
+        "criado_em": agora.isoformat(),
+        "expira_em": (agora + timedelta(seconds=ttl)).isoformat(),
+    }
+    cache.set(cache_key, metadados, timeout=ttl)
+    return metadados
+
+
+def obter_exportacao(cache_key, school_id=None):
+    """
+    Metadados da exportação, ou None se expirou, o ficheiro já não existe ou,
+    com `school_id`, se foi gerada para outra escola.
+    """
+    if not chave_valida(cache_key):
+        return None
+    metadados = cache.get(cache_key)
+    if not isinstance(metadados, dict) or not default_storage.exists(metadados["path"]):
+        return None
+    if school_id is not None and metadados.get("school_id") != school_id:
+        return None
+    return metadados
+
+
+def limpar_exportacoes_expiradas(idade=None):
+    """Remove ficheiros exportados mais antigos do que o TTL dos metadados. Devolve o total removido."""
+    limite = timezone.now() - (idade or timedelta(seconds=EXPORT_TTL) + LIMPEZA_MARGEM)
+    if not default_storage.exists(PASTA):
+        return 0
+
+    removidos = 0
+    tipos, _ = default_storage.listdir(PASTA)
+    for tipo in tipos:
+        _, ficheiros = default_storage.listdir(f"{PASTA}/{tipo}")
+        for nome in ficheiros:
+            caminho = f"{PASTA}/{tipo}/{nome}"
+            if default_storage.get_modified_time(caminho) < limite:
+                default_storage.delete(caminho)
+                removidos += 1
+    return removidos
+
+
+def solicitar_exportacao(tipo, user, params):
+    """
+    Devolve {"token", "task_id", "pronto", "coalesced"} para a exportação.
+    Se o ficheiro já existe para o estado atual dos dados, é reutilizado; se já
+    há uma tarefa em curso para a mesma chave, devolve essa tarefa.
+    Pedidos inválidos ou sem permissão levantam o erro habitual do relatório.
+    """
+    from .tasks import gerar_relatorio_xlsx
+
+    estado = report_etag(tipo, user, params)
+    if estado is None:
+        ReportCache.obter(tipo, user, params)
+        raise ValidationError("Parâmetros inválidos para o relatório.")
+
+    cache_key = export_cache_key(tipo, user, params, estado[0])
+    token = emitir_token(cache_key, user)
+    if obter_exportacao(cache_key):
+        return {"token": token, "task_id": None, "pronto": True, "coalesced": True}
+
+    task_id = uuid.uuid4().hex
+    if not cache.add(tarefa_key(cache_key), task_id, timeout=TAREFA_TTL):
+        return {
+            "token": token,
+            "task_id": cache.get(tarefa_key(cache_key)),
+            "pronto": False,
+            "coalesced": True,
+        }
+
+    gerar_relatorio_xlsx.apply_async(args=(tipo, user.id, dict(params), cache_key, EXPORT_TTL), task_id=task_id)
+    pronto = obter_exportacao(cache_key) is not None
+    return {"token": token, "task_id": task_id, "pronto": pronto, "coalesced": False}
+
+
+def url_estado(task_id):
+    return f"{reverse('relatorio-estado-exportacao')}?task_id={task_id}" if task_id else None
+
+
+def meta_progresso(school_id, fase, processadas=0, total=None, inicio=None):
+    return {
+        "school_id": school_id,
+        "fase": fase,
+        "processadas": processadas,
+        "total": total,
+        "inicio": inicio or time.time(),
+    }
+
+
+def _erro(resultado):
+    if isinstance(resultado, ExportacaoErro):
+        return {"codigo": resultado.codigo, "mensagem": resultado.mensagem}
+    return {"codigo": "erro_interno", "mensagem": "Falha inesperada ao gerar o relatório."}
+
+
+def estado_exportacao(task_id, user):
+    """
+    Estado da tarefa de exportação a partir do resultado do Celery: progresso
+    (linhas escritas), tempo restante estimado, ligação de download ou erro.
+    Devolve None se a tarefa pertencer a outra escola.
+    """
+    from .tasks import gerar_relatorio_xlsx
+
+    resultado = gerar_relatorio_xlsx.AsyncResult(task_id)
+    estado = {
+        "task_id": task_id,
+        "estado": "PENDENTE",
+        "fase": None,
+        "progresso": 0,
+        "processadas": 0,
+        "total": None,
+        "eta_segundos": None,
+        "token": None,
+        "download_url": None,
+        "erro": None,
+        "retry_after": 2,
+    }
+
+    if resultado.state == ESTADO_PROGRESSO:
+        info = resultado.info or {}
+        if info.get("school_id") != user.school_id:
+            return None
+        processadas, total = info.get("processadas") or 0, info.get("total")
+        estado.update(estado="EM_CURSO", fase=info.get("fase"), processadas=processadas, total=total)
+        if total:
+            estado["progresso"] = min(int(processadas * 95 / total), 95)
+        if processadas and total:
+            decorrido = max(time.time() - info["inicio"], 0)
+            estado["eta_segundos"] = round(decorrido / processadas * (total - processadas), 1)
+            estado["retry_after"] = min(max(int(estado["eta_segundos"] / 2), CONSULTA_MIN), CONSULTA_MAX)
+    elif resultado.state == "SUCCESS":
+        info = resultado.result or {}
+        if info.get("school_id") != user.school_id:
+            return None
+        cache_key = info.get("cache_key")
+        estado.update(
+            estado="CONCLUIDO",
+            progresso=100,
+            processadas=info.get("total"),
+            total=info.get("total"),
+            eta_segundos=0,
+            retry_after=None,
+        )
+        if obter_exportacao(cache_key, user.school_id):
+            estado["token"] = emitir_token(cache_key, user)
+            estado["download_url"] = url_download(estado["token"])
+        else:
+            estado["erro"] = {"codigo": "expirado", "mensagem": "Arquivo não encontrado ou expirado."}
+    elif resultado.state == "FAILURE":
+        erro = resultado.result
+        if isinstance(erro, ExportacaoErro) and erro.school_id not in (None, user.school_id):
+            return None
+        estado.update(estado="FALHOU", erro=_erro(erro), retry_after=None)
+    elif resultado.state in ("STARTED", "RETRY"):
+        estado["estado"] = "EM_CURSO"
+    return estado
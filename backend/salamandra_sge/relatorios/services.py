@@ -1,18 +1,21 @@
 from decimal import Decimal
 
+from django.db.models import F
 from rest_framework.exceptions import PermissionDenied, ValidationError, NotFound
 
+from salamandra_sge.accounts.access import UserAccessContext
 from salamandra_sge.academico.models import (
     Aluno,
-    CoordenadorClasse,
-    DirectorTurma,
     Disciplina,
     ProfessorTurmaDisciplina,
     Turma,
 )
 from salamandra_sge.avaliacoes.models import Nota, ResumoTrimestral
 from salamandra_sge.avaliacoes.services import AvaliacaoService
-from salamandra_sge.avaliacoes.services.caderneta import arredondar_decimal
+from salamandra_sge.avaliacoes.services.caderneta import arredondar_decimal, calcular_resumo
+
+
+TIPOS_ACS = ('ACS1', 'ACS2', 'ACS3')
 
 
 class ReportService:
@@ -26,6 +29,8 @@ class ReportService:
     APROVACAO_DISCIPLINA_MIN = 8.0
     APROVACAO_DISCIPLINA_LIMITE = 9.5
     APROVACAO_MAX_NEGATIVAS = 2
+    # Alunos por lote nas exportações em streaming (uma query de notas/resumos por lote)
+    LOTE_EXPORTACAO = 500
 
     @classmethod
     def _is_report_admin(cls, user):
@@ -35,16 +40,8 @@ class ReportService:
     def _can_view_pauta(cls, user, turma):
         if cls._is_report_admin(user):
             return True
-        if DirectorTurma.objects.filter(professor__user=user, turma=turma).exists():
-            return True
-        if CoordenadorClasse.objects.filter(
-            professor__user=user,
-            classe=turma.classe
-        ).exists():
-            return True
-        if user.role != 'PROFESSOR':
-            return False
-        return False
+        acesso = UserAccessContext.for_user(user)
+        return acesso.is_dt(turma.id) or acesso.is_cc(turma.classe_id)
 
     @classmethod
     def _can_view_declaracao(cls, user, aluno):
@@ -52,12 +49,9 @@ class ReportService:
             return True
         if user.role != 'PROFESSOR':
             return False
-        if not aluno.turma_atual:
+        if not aluno.turma_atual_id:
             return False
-        return DirectorTurma.objects.filter(
-            professor__user=user,
-            turma=aluno.turma_atual
-        ).exists()
+        return UserAccessContext.for_user(user).is_dt(aluno.turma_atual_id)
 
     @classmethod
     def _can_view_caderneta(cls, user, turma, disciplina):
@@ -67,11 +61,7 @@ class ReportService:
             return False
         if cls._can_view_pauta(user, turma):
             return True
-        return ProfessorTurmaDisciplina.objects.filter(
-            professor__user=user,
-            turma=turma,
-            disciplina=disciplina
-        ).exists()
+        return UserAccessContext.for_user(user).lecciona(turma.id, disciplina.id)
 
     @staticmethod
     def _require(condition, message, exc=ValidationError):
@@ -105,6 +95,48 @@ class ReportService:
 
         return "Aprovado"
 
+    @staticmethod
+    def _em_lotes(queryset, tamanho):
+        """Percorre o queryset em streaming (.iterator()) e devolve listas de `tamanho` objetos."""
+        lote = []
+        for obj in queryset.iterator(chunk_size=tamanho):
+            lote.append(obj)
+            if len(lote) >= tamanho:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+
+    @staticmethod
+    def _load_grade_matrix(**filters):
+        """
+        Carrega numa única query todas as notas do filtro, indexadas por
+        (aluno_id, disciplina_id, trimestre) -> {tipo: valor}.
+        """
+        matrix = {}
+        rows = Nota.objects.filter(**filters).values_list(
+            'aluno_id', 'disciplina_id', 'trimestre', 'tipo', 'valor'
+        )
+        for aluno_id, disciplina_id, trimestre, tipo, valor in rows:
+            matrix.setdefault((aluno_id, disciplina_id, trimestre), {})[tipo] = valor
+        return matrix
+
+    @staticmethod
+    def _trimestre_payload(valores):
+        """Dados de um trimestre (ACS, MAP, MACS, ACP, MT, COM) a partir da matriz de notas."""
+        valores = valores or {}
+        macs, mt, com = calcular_resumo(valores)
+        map_valor = valores.get('MAP')
+        acp_valor = valores.get('ACP')
+        return {
+            "acs": [float(valores[tipo]) for tipo in TIPOS_ACS if valores.get(tipo) is not None],
+            "map": float(map_valor) if map_valor is not None else None,
+            "macs": float(macs) if macs is not None else None,
+            "acp": float(acp_valor) if acp_valor is not None else None,
+            "mt": int(mt) if mt is not None else None,
+            "com": com,
+        }
+
     @staticmethod
     def _percent(part, total):
         return round((part / total) * 100, 2) if total > 0 else 0
@@ -192,11 +224,11 @@ class ReportService:
         }
 
     @classmethod
-    def pauta_turma(cls, *, user, turma_id, disciplina_id):
+    def _pauta_turma_contexto(cls, user, turma_id, disciplina_id):
         cls._require(turma_id and disciplina_id, "turma_id e disciplina_id são obrigatórios.")
 
         try:
-            turma = Turma.objects.get(id=turma_id, school=user.school)
+            turma = Turma.objects.select_related('classe').get(id=turma_id, school=user.school)
             disciplina = Disciplina.objects.get(id=disciplina_id, school=user.school)
         except (Turma.DoesNotExist, Disciplina.DoesNotExist):
             raise NotFound("Turma ou Disciplina não encontrada.")
@@ -207,65 +239,79 @@ class ReportService:
         if not ProfessorTurmaDisciplina.objects.filter(turma=turma, disciplina=disciplina).exists():
             raise ValidationError("Disciplina não atribuída a esta turma.")
 
-        notas = Nota.objects.filter(turma=turma, disciplina=disciplina)
-        alunos = Aluno.objects.filter(turma_atual=turma, ativo=True).order_by('numero_turma', 'nome_completo')
+        cabecalho = {
+            "escola": user.school.name,
+            "turma": turma.nome,
+            "classe": turma.classe.nome,
+            "disciplina": disciplina.nome,
+            "ano_letivo": turma.ano_letivo,
+        }
+        return turma, disciplina, cabecalho
 
-        pauta = []
-        for aluno in alunos:
-            aluno_notas = notas.filter(aluno=aluno)
-            tri_data = {}
-            mts = []
-            for tri in [1, 2, 3]:
-                notas_tri = aluno_notas.filter(trimestre=tri)
-                acs_list = notas_tri.filter(tipo__in=['ACS1', 'ACS2', 'ACS3']).order_by('tipo')
-                map_nota = notas_tri.filter(tipo='MAP').first()
-                acp_nota = notas_tri.filter(tipo='ACP').first()
-
-                macs = AvaliacaoService.calculate_macs(acs_list, map_nota)
-                mt = None
-                com = None
-                if acp_nota and acp_nota.valor is not None:
-                    mt = AvaliacaoService.calculate_mt(macs, acp_nota.valor)
-                    com = AvaliacaoService.get_comportamento(mt)
-
-                tri_data[tri] = {
-                    "acs": [float(n.valor) for n in acs_list if n.valor is not None],
-                    "map": float(map_nota.valor) if map_nota else None,
-                    "macs": float(macs) if macs is not None else None,
-                    "acp": float(acp_nota.valor) if acp_nota else None,
-                    "mt": int(mt) if mt is not None else None,
-                    "com": com
-                }
+    @classmethod
+    def _pauta_turma_linha(cls, aluno, disciplina, matrix):
+        tri_data = {
+            tri: cls._trimestre_payload(matrix.get((aluno.id, disciplina.id, tri)))
+            for tri in [1, 2, 3]
+        }
 
-                if mt is not None:
-                    mts.append(mt)
+        mfd = AvaliacaoService.calculate_mfd(
+            tri_data[1]["mt"],
+            tri_data[2]["mt"],
+            tri_data[3]["mt"],
+        )
 
-            mfd = AvaliacaoService.calculate_mfd(
-                tri_data[1]["mt"],
-                tri_data[2]["mt"],
-                tri_data[3]["mt"],
-            )
+        return {
+            "id": aluno.id,
+            "numero_turma": aluno.numero_turma,
+            "nome": aluno.nome_completo,
+            "sexo": aluno.sexo[0] if aluno.sexo else "",
+            "trimesters": tri_data,
+            "mfd": float(mfd) if mfd is not None else None,
+        }
 
-            pauta.append({
-                "id": aluno.id,
-                "numero_turma": aluno.numero_turma,
-                "nome": aluno.nome_completo,
-                "sexo": aluno.sexo[0] if aluno.sexo else "",
-                "trimesters": tri_data,
-                "mfd": float(mfd) if mfd is not None else None,
-            })
+    @classmethod
+    def pauta_turma(cls, *, user, turma_id, disciplina_id):
+        turma, disciplina, cabecalho = cls._pauta_turma_contexto(user, turma_id, disciplina_id)
+
+        matrix = cls._load_grade_matrix(
+            turma=turma,
+            disciplina=disciplina,
+            ano_letivo=turma.ano_letivo,
+        )
+        alunos = Aluno.objects.filter(turma_atual=turma, ativo=True).order_by('numero_turma', 'nome_completo')
 
         return {
-            "escola": user.school.name,
-            "turma": turma.nome,
-            "classe": turma.classe.nome,
-            "disciplina": disciplina.nome,
-            "ano_letivo": turma.ano_letivo,
-            "pauta": pauta,
+            **cabecalho,
+            "pauta": [cls._pauta_turma_linha(aluno, disciplina, matrix) for aluno in alunos],
         }
 
     @classmethod
-    def pauta_turma_geral(cls, *, user, turma_id, trimestre):
+    def pauta_turma_linhas(cls, *, user, turma_id, disciplina_id, lote=None):
+        """
+        Como pauta_turma, com "pauta" num gerador para a exportação: os alunos
+        são lidos em streaming e as notas carregadas por lotes de alunos, sem
+        guardar a pauta inteira em memória. Devolve (dados, total_de_linhas).
+        """
+        turma, disciplina, cabecalho = cls._pauta_turma_contexto(user, turma_id, disciplina_id)
+        lote = lote or cls.LOTE_EXPORTACAO
+        alunos = Aluno.objects.filter(turma_atual=turma, ativo=True).order_by('numero_turma', 'nome_completo', 'id')
+
+        def linhas():
+            for grupo in cls._em_lotes(alunos, lote):
+                matrix = cls._load_grade_matrix(
+                    turma=turma,
+                    disciplina=disciplina,
+                    ano_letivo=turma.ano_letivo,
+                    aluno_id__in=[aluno.id for aluno in grupo],
+                )
+                for aluno in grupo:
+                    yield cls._pauta_turma_linha(aluno, disciplina, matrix)
+
+        return {**cabecalho, "pauta": linhas()}, alunos.count()
+
+    @classmethod
+    def _pauta_geral_contexto(cls, user, turma_id, trimestre):
         cls._require(turma_id and trimestre, "turma_id e trimestre são obrigatórios.")
         cls._require(str(trimestre).isdigit(), "trimestre inválido.")
 
@@ -286,6 +332,40 @@ class ReportService:
         if not disciplinas.exists():
             raise ValidationError("Nenhuma disciplina atribuída a esta turma.")
 
+        return turma, disciplinas
+
+    @classmethod
+    def _pauta_geral_linha(cls, aluno, disciplinas, resumo_map):
+        """Linha de um aluno na pauta geral; devolve (linha, media_final sem arredondar)."""
+        disciplinas_data = {}
+        mts = []
+        pendente = False
+        for disc in disciplinas:
+            resumo = resumo_map.get((aluno.id, disc.id))
+            mt_val = float(resumo.mt) if resumo and resumo.mt is not None else None
+            disciplinas_data[disc.id] = mt_val
+            if mt_val is not None:
+                mts.append(mt_val)
+            else:
+                pendente = True
+
+        media_final = (sum(mts) / len(mts)) if mts else None
+        situacao = cls._situacao_aprovacao(aluno, mts if not pendente else mts + [None])
+        linha = {
+            "id": aluno.id,
+            "nome": aluno.nome_completo,
+            "sexo": aluno.sexo,
+            "numero_turma": aluno.numero_turma,
+            "disciplinas": disciplinas_data,
+            "media_final": round(media_final, 2) if media_final is not None else None,
+            "situacao": situacao
+        }
+        return linha, media_final
+
+    @classmethod
+    def pauta_turma_geral(cls, *, user, turma_id, trimestre):
+        turma, disciplinas = cls._pauta_geral_contexto(user, turma_id, trimestre)
+
         ano_letivo = turma.ano_letivo
         resumos = ResumoTrimestral.objects.filter(
             turma=turma,
@@ -300,31 +380,11 @@ class ReportService:
         valores_media = {}
 
         for aluno in alunos:
-            disciplinas_data = {}
-            mts = []
-            pendente = False
-            for disc in disciplinas:
-                resumo = resumo_map.get((aluno.id, disc.id))
-                mt_val = float(resumo.mt) if resumo and resumo.mt is not None else None
-                disciplinas_data[disc.id] = mt_val
-                valores_por_disciplina[disc.id][aluno.id] = mt_val
-                if mt_val is not None:
-                    mts.append(mt_val)
-                else:
-                    pendente = True
-
-            media_final = (sum(mts) / len(mts)) if mts else None
+            linha, media_final = cls._pauta_geral_linha(aluno, disciplinas, resumo_map)
+            for disc_id, mt_val in linha["disciplinas"].items():
+                valores_por_disciplina[disc_id][aluno.id] = mt_val
             valores_media[aluno.id] = media_final
-            situacao = cls._situacao_aprovacao(aluno, mts if not pendente else mts + [None])
-            pauta.append({
-                "id": aluno.id,
-                "nome": aluno.nome_completo,
-                "sexo": aluno.sexo,
-                "numero_turma": aluno.numero_turma,
-                "disciplinas": disciplinas_data,
-                "media_final": round(media_final, 2) if media_final is not None else None,
-                "situacao": situacao
-            })
+            pauta.append(linha)
 
         estatisticas_disciplinas = []
         for disc in disciplinas:
@@ -359,6 +419,41 @@ class ReportService:
             },
         }
 
+    @classmethod
+    def pauta_turma_geral_linhas(cls, *, user, turma_id, trimestre, lote=None):
+        """
+        Como pauta_turma_geral, sem estatísticas e com "pauta" num gerador para a
+        exportação: alunos em streaming e resumos carregados por lotes de alunos.
+        Devolve (dados, total_de_linhas).
+        """
+        turma, disciplinas = cls._pauta_geral_contexto(user, turma_id, trimestre)
+        lote = lote or cls.LOTE_EXPORTACAO
+        disciplinas = list(disciplinas)
+        alunos = Aluno.objects.filter(turma_atual=turma).order_by('nome_completo', 'id')
+
+        def linhas():
+            for grupo in cls._em_lotes(alunos, lote):
+                resumos = ResumoTrimestral.objects.filter(
+                    turma=turma,
+                    ano_letivo=turma.ano_letivo,
+                    trimestre=int(trimestre),
+                    aluno_id__in=[aluno.id for aluno in grupo],
+                )
+                resumo_map = {(r.aluno_id, r.disciplina_id): r for r in resumos}
+                for aluno in grupo:
+                    yield cls._pauta_geral_linha(aluno, disciplinas, resumo_map)[0]
+
+        dados = {
+            "escola": user.school.name,
+            "turma": turma.nome,
+            "classe": turma.classe.nome,
+            "ano_letivo": turma.ano_letivo,
+            "trimestre": int(trimestre),
+            "disciplinas": [{"id": d.id, "nome": d.nome} for d in disciplinas],
+            "pauta": linhas(),
+        }
+        return dados, alunos.count()
+
     @classmethod
     def declaracao_aluno(cls, *, user, aluno_id):
         cls._require(aluno_id, "aluno_id é obrigatório.")
@@ -437,7 +532,7 @@ class ReportService:
         cls._require(aluno_id, "aluno_id é obrigatório.")
 
         try:
-            aluno = Aluno.objects.get(id=aluno_id, school=user.school)
+            aluno = Aluno.objects.select_related('turma_atual').get(id=aluno_id, school=user.school)
         except Aluno.DoesNotExist:
             raise NotFound("Aluno não encontrado.")
 
@@ -446,37 +541,23 @@ class ReportService:
 
         disciplinas = Disciplina.objects.filter(school=user.school).order_by('ordem', 'nome')
 
+        filtros = {"aluno": aluno}
+        ano_letivo = aluno.turma_atual.ano_letivo if aluno.turma_atual else user.school.current_ano_letivo
+        if ano_letivo:
+            filtros["ano_letivo"] = ano_letivo
+        matrix = cls._load_grade_matrix(**filtros)
+
         report = []
         for disc in disciplinas:
             disc_data = {
                 "disciplina_id": disc.id,
                 "disciplina_nome": disc.nome,
-                "trimesters": {}
+                "trimesters": {
+                    tri: cls._trimestre_payload(matrix.get((aluno.id, disc.id, tri)))
+                    for tri in [1, 2, 3]
+                },
             }
 
-            for tri in [1, 2, 3]:
-                notas = Nota.objects.filter(aluno=aluno, disciplina=disc, trimestre=tri)
-                acs_list = notas.filter(tipo__in=['ACS1', 'ACS2', 'ACS3']).order_by('tipo')
-                map_nota = notas.filter(tipo='MAP').first()
-                acp_nota = notas.filter(tipo='ACP').first()
-
-                macs = AvaliacaoService.calculate_macs(acs_list, map_nota)
-                mt = None
-                com = None
-
-                if acp_nota and acp_nota.valor is not None:
-                    mt = AvaliacaoService.calculate_mt(macs, acp_nota.valor)
-                    com = AvaliacaoService.get_comportamento(mt)
-
-                disc_data["trimesters"][tri] = {
-                    "acs": [float(n.valor) for n in acs_list if n.valor is not None],
-                    "map": float(map_nota.valor) if map_nota else None,
-                    "macs": float(macs) if macs is not None else None,
-                    "acp": float(acp_nota.valor) if acp_nota else None,
-                    "mt": int(mt) if mt is not None else None,
-                    "com": com
-                }
-
             mt1 = disc_data["trimesters"][1]["mt"]
             mt2 = disc_data["trimesters"][2]["mt"]
             mt3 = disc_data["trimesters"][3]["mt"]
@@ -572,7 +653,7 @@ class ReportService:
         }
 
     @classmethod
-    def lista_alunos_turma(cls, *, user, turma_id):
+    def _lista_alunos_contexto(cls, user, turma_id):
         cls._require(turma_id, "turma_id é obrigatório.")
         try:
             turma = Turma.objects.get(id=turma_id, school=user.school)
@@ -581,23 +662,50 @@ class ReportService:
 
         if not cls._can_view_pauta(user, turma):
             raise PermissionDenied("Sem permissão para visualizar esta turma.")
+        return turma
+
+    @staticmethod
+    def _lista_alunos_linha(aluno):
+        return {
+            "id": aluno.id,
+            "numero_turma": aluno.numero_turma,
+            "nome": aluno.nome_completo,
+            "sexo": aluno.sexo,
+            "status": aluno.status,
+        }
+
+    @classmethod
+    def lista_alunos_turma(cls, *, user, turma_id):
+        turma = cls._lista_alunos_contexto(user, turma_id)
 
         alunos = list(Aluno.objects.filter(turma_atual=turma, ativo=True))
         alunos.sort(key=lambda a: (a.numero_turma is None, a.numero_turma or 0, a.nome_completo))
 
         return {
             "turma": {"id": turma.id, "nome": turma.nome, "classe": turma.classe.nome},
-            "alunos": [
-                {
-                    "id": aluno.id,
-                    "numero_turma": aluno.numero_turma,
-                    "nome": aluno.nome_completo,
-                    "sexo": aluno.sexo,
-                    "status": aluno.status,
-                }
-                for aluno in alunos
-            ],
+            "alunos": [cls._lista_alunos_linha(aluno) for aluno in alunos],
+        }
+
+    @classmethod
+    def lista_alunos_turma_linhas(cls, *, user, turma_id, lote=None):
+        """
+        Como lista_alunos_turma, com "alunos" num gerador para a exportação: a
+        ordenação passa para a base de dados e os alunos são lidos em streaming.
+        Devolve (dados, total_de_linhas).
+        """
+        turma = cls._lista_alunos_contexto(user, turma_id)
+        alunos = Aluno.objects.filter(turma_atual=turma, ativo=True).order_by(
+            F('numero_turma').asc(nulls_last=True), 'nome_completo', 'id'
+        )
+        linhas = (
+            cls._lista_alunos_linha(aluno)
+            for aluno in alunos.iterator(chunk_size=lote or cls.LOTE_EXPORTACAO)
+        )
+        dados = {
+            "turma": {"id": turma.id, "nome": turma.nome, "classe": turma.classe.nome},
+            "alunos": linhas,
         }
+        return dados, alunos.count()
 
     @classmethod
     def aprovados_reprovados_turma(cls, *, user, turma_id, trimestre):
@@ -1,74 +1,118 @@
-import uuid
+import time
 
 from celery import shared_task
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from rest_framework.exceptions import APIException
 
+from .cache import ReportCache
 from .services import ReportService
+from .exports import (
+    ESTADO_PROGRESSO,
+    ExportacaoErro,
+    gravar_exportacao,
+    limpar_exportacoes_expiradas,
+    meta_progresso,
+    tarefa_key,
+)
 from . import xlsx as report_xlsx
 
 
-REPORT_BUILDERS = {
-    "pauta_turma": lambda user, params: report_xlsx.pauta_turma_xlsx(
-        ReportService.pauta_turma(
-            user=user,
-            turma_id=params.get("turma_id"),
-            disciplina_id=params.get("disciplina_id"),
-        )
-    ),
-    "pauta_turma_geral": lambda user, params: report_xlsx.pauta_turma_geral_xlsx(
-        ReportService.pauta_turma_geral(
-            user=user,
-            turma_id=params.get("turma_id"),
-            trimestre=params.get("trimestre"),
-        )
-    ),
-    "declaracao_aluno": lambda user, params: report_xlsx.declaracao_aluno_xlsx(
-        ReportService.declaracao_aluno(
-            user=user,
-            aluno_id=params.get("aluno_id"),
-        )
-    ),
-    "situacao_academica": lambda user, params: report_xlsx.situacao_academica_xlsx(
-        ReportService.situacao_academica(
-            user=user,
-            aluno_id=params.get("aluno_id"),
-        )
-    ),
-    "lista_alunos_turma": lambda user, params: report_xlsx.lista_alunos_turma_xlsx(
-        ReportService.lista_alunos_turma(
-            user=user,
-            turma_id=params.get("turma_id"),
-        )
+REPORT_SHEETS = {
+    "pauta_turma": report_xlsx.pauta_turma_sheets,
+    "pauta_turma_geral": report_xlsx.pauta_turma_geral_sheets,
+    "declaracao_aluno": report_xlsx.declaracao_aluno_sheets,
+    "situacao_academica": report_xlsx.situacao_academica_sheets,
+    "lista_alunos_turma": report_xlsx.lista_alunos_turma_sheets,
+    "aprovados_reprovados_turma": report_xlsx.aprovados_reprovados_turma_sheets,
+    "caderneta": report_xlsx.caderneta_sheets,
+}
+
+# Listas do relatório que dão origem às linhas da folha (para o progresso)
+REPORT_ROWS = {
+    "pauta_turma": ("pauta",),
+    "pauta_turma_geral": ("pauta",),
+    "declaracao_aluno": ("disciplinas",),
+    "situacao_academica": ("disciplinas",),
+    "lista_alunos_turma": ("alunos",),
+    "aprovados_reprovados_turma": ("aprovados", "reprovados", "sem_dados"),
+    "caderneta": ("rows",),
+}
+
+
+# Relatórios grandes exportados em streaming: as linhas vêm de um gerador sobre
+# querysets lidos com .iterator(), sem montar o relatório inteiro nem passar pela
+# ReportCache. Devolvem (dados, total_de_linhas).
+REPORT_STREAMS = {
+    "pauta_turma": lambda user, params: ReportService.pauta_turma_linhas(
+        user=user,
+        turma_id=params.get("turma_id"),
+        disciplina_id=params.get("disciplina_id"),
     ),
-    "aprovados_reprovados_turma": lambda user, params: report_xlsx.aprovados_reprovados_turma_xlsx(
-        ReportService.aprovados_reprovados_turma(
-            user=user,
-            turma_id=params.get("turma_id"),
-            trimestre=params.get("trimestre"),
-        )
+    "pauta_turma_geral": lambda user, params: ReportService.pauta_turma_geral_linhas(
+        user=user,
+        turma_id=params.get("turma_id"),
+        trimestre=params.get("trimestre"),
     ),
-    "caderneta": lambda user, params: report_xlsx.caderneta_xlsx(
-        ReportService.caderneta(
-            user=user,
-            turma_id=params.get("turma_id"),
-            disciplina_id=params.get("disciplina_id"),
-            ano_letivo=params.get("ano_letivo"),
-        )
+    "lista_alunos_turma": lambda user, params: ReportService.lista_alunos_turma_linhas(
+        user=user,
+        turma_id=params.get("turma_id"),
     ),
 }
 
 
-def build_cache_key():
-    return f"relatorio:xlsx:{uuid.uuid4().hex}"
+def _builder(tipo, to_sheets):
+    def build(user, params):
+        if tipo in REPORT_STREAMS:
+            data, total = REPORT_STREAMS[tipo](user, params)
+            return to_sheets(data), total
+        data = ReportCache.obter(tipo, user, params)
+        total = sum(len(data[chave]) for chave in REPORT_ROWS[tipo])
+        return to_sheets(data), total
+    return build
 
 
-@shared_task
-def gerar_relatorio_xlsx(tipo, user_id, params, cache_key, ttl=3600):
+REPORT_BUILDERS = {tipo: _builder(tipo, to_sheets) for tipo, to_sheets in REPORT_SHEETS.items()}
+
+
+def _atualizar_progresso(task, meta):
+    # Em modo eager sem resultados guardados não há backend para onde escrever
+    if task.request.is_eager and not task.store_eager_result:
+        return
+    task.update_state(state=ESTADO_PROGRESSO, meta=meta)
+
+
+@shared_task(bind=True)
+def gerar_relatorio_xlsx(self, tipo, user_id, params, cache_key, ttl=3600):
     if tipo not in REPORT_BUILDERS:
-        raise ValueError("Tipo de relatório inválido.")
+        raise ExportacaoErro("tipo_invalido", "Tipo de relatório inválido.")
+
+    try:
+        user = get_user_model().objects.filter(id=user_id).first()
+        if user is None:
+            raise ExportacaoErro("utilizador_inexistente", "Utilizador não encontrado.")
+
+        _atualizar_progresso(self, meta_progresso(user.school_id, "a_preparar"))
+        try:
+            sheets, total = REPORT_BUILDERS[tipo](user, params or {})
+        except APIException as exc:
+            detalhe = exc.detail if isinstance(exc.detail, list) else [exc.detail]
+            raise ExportacaoErro(exc.default_code, " ".join(map(str, detalhe)), user.school_id) from exc
 
-    user = get_user_model().objects.get(id=user_id)
-    content = REPORT_BUILDERS[tipo](user, params or {})
-    cache.set(cache_key, content, timeout=ttl)
-    return {"cache_key": cache_key}
+        inicio = time.time()
+
+        def progresso(processadas):
+            _atualizar_progresso(
+                self, meta_progresso(user.school_id, "a_escrever", processadas, total, inicio)
+            )
+
+        gravar_exportacao(cache_key, tipo, params or {}, sheets, user.school_id, ttl=ttl, progresso=progresso)
+    finally:
+        # Liberta a chave para novos pedidos, mesmo em caso de falha
+        cache.delete(tarefa_key(cache_key))
+    return {"cache_key": cache_key, "school_id": user.school_id, "total": total}
+
+
+@shared_task
+def limpar_exportacoes_xlsx():
+    return {"removidos": limpar_exportacoes_expiradas()}
@@ -0,0 +1,478 @@
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+
+from celery.backends.cache import CacheBackend
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from openpyxl import load_workbook
+from rest_framework import status
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.test import APIClient
+
+from core.models import CustomUser, District, School
+from salamandra_sge.accounts.access import UserAccessContext
+from salamandra_sge.academico.models import (
+    Aluno,
+    Classe,
+    DirectorTurma,
+    Disciplina,
+    Professor,
+    ProfessorTurmaDisciplina,
+    Turma,
+)
+from salamandra_sge.avaliacoes.models import Nota
+from salamandra_sge.avaliacoes.services.recalculo import recalcular_resumos
+from salamandra_sge.celery import app
+from salamandra_sge.relatorios.cache import REPORTS
+from salamandra_sge.relatorios.etags import report_etag
+from salamandra_sge.relatorios.services import ReportService
+from salamandra_sge.relatorios.tasks import REPORT_SHEETS, REPORT_STREAMS, gerar_relatorio_xlsx
+from salamandra_sge.relatorios.exports import (
+    ESTADO_PROGRESSO,
+    emitir_token,
+    export_cache_key,
+    limpar_exportacoes_expiradas,
+    meta_progresso,
+    obter_exportacao,
+    tarefa_key,
+)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ReportQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.district = District.objects.create(name="Distrito Teste")
+        self.school = School.objects.create(name="Escola Teste", district=self.district)
+        self.admin = CustomUser.objects.create_user(
+            email="admin@escola.com", password="password123", role="ADMIN_ESCOLA", school=self.school
+        )
+        prof_user = CustomUser.objects.create_user(
+            email="prof@escola.com", password="password123", role="PROFESSOR", school=self.school
+        )
+        self.professor = Professor.objects.create(user=prof_user, school=self.school)
+        self.client.force_authenticate(user=self.admin)
+
+        self.classe = Classe.objects.create(school=self.school, nome="10ª Classe")
+        self.turma = Turma.objects.create(school=self.school, nome="A", classe=self.classe, ano_letivo=2026)
+        self.disciplina = Disciplina.objects.create(school=self.school, nome="Matemática")
+        ProfessorTurmaDisciplina.objects.create(
+            school=self.school,
+            professor=self.professor,
+            turma=self.turma,
+            disciplina=self.disciplina,
+        )
+        self.total_alunos = 0
+
+    def _add_alunos(self, total, disciplinas=None):
+        disciplinas = disciplinas or [self.disciplina]
+        for _ in range(total):
+            self.total_alunos += 1
+            aluno = Aluno.objects.create(
+                nome_completo=f"Aluno {self.total_alunos:03d}",
+                data_nascimento="2010-01-01",
+                school=self.school,
+                classe_atual=self.classe,
+                turma_atual=self.turma,
+                numero_turma=self.total_alunos,
+                sexo="HOMEM" if self.total_alunos % 2 else "MULHER",
+            )
+            for disciplina in disciplinas:
+                for trimestre in [1, 2, 3]:
+                    for tipo, valor in [("ACS1", 10), ("ACS2", 9), ("MAP", 12), ("ACP", 11)]:
+                        Nota.objects.create(
+                            school=self.school,
+                            aluno=aluno,
+                            turma=self.turma,
+                            disciplina=disciplina,
+                            tipo=tipo,
+                            trimestre=trimestre,
+                            valor=Decimal(valor),
+                        )
+
+    def _count_queries(self, url, params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response
+
+    def test_pauta_turma_constant_queries(self):
+        url = reverse('relatorio-pauta-turma')
+        params = {"turma_id": self.turma.id, "disciplina_id": self.disciplina.id}
+
+        self._add_alunos(2)
+        queries_small, _ = self._count_queries(url, params)
+
+        self._add_alunos(20)
+        queries_large, response = self._count_queries(url, params)
+
+        self.assertEqual(queries_small, queries_large)
+        self.assertEqual(len(response.data["pauta"]), 22)
+
+        tri1 = response.data["pauta"][0]["trimesters"][1]
+        self.assertEqual(tri1["acs"], [10.0, 9.0])
+        self.assertEqual(tri1["map"], 12.0)
+        # MACS = (10 + 9 + 12) / 3 = 10.33; MT = (2 * 10.33 + 11) / 3 = 10.55 -> 11
+        self.assertEqual(tri1["macs"], 10.33)
+        self.assertEqual(tri1["mt"], 11)
+        self.assertEqual(tri1["com"], "S")
+        self.assertEqual(response.data["pauta"][0]["mfd"], 11.0)
+
+    def test_situacao_academica_constant_queries(self):
+        self._add_alunos(1)
+        aluno = Aluno.objects.get(turma_atual=self.turma)
+        url = reverse('aluno-situacao-academica', args=[aluno.id])
+
+        queries_small, _ = self._count_queries(url, {})
+
+        extra = [
+            Disciplina.objects.create(school=self.school, nome=f"Disciplina {i}", ordem=i + 1)
+            for i in range(5)
+        ]
+        for disciplina in extra:
+            for trimestre in [1, 2, 3]:
+                Nota.objects.create(
+                    school=self.school,
+                    aluno=aluno,
+                    turma=self.turma,
+                    disciplina=disciplina,
+                    tipo="ACS1",
+                    trimestre=trimestre,
+                    valor=Decimal(14),
+                )
+        queries_large, response = self._count_queries(url, {})
+
+        self.assertEqual(queries_small, queries_large)
+        self.assertEqual(len(response.data), 6)
+        matematica = next(d for d in response.data if d["disciplina_id"] == self.disciplina.id)
+        self.assertEqual(matematica["trimesters"][2]["mt"], 11)
+        self.assertEqual(matematica["mfd"], 11.0)
+        outra = next(d for d in response.data if d["disciplina_id"] == extra[0].id)
+        self.assertEqual(outra["trimesters"][1]["macs"], 14.0)
+        self.assertIsNone(outra["trimesters"][1]["mt"])
+
+    def test_pauta_turma_xlsx_streaming(self):
+        self._add_alunos(3)
+        response = self.client.get(
+            reverse('relatorio-pauta-turma-xlsx'),
+            {"turma_id": self.turma.id, "disciplina_id": self.disciplina.id},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertIn("pauta_turma.xlsx", response["Content-Disposition"])
+
+        wb = load_workbook(BytesIO(b"".join(response.streaming_content)))
+        linhas = list(wb["Pauta"].iter_rows(values_only=True))
+        self.assertEqual(len(linhas), 4)
+        self.assertEqual(linhas[0][:3], ("Numero", "Aluno", "T1_ACS1"))
+        self.assertEqual(linhas[1][:3], (1, "Aluno 001", 10))
+
+    def test_exportacao_em_streaming_igual_ao_relatorio(self):
+        self._add_alunos(5)
+        segunda = Disciplina.objects.create(school=self.school, nome="Física", ordem=1)
+        ProfessorTurmaDisciplina.objects.create(
+            school=self.school, professor=self.professor, turma=self.turma, disciplina=segunda
+        )
+        # Aluno sem número (vai para o fim da lista) e sem notas
+        Aluno.objects.create(
+            nome_completo="Aluno 000", data_nascimento="2010-01-01", school=self.school,
+            classe_atual=self.classe, turma_atual=self.turma, sexo="MULHER",
+        )
+        recalcular_resumos(turma=self.turma)
+
+        todos = {
+            "pauta_turma": {"turma_id": self.turma.id, "disciplina_id": self.disciplina.id},
+            "pauta_turma_geral": {"turma_id": self.turma.id, "trimestre": "1"},
+            "lista_alunos_turma": {"turma_id": self.turma.id},
+        }
+        self.assertEqual(set(todos), set(REPORT_STREAMS))
+        ReportService.LOTE_EXPORTACAO, lote = 2, ReportService.LOTE_EXPORTACAO
+        self.addCleanup(setattr, ReportService, "LOTE_EXPORTACAO", lote)
+
+        for tipo, params in todos.items():
+            with self.subTest(tipo=tipo):
+                esperado = REPORT_SHEETS[tipo](REPORTS[tipo](self.admin, params))
+                dados, total = REPORT_STREAMS[tipo](self.admin, params)
+                folhas = REPORT_SHEETS[tipo](dados)
+                self.assertEqual(total, 6)
+                self.assertEqual(
+                    [(titulo, cabecalho, list(linhas)) for titulo, cabecalho, linhas in folhas],
+                    [(titulo, cabecalho, list(linhas)) for titulo, cabecalho, linhas in esperado],
+                )
+
+        # A validação é feita logo, antes de qualquer linha ser gerada
+        with self.assertRaises(PermissionDenied):
+            ReportService.lista_alunos_turma_linhas(user=self.professor.user, turma_id=self.turma.id)
+
+    def test_pauta_turma_etag(self):
+        self._add_alunos(3)
+        url = reverse('relatorio-pauta-turma')
+        params = {"turma_id": self.turma.id, "disciplina_id": self.disciplina.id}
+
+        queries_completo, response = self._count_queries(url, params)
+        etag = response["ETag"]
+        self.assertEqual(response["Cache-Control"], "private, no-cache")
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+        self.assertFalse(any('"avaliacoes_nota"' in q["sql"] for q in ctx.captured_queries))
+
+        # Recálculo das notas incrementa a versão: novo ETag e Last-Modified
+        recalcular_resumos(turma=self.turma)
+        _, response = self._count_queries(url, {**params})
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertIn("Last-Modified", response)
+        etag = response["ETag"]
+
+        # Alterações à lista de alunos também mudam o ETag
+        self._add_alunos(1)
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["pauta"]), 4)
+
+    def test_etag_sem_permissao_nao_responde_304(self):
+        url = reverse('relatorio-pauta-turma')
+        params = {"turma_id": self.turma.id, "disciplina_id": self.disciplina.id}
+        _, response = self._count_queries(url, params)
+
+        self.client.force_authenticate(user=self.professor.user)
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_cache_resultados_relatorio(self):
+        self._add_alunos(3)
+        url = reverse('relatorio-pauta-turma')
+        params = {"turma_id": self.turma.id, "disciplina_id": self.disciplina.id}
+
+        _, primeira = self._count_queries(url, params)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, primeira.data)
+        self.assertFalse(any('"avaliacoes_nota"' in q["sql"] for q in ctx.captured_queries))
+
+        # O recálculo muda a versão das notas e, com ela, a chave da cache
+        recalcular_resumos(turma=self.turma)
+        self._count_queries(url, params)
+
+        metricas = self.client.get(reverse('relatorio-cache-metricas'))
+        self.assertEqual(metricas.status_code, status.HTTP_200_OK)
+        self.assertEqual(metricas.data["pauta_turma"]["hits"], 1)
+        self.assertEqual(metricas.data["pauta_turma"]["misses"], 2)
+
+        self.client.force_authenticate(user=self.professor.user)
+        metricas = self.client.get(reverse('relatorio-cache-metricas'))
+        self.assertEqual(metricas.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_exportacao_xlsx_deduplicada(self):
+        eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, "task_always_eager", eager)
+        self._add_alunos(2)
+        url = reverse('relatorio-exportar-xlsx-async')
+        params = {"turma_id": self.turma.id, "disciplina_id": self.disciplina.id}
+        payload = {"tipo": "pauta_turma", "params": params}
+
+        primeira = self.client.post(url, payload, format="json")
+        self.assertEqual(primeira.status_code, status.HTTP_200_OK)
+        self.assertFalse(primeira.data["coalesced"])
+        etag, _ = report_etag("pauta_turma", self.admin, params)
+        primeira_chave = export_cache_key("pauta_turma", self.admin, params, etag)
+        self.assertIsNotNone(obter_exportacao(primeira_chave))
+        self.assertIsNone(cache.get(tarefa_key(primeira_chave)))
+
+        # Mesmo estado dos dados: o ficheiro já gerado é reutilizado sem nova tarefa,
+        # mas cada pedido recebe um token próprio
+        segunda = self.client.post(url, payload, format="json")
+        self.assertTrue(segunda.data["coalesced"])
+        self.assertIsNone(segunda.data["task_id"])
+        self.assertNotEqual(segunda.data["token"], primeira.data["token"])
+
+        # Um Director de Turma pode ver a pauta, mas não partilha o ficheiro da direção
+        DirectorTurma.objects.create(
+            school=self.school, professor=self.professor, turma=self.turma, ano_letivo=self.turma.ano_letivo
+        )
+        self.assertNotEqual(export_cache_key("pauta_turma", self.professor.user, params, etag), primeira_chave)
+
+        # Notas alteradas: nova chave; com uma tarefa já em curso, o pedido junta-se a ela
+        recalcular_resumos(turma=self.turma)
+        etag, _ = report_etag("pauta_turma", self.admin, params)
+        cache_key = export_cache_key("pauta_turma", self.admin, params, etag)
+        self.assertNotEqual(cache_key, primeira_chave)
+        cache.add(tarefa_key(cache_key), "tarefa-em-curso")
+        terceira = self.client.post(url, payload, format="json")
+        self.assertEqual(terceira.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(terceira.data["task_id"], "tarefa-em-curso")
+        self.assertTrue(terceira.data["coalesced"])
+
+        # Sem permissão sobre a turma, não há exportação
+        self.client.force_authenticate(user=CustomUser.objects.create_user(
+            email="outro@escola.com", password="password123", role="PROFESSOR", school=self.school
+        ))
+        response = self.client.post(url, payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_exportacao_xlsx_em_ficheiro(self):
+        eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, "task_always_eager", eager)
+        self._add_alunos(2)
+        payload = {
+            "tipo": "pauta_turma",
+            "params": {"turma_id": self.turma.id, "disciplina_id": self.disciplina.id},
+        }
+        token = self.client.post(reverse('relatorio-exportar-xlsx-async'), payload, format="json").data["token"]
+        etag, _ = report_etag("pauta_turma", self.admin, payload["params"])
+        cache_key = export_cache_key("pauta_turma", self.admin, payload["params"], etag)
+
+        # Na cache ficam só os metadados; o conteúdo está no armazenamento de ficheiros
+        metadados = cache.get(cache_key)
+        self.assertEqual(metadados["filename"], "pauta_turma.xlsx")
+        self.assertGreater(metadados["size"], 0)
+
+        # A chave interna não serve para descarregar; só o token emitido
+        response = self.client.get(reverse('relatorio-baixar-xlsx'), {"token": cache_key})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('relatorio-baixar-xlsx'), {"token": token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('filename="pauta_turma.xlsx"', response["Content-Disposition"])
+        wb = load_workbook(BytesIO(b"".join(response.streaming_content)), read_only=True)
+        self.assertEqual(len(list(wb["Pauta"].iter_rows(values_only=True))), 3)
+
+        # O token é de quem o pediu: outros utilizadores, da mesma escola ou de
+        # outra, não descarregam o ficheiro com ele
+        outra_escola = School.objects.create(name="Outra Escola", district=self.district)
+        estranho = CustomUser.objects.create_user(
+            email="admin@outra.com", password="password123", role="ADMIN_ESCOLA", school=outra_escola
+        )
+        for utilizador in (self.professor.user, estranho):
+            self.client.force_authenticate(user=utilizador)
+            response = self.client.get(reverse('relatorio-baixar-xlsx'), {"token": token})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(user=self.admin)
+
+        # Nova geração para a mesma chave: ficheiro novo, o anterior continua legível
+        # até à limpeza
+        anterior = metadados["path"]
+        gerar_relatorio_xlsx.delay("pauta_turma", self.admin.id, payload["params"], cache_key)
+        metadados = cache.get(cache_key)
+        self.assertNotEqual(metadados["path"], anterior)
+        self.assertTrue(default_storage.exists(anterior))
+
+        # Tokens que apontam para fora do prefixo das exportações não dão acesso
+        # a outras entradas da cache
+        cache.set("relatorio:xlsx:outra", {"path": metadados["path"]})
+        outro_token = emitir_token("relatorio:xlsx:outra", self.admin)
+        response = self.client.get(reverse('relatorio-baixar-xlsx'), {"token": outro_token})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.assertEqual(limpar_exportacoes_expiradas(), 0)
+        self.assertEqual(limpar_exportacoes_expiradas(idade=-timedelta(minutes=1)), 2)
+        response = self.client.get(reverse('relatorio-baixar-xlsx'), {"token": token})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_exportacao_xlsx_revalida_permissao(self):
+        eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, "task_always_eager", eager)
+        self._add_alunos(2)
+        director = DirectorTurma.objects.create(
+            school=self.school, professor=self.professor, turma=self.turma, ano_letivo=self.turma.ano_letivo
+        )
+        payload = {
+            "tipo": "pauta_turma",
+            "params": {"turma_id": self.turma.id, "disciplina_id": self.disciplina.id},
+        }
+        self.client.force_authenticate(user=self.professor.user)
+        token = self.client.post(reverse('relatorio-exportar-xlsx-async'), payload, format="json").data["token"]
+        response = self.client.get(reverse('relatorio-baixar-xlsx'), {"token": token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response.close()
+
+        # Deixou de ser Director de Turma: o token ainda válido já não serve
+        director.delete()
+        UserAccessContext.invalidar([self.professor.user_id])
+        self.client.force_authenticate(user=CustomUser.objects.get(id=self.professor.user_id))
+        response = self.client.get(reverse('relatorio-baixar-xlsx'), {"token": token})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def _resultados_em_memoria(self):
+        """Tarefas eager com resultados guardados num backend em memória."""
+        anteriores = (
+            app.conf.task_always_eager,
+            app.conf.task_store_eager_result,
+            gerar_relatorio_xlsx.store_eager_result,
+        )
+
+        def repor():
+            (
+                app.conf.task_always_eager,
+                app.conf.task_store_eager_result,
+                gerar_relatorio_xlsx.store_eager_result,
+            ) = anteriores
+            app._local.__dict__.pop("backend", None)
+
+        app.conf.task_always_eager = True
+        app.conf.task_store_eager_result = True
+        gerar_relatorio_xlsx.store_eager_result = True
+        app._local.backend = CacheBackend(app=app, url="memory://")
+        self.addCleanup(repor)
+
+    def test_estado_exportacao(self):
+        self._resultados_em_memoria()
+        self._add_alunos(2)
+        url = reverse('relatorio-estado-exportacao')
+        params = {"turma_id": self.turma.id, "disciplina_id": self.disciplina.id}
+        response = self.client.post(
+            reverse('relatorio-exportar-xlsx-async'), {"tipo": "pauta_turma", "params": params}, format="json"
+        )
+        task_id = response.data["task_id"]
+        self.assertEqual(response.data["status_url"], f"{url}?task_id={task_id}")
+
+        response = self.client.get(url, {"task_id": task_id})
+        self.assertEqual(response.data["estado"], "CONCLUIDO")
+        self.assertEqual(response.data["progresso"], 100)
+        self.assertEqual(response.data["processadas"], 2)
+        self.assertEqual(response.data["download_url"], f"{reverse('relatorio-baixar-xlsx')}?token={response.data['token']}")
+        download = self.client.get(response.data["download_url"])
+        self.assertEqual(download.status_code, status.HTTP_200_OK)
+
+        # Em curso: percentagem das linhas escritas e tempo restante estimado
+        app.backend.store_result(
+            "em-curso",
+            meta_progresso(self.school.id, "a_escrever", 50, 200, time.time() - 10),
+            ESTADO_PROGRESSO,
+        )
+        response = self.client.get(url, {"task_id": "em-curso"})
+        self.assertEqual(response.data["estado"], "EM_CURSO")
+        self.assertEqual(response.data["progresso"], 23)
+        self.assertAlmostEqual(response.data["eta_segundos"], 30, delta=2)
+        self.assertEqual(response["Retry-After"], "15")
+
+        # Falha com motivo estruturado
+        task = gerar_relatorio_xlsx.apply_async(
+            args=("pauta_turma", self.professor.user.id, params, "relatorio:xlsx:pauta_turma:x"),
+            task_id="sem-permissao",
+        )
+        self.assertEqual(task.state, "FAILURE")
+        response = self.client.get(url, {"task_id": "sem-permissao"})
+        self.assertEqual(response.data["estado"], "FALHOU")
+        self.assertEqual(response.data["erro"]["codigo"], "permission_denied")
+        self.assertEqual(response.data["erro"]["mensagem"], "Sem permissão para visualizar esta pauta.")
+
+        # Tarefas de outra escola não são visíveis
+        outra = School.objects.create(name="Outra Escola", district=self.district)
+        app.backend.store_result("outra", meta_progresso(outra.id, "a_preparar"), ESTADO_PROGRESSO)
+        response = self.client.get(url, {"task_id": "outra"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
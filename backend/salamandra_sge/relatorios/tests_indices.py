@@ -0,0 +1,141 @@
+import re
+import unittest
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.models import CustomUser, District, School
+from salamandra_sge.academico.models import (
+    Aluno,
+    Classe,
+    Disciplina,
+    Professor,
+    ProfessorTurmaDisciplina,
+    Turma,
+)
+from salamandra_sge.avaliacoes.models import Nota, ResumoTrimestral
+from salamandra_sge.avaliacoes.services.recalculo import recalcular_resumos
+from salamandra_sge.relatorios.cache import REPORTS
+
+# Tabelas grandes em que os relatórios nunca devem fazer leitura sequencial
+TABELAS_INDEXADAS = (Nota._meta.db_table, ResumoTrimestral._meta.db_table, Aluno._meta.db_table)
+SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+# Apanha "Index Scan using x", "Index Only Scan using x" e "Bitmap Index Scan on x"
+INDEX_SCAN = re.compile(r'Index (?:Only )?Scan (?:using|on) (\w+)')
+
+# Índices compostos que cada relatório tem de usar; os índices simples das FKs
+# com as mesmas colunas iniciais foram removidos, por isso não há alternativa
+INDICES_ESPERADOS = {
+    "pauta_turma": {"nota_turma_disc_ano_tri_idx", "aluno_turma_ativo_idx"},
+    "pauta_turma_geral": {"resumo_turma_ano_tri_idx", "aluno_turma_ativo_idx"},
+    "declaracao_aluno": {"resumo_aluno_ano_idx"},
+    "situacao_academica": {"nota_aluno_ano_idx"},
+    "lista_alunos_turma": {"aluno_turma_ativo_idx"},
+    "aprovados_reprovados_turma": {"resumo_turma_ano_tri_idx", "aluno_turma_ativo_idx"},
+    "caderneta": {"nota_turma_disc_ano_tri_idx", "aluno_turma_ativo_idx"},
+}
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "EXPLAIN dos relatórios requer PostgreSQL (DATABASE_URL).")
+class ReportIndexPlanTests(TestCase):
+    """
+    Corre os relatórios principais, captura as queries emitidas e verifica com
+    EXPLAIN que as que tocam notas, resumos e alunos usam os índices compostos
+    esperados. Com enable_seqscan desligado o planeador só recorre a Seq Scan
+    quando nenhum índice serve o filtro, independentemente do volume de dados
+    do teste.
+    """
+
+    def setUp(self):
+        district = District.objects.create(name="Distrito Teste")
+        self.school = School.objects.create(name="Escola Teste", district=district)
+        self.admin = CustomUser.objects.create_user(
+            email="admin@escola.com", password="password123", role="ADMIN_ESCOLA", school=self.school
+        )
+        prof_user = CustomUser.objects.create_user(
+            email="prof@escola.com", password="password123", role="PROFESSOR", school=self.school
+        )
+        professor = Professor.objects.create(user=prof_user, school=self.school)
+
+        self.classe = Classe.objects.create(school=self.school, nome="10ª Classe")
+        self.turma = Turma.objects.create(school=self.school, nome="A", classe=self.classe, ano_letivo=2026)
+        self.disciplina = Disciplina.objects.create(school=self.school, nome="Matemática")
+        ProfessorTurmaDisciplina.objects.create(
+            school=self.school, professor=professor, turma=self.turma, disciplina=self.disciplina
+        )
+
+        for numero in range(1, 6):
+            aluno = Aluno.objects.create(
+                nome_completo=f"Aluno {numero:03d}",
+                data_nascimento="2010-01-01",
+                school=self.school,
+                classe_atual=self.classe,
+                turma_atual=self.turma,
+                numero_turma=numero,
+                sexo="HOMEM" if numero % 2 else "MULHER",
+            )
+            for trimestre in [1, 2, 3]:
+                for tipo, valor in [("ACS1", 10), ("MAP", 12), ("ACP", 11)]:
+                    Nota.objects.create(
+                        school=self.school,
+                        aluno=aluno,
+                        turma=self.turma,
+                        disciplina=self.disciplina,
+                        tipo=tipo,
+                        trimestre=trimestre,
+                        valor=Decimal(valor),
+                    )
+        self.aluno = aluno
+        recalcular_resumos(school=self.school)
+
+    def _relatorios(self):
+        turma, disciplina = self.turma.id, self.disciplina.id
+        return {
+            "pauta_turma": {"turma_id": turma, "disciplina_id": disciplina},
+            "pauta_turma_geral": {"turma_id": turma, "trimestre": 1},
+            "declaracao_aluno": {"aluno_id": self.aluno.id},
+            "situacao_academica": {"aluno_id": self.aluno.id},
+            "lista_alunos_turma": {"turma_id": turma},
+            "aprovados_reprovados_turma": {"turma_id": turma, "trimestre": 1},
+            "caderneta": {"turma_id": turma, "disciplina_id": disciplina, "ano_letivo": 2026},
+        }
+
+    def _plano(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN {sql}")
+            return "\n".join(linha[0] for linha in cursor.fetchall())
+
+    def test_relatorios_usam_indices_compostos(self):
+        leituras = []
+        em_falta = []
+        for nome, params in self._relatorios().items():
+            with CaptureQueriesContext(connection) as ctx:
+                REPORTS[nome](self.admin, params)
+
+            usados = set()
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+            try:
+                for query in ctx.captured_queries:
+                    sql = query["sql"]
+                    if not sql.lstrip().upper().startswith("SELECT"):
+                        continue
+                    if not any(f'"{tabela}"' in sql for tabela in TABELAS_INDEXADAS):
+                        continue
+                    plano = self._plano(sql)
+                    usados.update(INDEX_SCAN.findall(plano))
+                    tabelas = set(SEQ_SCAN.findall(plano)) & set(TABELAS_INDEXADAS)
+                    if tabelas:
+                        leituras.append(f"{nome}: Seq Scan em {', '.join(sorted(tabelas))}\n  {sql}")
+            finally:
+                with connection.cursor() as cursor:
+                    cursor.execute("RESET enable_seqscan")
+
+            faltam = INDICES_ESPERADOS[nome] - usados
+            if faltam:
+                em_falta.append(f"{nome}: sem {', '.join(sorted(faltam))} (usados: {', '.join(sorted(usados)) or '-'})")
+
+        self.assertEqual(leituras, [], "\n".join(leituras))
+        self.assertEqual(em_falta, [], "\n".join(em_falta))
@@ -1,107 +1,130 @@
-from io import BytesIO
+import tempfile
 
+from django.http import StreamingHttpResponse
 from openpyxl import Workbook
 
 
-def _as_bytes(workbook):
-    buf = BytesIO()
-    workbook.save(buf)
-    return buf.getvalue()
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+STREAM_CHUNK_SIZE = 64 * 1024
+PROGRESSO_INTERVALO = 100
+
+TRIMESTRE_HEADER = ["ACS1", "ACS2", "ACS3", "MAP", "MACS", "ACP", "MT", "COM"]
+CADERNETA_TRIMESTRE_HEADER = ["ACS1", "ACS2", "ACS3", "MAP", "ACP", "MACS", "MT", "COM"]
 
 
 def _safe_value(value):
     return "" if value is None else value
 
 
-def pauta_turma_xlsx(data):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Pauta"
+def _trimestre_header(colunas):
+    return [f"T{tri}_{coluna}" for tri in (1, 2, 3) for coluna in colunas]
+
 
-    header = [
-        "Numero",
-        "Aluno",
-        "T1_ACS1", "T1_ACS2", "T1_ACS3", "T1_MAP", "T1_MACS", "T1_ACP", "T1_MT", "T1_COM",
-        "T2_ACS1", "T2_ACS2", "T2_ACS3", "T2_MAP", "T2_MACS", "T2_ACP", "T2_MT", "T2_COM",
-        "T3_ACS1", "T3_ACS2", "T3_ACS3", "T3_MAP", "T3_MACS", "T3_ACP", "T3_MT", "T3_COM",
-        "MFD",
+def _acs_list(tri):
+    acs = tri.get("acs") or []
+    return [
+        _safe_value(acs[0] if len(acs) > 0 else None),
+        _safe_value(acs[1] if len(acs) > 1 else None),
+        _safe_value(acs[2] if len(acs) > 2 else None),
     ]
-    ws.append(header)
-
-    for aluno in data["pauta"]:
-        t1 = aluno["trimesters"][1]
-        t2 = aluno["trimesters"][2]
-        t3 = aluno["trimesters"][3]
-
-        def _acs_list(tri):
-            acs = tri.get("acs") or []
-            return [
-                _safe_value(acs[0] if len(acs) > 0 else None),
-                _safe_value(acs[1] if len(acs) > 1 else None),
-                _safe_value(acs[2] if len(acs) > 2 else None),
-            ]
 
-        row = [
+
+def _trimestre_cells(tri):
+    return [
+        *_acs_list(tri),
+        _safe_value(tri.get("map")),
+        _safe_value(tri.get("macs")),
+        _safe_value(tri.get("acp")),
+        _safe_value(tri.get("mt")),
+        _safe_value(tri.get("com")),
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Escrita em modo write-only: as linhas são serializadas à medida que são
+# geradas, pelo que a memória não cresce com o número de linhas.
+# Cada relatório é descrito por uma lista de folhas (titulo, cabecalho, linhas).
+# ---------------------------------------------------------------------------
+
+def write_xlsx(sheets, target, progresso=None, intervalo=PROGRESSO_INTERVALO):
+    """
+    Escreve as folhas em `target` (caminho ou ficheiro binário aberto).
+    `progresso(linhas_escritas)` é chamado a cada `intervalo` linhas e no fim.
+    """
+    wb = Workbook(write_only=True)
+    escritas = 0
+    for title, header, rows in sheets:
+        ws = wb.create_sheet(title)
+        ws.append(header)
+        for row in rows:
+            ws.append(row)
+            escritas += 1
+            if progresso and escritas % intervalo == 0:
+                progresso(escritas)
+    if progresso:
+        progresso(escritas)
+    wb.save(target)
+    return target
+
+
+def iter_xlsx(sheets, chunk_size=STREAM_CHUNK_SIZE):
+    """Gera o XLSX num ficheiro temporário e devolve-o em blocos."""
+    with tempfile.TemporaryFile() as tmp:
+        write_xlsx(sheets, tmp)
+        tmp.seek(0)
+        while True:
+            chunk = tmp.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def streaming_response(sheets, filename):
+    response = StreamingHttpResponse(iter_xlsx(sheets), content_type=XLSX_CONTENT_TYPE)
+    response["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
+
+
+# ---------------------------------------------------------------------------
+# Folhas de cada relatório
+# ---------------------------------------------------------------------------
+
+def pauta_turma_sheets(data):
+    header = ["Numero", "Aluno", *_trimestre_header(TRIMESTRE_HEADER), "MFD"]
+    rows = (
+        [
             _safe_value(aluno.get("numero_turma")),
             aluno["nome"],
-            *_acs_list(t1),
-            _safe_value(t1.get("map")),
-            _safe_value(t1.get("macs")),
-            _safe_value(t1.get("acp")),
-            _safe_value(t1.get("mt")),
-            _safe_value(t1.get("com")),
-            *_acs_list(t2),
-            _safe_value(t2.get("map")),
-            _safe_value(t2.get("macs")),
-            _safe_value(t2.get("acp")),
-            _safe_value(t2.get("mt")),
-            _safe_value(t2.get("com")),
-            *_acs_list(t3),
-            _safe_value(t3.get("map")),
-            _safe_value(t3.get("macs")),
-            _safe_value(t3.get("acp")),
-            _safe_value(t3.get("mt")),
-            _safe_value(t3.get("com")),
+            *_trimestre_cells(aluno["trimesters"][1]),
+            *_trimestre_cells(aluno["trimesters"][2]),
+            *_trimestre_cells(aluno["trimesters"][3]),
             _safe_value(aluno.get("mfd")),
         ]
-        ws.append(row)
-
-    return _as_bytes(wb)
+        for aluno in data["pauta"]
+    )
+    return [("Pauta", header, rows)]
 
 
-def pauta_turma_geral_xlsx(data):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Pauta"
-
+def pauta_turma_geral_sheets(data):
     disciplinas = data["disciplinas"]
     header = ["Numero", "Aluno"] + [d["nome"] for d in disciplinas] + ["Media_Final", "Situacao"]
-    ws.append(header)
-
-    for aluno in data["pauta"]:
-        row = [
+    rows = (
+        [
             _safe_value(aluno.get("numero_turma")),
             aluno["nome"],
+            *(_safe_value(aluno["disciplinas"].get(disc["id"])) for disc in disciplinas),
+            _safe_value(aluno.get("media_final")),
+            aluno.get("situacao", ""),
         ]
-        for disc in disciplinas:
-            row.append(_safe_value(aluno["disciplinas"].get(disc["id"])))
-        row.append(_safe_value(aluno.get("media_final")))
-        row.append(aluno.get("situacao", ""))
-        ws.append(row)
-
-    return _as_bytes(wb)
-
+        for aluno in data["pauta"]
+    )
+    return [("Pauta", header, rows)]
 
-def declaracao_aluno_xlsx(data):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Declaracao"
 
+def declaracao_aluno_sheets(data):
     header = ["Disciplina", "T1", "T2", "T3", "MFD", "Situacao"]
-    ws.append(header)
-
-    for disc in data["disciplinas"]:
-        row = [
+    rows = (
+        [
             disc["disciplina_nome"],
             _safe_value(disc["trimestres"].get(1)),
             _safe_value(disc["trimestres"].get(2)),
@@ -109,166 +132,87 @@ def declaracao_aluno_xlsx(data):
             _safe_value(disc.get("mfd")),
             disc.get("situacao", ""),
         ]
-        ws.append(row)
-
-    return _as_bytes(wb)
-
-
-def situacao_academica_xlsx(data):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Situacao"
+        for disc in data["disciplinas"]
+    )
+    return [("Declaracao", header, rows)]
 
-    header = [
-        "Disciplina",
-        "T1_ACS1", "T1_ACS2", "T1_ACS3", "T1_MAP", "T1_MACS", "T1_ACP", "T1_MT", "T1_COM",
-        "T2_ACS1", "T2_ACS2", "T2_ACS3", "T2_MAP", "T2_MACS", "T2_ACP", "T2_MT", "T2_COM",
-        "T3_ACS1", "T3_ACS2", "T3_ACS3", "T3_MAP", "T3_MACS", "T3_ACP", "T3_MT", "T3_COM",
-        "MFD",
-    ]
-    ws.append(header)
-
-    for disc in data["disciplinas"]:
-        t1 = disc["trimesters"][1]
-        t2 = disc["trimesters"][2]
-        t3 = disc["trimesters"][3]
-
-        def _acs_list(tri):
-            acs = tri.get("acs") or []
-            return [
-                _safe_value(acs[0] if len(acs) > 0 else None),
-                _safe_value(acs[1] if len(acs) > 1 else None),
-                _safe_value(acs[2] if len(acs) > 2 else None),
-            ]
 
-        row = [
+def situacao_academica_sheets(data):
+    header = ["Disciplina", *_trimestre_header(TRIMESTRE_HEADER), "MFD"]
+    rows = (
+        [
             disc["disciplina_nome"],
-            *_acs_list(t1),
-            _safe_value(t1.get("map")),
-            _safe_value(t1.get("macs")),
-            _safe_value(t1.get("acp")),
-            _safe_value(t1.get("mt")),
-            _safe_value(t1.get("com")),
-            *_acs_list(t2),
-            _safe_value(t2.get("map")),
-            _safe_value(t2.get("macs")),
-            _safe_value(t2.get("acp")),
-            _safe_value(t2.get("mt")),
-            _safe_value(t2.get("com")),
-            *_acs_list(t3),
-            _safe_value(t3.get("map")),
-            _safe_value(t3.get("macs")),
-            _safe_value(t3.get("acp")),
-            _safe_value(t3.get("mt")),
-            _safe_value(t3.get("com")),
+            *_trimestre_cells(disc["trimesters"][1]),
+            *_trimestre_cells(disc["trimesters"][2]),
+            *_trimestre_cells(disc["trimesters"][3]),
             _safe_value(disc.get("mfd")),
         ]
-        ws.append(row)
-
-    return _as_bytes(wb)
-
-
-def caderneta_xlsx(data):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Caderneta"
-
-    header = [
-        "Numero",
-        "Aluno",
-        "Sexo",
-        "Status",
-        "T1_ACS1", "T1_ACS2", "T1_ACS3", "T1_MAP", "T1_ACP", "T1_MACS", "T1_MT", "T1_COM",
-        "T2_ACS1", "T2_ACS2", "T2_ACS3", "T2_MAP", "T2_ACP", "T2_MACS", "T2_MT", "T2_COM",
-        "T3_ACS1", "T3_ACS2", "T3_ACS3", "T3_MAP", "T3_ACP", "T3_MACS", "T3_MT", "T3_COM",
-        "MFD",
+        for disc in data["disciplinas"]
+    )
+    return [("Situacao", header, rows)]
+
+
+def _caderneta_trimestre_cells(notas, resumo):
+    return [
+        _safe_value(notas.get("ACS1")),
+        _safe_value(notas.get("ACS2")),
+        _safe_value(notas.get("ACS3")),
+        _safe_value(notas.get("MAP")),
+        _safe_value(notas.get("ACP")),
+        _safe_value(resumo.get("macs")),
+        _safe_value(resumo.get("mt")),
+        _safe_value(resumo.get("com")),
     ]
-    ws.append(header)
 
-    for row in data["rows"]:
-        n1 = row["notas"]["1"]
-        n2 = row["notas"]["2"]
-        n3 = row["notas"]["3"]
-        r1 = row["resumo"]["1"]
-        r2 = row["resumo"]["2"]
-        r3 = row["resumo"]["3"]
 
-        ws.append([
+def caderneta_sheets(data):
+    header = ["Numero", "Aluno", "Sexo", "Status", *_trimestre_header(CADERNETA_TRIMESTRE_HEADER), "MFD"]
+    rows = (
+        [
             _safe_value(row.get("numero_turma")),
             row["nome_completo"],
             row.get("sexo", ""),
             row.get("status", ""),
-            _safe_value(n1.get("ACS1")),
-            _safe_value(n1.get("ACS2")),
-            _safe_value(n1.get("ACS3")),
-            _safe_value(n1.get("MAP")),
-            _safe_value(n1.get("ACP")),
-            _safe_value(r1.get("macs")),
-            _safe_value(r1.get("mt")),
-            _safe_value(r1.get("com")),
-            _safe_value(n2.get("ACS1")),
-            _safe_value(n2.get("ACS2")),
-            _safe_value(n2.get("ACS3")),
-            _safe_value(n2.get("MAP")),
-            _safe_value(n2.get("ACP")),
-            _safe_value(r2.get("macs")),
-            _safe_value(r2.get("mt")),
-            _safe_value(r2.get("com")),
-            _safe_value(n3.get("ACS1")),
-            _safe_value(n3.get("ACS2")),
-            _safe_value(n3.get("ACS3")),
-            _safe_value(n3.get("MAP")),
-            _safe_value(n3.get("ACP")),
-            _safe_value(r3.get("macs")),
-            _safe_value(r3.get("mt")),
-            _safe_value(r3.get("com")),
+            *_caderneta_trimestre_cells(row["notas"]["1"], row["resumo"]["1"]),
+            *_caderneta_trimestre_cells(row["notas"]["2"], row["resumo"]["2"]),
+            *_caderneta_trimestre_cells(row["notas"]["3"], row["resumo"]["3"]),
             _safe_value(row.get("mfd")),
-        ])
-
-    return _as_bytes(wb)
-
+        ]
+        for row in data["rows"]
+    )
+    return [("Caderneta", header, rows)]
 
-def lista_alunos_turma_xlsx(data):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Alunos"
 
+def lista_alunos_turma_sheets(data):
     header = ["Numero", "Aluno", "Sexo", "Status"]
-    ws.append(header)
-
-    for aluno in data["alunos"]:
-        ws.append([
+    rows = (
+        [
             _safe_value(aluno.get("numero_turma")),
             aluno["nome"],
             aluno.get("sexo", ""),
             aluno.get("status", ""),
-        ])
-
-    return _as_bytes(wb)
-
+        ]
+        for aluno in data["alunos"]
+    )
+    return [("Alunos", header, rows)]
 
-def aprovados_reprovados_turma_xlsx(data):
-    wb = Workbook()
-    ws_aprovados = wb.active
-    ws_aprovados.title = "Aprovados"
-    ws_reprovados = wb.create_sheet("Reprovados")
-    ws_sem = wb.create_sheet("Sem_Dados")
 
+def aprovados_reprovados_turma_sheets(data):
     header = ["Numero", "Aluno", "Media_Final", "Situacao"]
-    for ws in (ws_aprovados, ws_reprovados, ws_sem):
-        ws.append(header)
 
-    def _append(ws, alunos):
-        for aluno in alunos:
-            ws.append([
+    def _rows(alunos):
+        return (
+            [
                 _safe_value(aluno.get("numero_turma")),
                 aluno["nome"],
                 _safe_value(aluno.get("media_final")),
                 aluno.get("situacao", ""),
-            ])
-
-    _append(ws_aprovados, data["aprovados"])
-    _append(ws_reprovados, data["reprovados"])
-    _append(ws_sem, data["sem_dados"])
+            ]
+            for aluno in alunos
+        )
 
-    return _as_bytes(wb)
+    return [
+        ("Aprovados", header, _rows(data["aprovados"])),
+        ("Reprovados", header, _rows(data["reprovados"])),
+        ("Sem_Dados", header, _rows(data["sem_dados"])),
+    ]
@@ -17,7 +17,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 
 import os
+import sys
 import dj_database_url
+from celery.schedules import crontab
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -151,6 +153,18 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# A app de relatórios não está em INSTALLED_APPS; as suas tarefas são importadas explicitamente
+CELERY_IMPORTS = ('salamandra_sge.relatorios.tasks',)
+CELERY_BEAT_SCHEDULE = {
+    'limpar-exportacoes-xlsx': {
+        'task': 'salamandra_sge.relatorios.tasks.limpar_exportacoes_xlsx',
+        'schedule': 60 * 30,
+    },
+    'atualizar-estatisticas-distritos': {
+        'task': 'salamandra_sge.instituicoes.tasks.atualizar_estatisticas_distritos',
+        'schedule': crontab(hour=2, minute=0),
+    },
+}
 
 # Redis Cache
 CACHES = {
@@ -163,6 +177,11 @@ CACHES = {
     }
 }
 
+# Os testes correm sem Redis: cache em memória, limpa antes de cada teste pelo runner
+if len(sys.argv) > 1 and sys.argv[1] == 'test':
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+TEST_RUNNER = 'salamandra_sge.test_runner.CacheIsolatedRunner'
+
 # CORS Configuration
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",  # Vite dev server
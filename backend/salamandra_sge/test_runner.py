@@ -0,0 +1,21 @@
+import unittest
+
+from django.core.cache import cache
+from django.test.runner import DiscoverRunner
+
+
+class _CacheLimpaResult:
+    def startTest(self, test):
+        cache.clear()
+        super().startTest(test)
+
+
+class CacheIsolatedRunner(DiscoverRunner):
+    """
+    Runner dos testes: cada teste parte de uma cache vazia, como a base de dados.
+    Os IDs reaproveitados após o rollback não encontram assim entradas de outros testes.
+    """
+
+    def get_resultclass(self):
+        base = super().get_resultclass() or unittest.TextTestResult
+        return type(base.__name__, (_CacheLimpaResult, base), {})
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Container, Card, Table, Button, Form, Row, Col, Badge, Modal, Spinner, Alert } from 'react-bootstrap';
 import { FaPlus, FaEdit, FaTrash, FaExchangeAlt, FaArrowRight, FaUserGraduate, FaSearch, FaTools } from 'react-icons/fa';
 import { academicService, authService } from '../../services/api';
@@ -34,6 +34,11 @@ interface Turma {
 const GestaoAlunos: React.FC = () => {
 
     const [alunos, setAlunos] = useState<Aluno[]>([]);
+    // Cursor da página seguinte da listagem (null quando já não há mais)
+    const [nextAlunos, setNextAlunos] = useState<string | null>(null);
+    const [loadingMore, setLoadingMore] = useState(false);
+    // Descarta respostas de pedidos feitos antes da última mudança de filtro
+    const pedidoAlunos = useRef(0);
     const [classes, setClasses] = useState<Classe[]>([]);
     const [turmas, setTurmas] = useState<Turma[]>([]);
     const [loading, setLoading] = useState(true);
@@ -97,21 +102,45 @@ const GestaoAlunos: React.FC = () => {
     };
 
     const fetchAlunos = async () => {
+        const pedido = ++pedidoAlunos.current;
         try {
-            const params: any = {};
+            const params: any = {
+                fields: 'id,nome_completo,data_nascimento,sexo,bairro,contacto_encarregado,pai,mae,classe_atual,turma_atual,classe_nome,turma_nome,ativo'
+            };
             if (filterClasse) params.classe_id = filterClasse;
             if (filterTurma) params.turma_id = filterTurma;
+            if (searchTerm.trim()) params.search = searchTerm.trim();
 
-            const data = await academicService.getStudents(params);
-            setAlunos(data);
+            const page = await academicService.getStudents(params);
+            if (pedido !== pedidoAlunos.current) return;
+            setAlunos(page.results);
+            setNextAlunos(page.next);
         } catch (err: any) {
             setError('Erro ao carregar alunos');
         }
     };
 
+    const loadMoreAlunos = async () => {
+        if (!nextAlunos) return;
+        const pedido = pedidoAlunos.current;
+        setLoadingMore(true);
+        try {
+            const page = await academicService.getStudents(undefined, nextAlunos);
+            if (pedido !== pedidoAlunos.current) return;
+            setAlunos(prev => [...prev, ...page.results]);
+            setNextAlunos(page.next);
+        } catch (err: any) {
+            setError('Erro ao carregar alunos');
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     useEffect(() => {
-        fetchAlunos();
-    }, [filterClasse, filterTurma]);
+        // A pesquisa corre no servidor; espera uma pausa na escrita antes de pedir
+        const espera = setTimeout(fetchAlunos, searchTerm ? 300 : 0);
+        return () => clearTimeout(espera);
+    }, [filterClasse, filterTurma, searchTerm]);
 
     const handleOpenEnroll = (aluno?: Aluno) => {
         if (aluno) {
@@ -281,11 +310,6 @@ const GestaoAlunos: React.FC = () => {
         }
     };
 
-    const filteredAlunos = alunos.filter(a =>
-        a.nome_completo.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        a.contacto_encarregado.includes(searchTerm)
-    );
-
     if (loading) return (
         <div className="text-center py-5">
             <Spinner animation="border" variant="primary" />
@@ -375,14 +399,14 @@ const GestaoAlunos: React.FC = () => {
                         </tr>
                     </thead>
                     <tbody>
-                        {filteredAlunos.length === 0 ? (
+                        {alunos.length === 0 ? (
                             <tr>
                                 <td colSpan={5} className="text-center py-4 text-muted">
                                     Nenhum aluno encontrado.
                                 </td>
                             </tr>
                         ) : (
-                            filteredAlunos.map(aluno => (
+                            alunos.map(aluno => (
                                 <tr key={aluno.id}>
                                     <td>
                                         <div className="fw-bold">{aluno.nome_completo}</div>
@@ -422,6 +446,13 @@ const GestaoAlunos: React.FC = () => {
                         )}
                     </tbody>
                 </Table>
+                {nextAlunos && (
+                    <Card.Footer className="bg-white text-center">
+                        <Button variant="outline-primary" size="sm" onClick={loadMoreAlunos} disabled={loadingMore}>
+                            {loadingMore ? <Spinner animation="border" size="sm" /> : 'Carregar mais'}
+                        </Button>
+                    </Card.Footer>
+                )}
             </Card>
 
             {/* Modal: Matrícula / Edição */}
@@ -158,8 +158,8 @@ const GestaoTurmas: React.FC = () => {
         setShowStudentsModal(true);
         setLoadingStudents(true);
         try {
-            const data = await academicService.getStudents({ turma_id: turma.id });
-            setStudentsList(Array.isArray(data) ? data : data.results || []);
+            const data = await academicService.getAllStudents({ turma_id: turma.id, fields: 'id,nome_completo,sexo' });
+            setStudentsList(data);
         } catch (err) {
             console.error("Failed to load students", err);
             setStudentsList([]);
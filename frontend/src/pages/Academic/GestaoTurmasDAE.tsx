@@ -69,7 +69,7 @@ const GestaoTurmasDAE: React.FC = () => {
         setLoadingDetails(true);
         try {
             const [alunos, disciplinas] = await Promise.all([
-                academicService.getStudents({ turma_id: turma.id }),
+                academicService.getAllStudents({ turma_id: turma.id, fields: 'id,nome_completo,sexo,encarregado_educacao,contacto_encarregado' }),
                 academicService.getTurmaDisciplinas(turma.id)
             ]);
             setTurmaAlunos(alunos);
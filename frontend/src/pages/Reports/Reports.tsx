@@ -205,8 +205,7 @@ const Reports: React.FC = () => {
             }
             setLoadingStudents(true);
             try {
-                const studentsRes = await academicService.getStudents({ turma_id: declaracaoTurma });
-                const list = Array.isArray(studentsRes) ? studentsRes : studentsRes.results || [];
+                const list = await academicService.getAllStudents({ turma_id: declaracaoTurma });
                 setStudents(list);
             } catch (error) {
                 console.error('Error fetching students for declaration:', error);
@@ -227,8 +226,7 @@ const Reports: React.FC = () => {
             }
             setLoadingSituacaoStudents(true);
             try {
-                const studentsRes = await academicService.getStudents({ turma_id: situacaoTurma });
-                const list = Array.isArray(studentsRes) ? studentsRes : studentsRes.results || [];
+                const list = await academicService.getAllStudents({ turma_id: situacaoTurma });
                 setSituacaoStudents(list);
             } catch (error) {
                 console.error('Error fetching students for situacao:', error);
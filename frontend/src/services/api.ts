@@ -183,10 +183,27 @@ export const administrativeService = {
     }
 };
 
+// A listagem de alunos é paginada por cursor: devolve uma página ({ results, next }).
+// Para a página seguinte passe o `next` recebido. Sem `fields`, o backend
+// devolve apenas id, nome_completo, numero_turma e turma.
+const fetchStudentsPage = async (params?: any, next?: string | null) => {
+    const response = next
+        ? await api.get(next)
+        : await api.get('/academico/alunos/', { params });
+    return { results: response.data.results as any[], next: response.data.next as string | null };
+};
+
 export const academicService = {
-    getStudents: async (params?: any) => {
-        const response = await api.get('/academico/alunos/', { params });
-        return response.data;
+    getStudents: fetchStudentsPage,
+    // Segue todos os cursores; usar só em listas limitadas a uma turma.
+    getAllStudents: async (params?: any) => {
+        let page = await fetchStudentsPage(params);
+        const alunos = [...page.results];
+        while (page.next) {
+            page = await fetchStudentsPage(undefined, page.next);
+            alunos.push(...page.results);
+        }
+        return alunos;
     },
     enrollStudent: async (studentData: any) => {
         const response = await api.post('/academico/alunos/', studentData);